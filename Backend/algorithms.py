@@ -1,6 +1,17 @@
+import heapq
 import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from .metrics import timed
+except ImportError:
+    from metrics import timed
 
 # Linear Search Algorithm
+@timed(rows_arg=1)
 def linear_search_jobs(query, jobs):
     """
     Perform linear search to find jobs matching the query
@@ -18,83 +29,305 @@ def linear_search_jobs(query, jobs):
     return matching_jobs
 
 # Sorting Algorithm
+@timed(rows_arg=0)
 def sort_jobs(jobs, key='pay', order='desc'):
     """
     Sort jobs by specified key (pay, location, etc.)
     Time Complexity: O(n log n)
     """
-    def get_sort_value(job):
-        if key == 'pay':
-            return float(job.get('pay', 0))
-        elif key == 'location':
-            return job.get('location', '')
-        else:
-            return job.get(key, '')
-    
-    sorted_jobs = sorted(jobs, key=get_sort_value, reverse=(order == 'desc'))
+    sorted_jobs = sorted(jobs, key=lambda job: job_sort_value(job, key), reverse=(order == 'desc'))
     return sorted_jobs
 
+def parse_pay(value):
+    """Pay as a float; missing or malformed values (including nan/inf) count as 0"""
+    try:
+        pay = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return pay if math.isfinite(pay) else 0.0
+
+def job_sort_value(job, key='pay'):
+    """Value a job is ordered by when sorting on ``key``"""
+    if key == 'pay':
+        return parse_pay(job.get('pay'))
+    elif key == 'location':
+        return job.get('location', '')
+    else:
+        return job.get(key, '')
+
 # Dijkstra's Algorithm for nearest jobs
-def dijkstra_nearest_jobs(student_location, jobs):
+@timed(rows_arg=1)
+def dijkstra_nearest_jobs(student_location, jobs, k=None):
     """
     Find nearest jobs using Dijkstra's algorithm (simplified for string locations)
-    Time Complexity: O(V + E log V) - simplified implementation
-    """
-    # Create a simple graph where locations are nodes
-    # In a real implementation, you'd have actual coordinates and distances
-    locations = set([student_location] + [job['location'] for job in jobs])
-    
-    # Simplified distance calculation (in real app, use actual coordinates)
-    def calculate_distance(loc1, loc2):
-        # Simple string similarity as distance proxy
-        # In production, use actual geolocation distances
-        loc1_clean = loc1.lower().replace(' ', '')
-        loc2_clean = loc2.lower().replace(' ', '')
-        
-        if loc1_clean == loc2_clean:
+    Distances are computed once per distinct location (and cached across
+    calls); with k set only the k nearest jobs are kept, in a bounded heap.
+    Time Complexity: O(n + L * d) for L distinct locations, plus O(n log k) selection
+    """
+    # Group jobs by normalized location: job locations come from a small set,
+    # so this is where the distance work collapses
+    groups = {}
+    for index, job in enumerate(jobs):
+        groups.setdefault(normalize_location(job['location']), []).append(index)
+    
+    origin = normalize_location(student_location)
+    
+    if k is None:
+        # Full ranking (stable for equal distances)
+        job_distances = []
+        for location, indexes in groups.items():
+            distance = location_distance(origin, location)
+            job_distances.extend((distance, index) for index in indexes)
+        job_distances.sort()
+        return [jobs[index] for _, index in job_distances]
+    
+    if k <= 0:
+        return []
+    
+    # Max-heap (negated keys) of the k best (distance, index) pairs seen so far;
+    # once full, its worst distance is the early-exit bound for the next location
+    heap = []
+    for location, indexes in groups.items():
+        bound = -heap[0][0] if len(heap) == k else None
+        distance = location_distance(origin, location, bound)
+        if bound is not None and distance > bound:
+            continue
+        for index in indexes:
+            entry = (-distance, -index)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                # Indexes ascend within a group, so the rest tie-break worse too
+                break
+    
+    return [jobs[-neg_index] for _, neg_index in sorted(heap, reverse=True)]
+
+def normalize_location(location):
+    """Location key used for string distances: lowercase, spaces removed"""
+    return (location or '').lower().replace(' ', '')
+
+class LocationDistanceCache:
+    """
+    Bounded LRU cache of Levenshtein distances between normalized locations
+    Entries computed with an early-exit bound are stored as lower bounds and
+    only reused when they still answer the question being asked.
+    """
+    
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def distance(self, loc1, loc2, max_distance=None):
+        if loc1 == loc2:
             return 0
+        key = (loc1, loc2) if loc1 < loc2 else (loc2, loc1)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                value, exact = cached
+                if exact or (max_distance is not None and value > max_distance):
+                    self._entries.move_to_end(key)
+                    return value
         
-        # Calculate Levenshtein distance as proxy
-        return levenshtein_distance(loc1_clean, loc2_clean)
-    
-    # Calculate distances from student location to all job locations
-    job_distances = []
-    for job in jobs:
-        distance = calculate_distance(student_location, job['location'])
-        job_distances.append((distance, job))
+        value = levenshtein_distance(loc1, loc2, max_distance)
+        exact = max_distance is None or value <= max_distance
+        with self._lock:
+            self._entries[key] = (value, exact)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
     
-    # Sort by distance (ascending)
-    job_distances.sort(key=lambda x: x[0])
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
     
-    return [job for _, job in job_distances]
+    def __len__(self):
+        return len(self._entries)
+
+# Shared across requests; location vocabularies are small so this stays hot
+location_distance_cache = LocationDistanceCache()
+
+def location_distance(loc1, loc2, max_distance=None):
+    """Cached distance between two normalized locations"""
+    return location_distance_cache.distance(loc1, loc2, max_distance)
 
-def levenshtein_distance(s1, s2):
+def levenshtein_distance(s1, s2, max_distance=None):
     """
     Calculate Levenshtein distance between two strings
     Used as a proxy for location distance in this simplified implementation
+    With max_distance set, only the diagonal band of width 2 * max_distance + 1
+    is computed and max_distance + 1 is returned as soon as the distance is
+    known to exceed it.
     """
     if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
+        s1, s2 = s2, s1
+    
+    if max_distance is not None and len(s1) - len(s2) > max_distance:
+        return max_distance + 1
     
     if len(s2) == 0:
         return len(s1)
     
-    previous_row = range(len(s2) + 1)
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
+    if max_distance is None:
+        previous_row = range(len(s2) + 1)
+        for i, c1 in enumerate(s1):
+            current_row = [i + 1]
+            for j, c2 in enumerate(s2):
+                insertions = previous_row[j + 1] + 1
+                deletions = current_row[j] + 1
+                substitutions = previous_row[j] + (c1 != c2)
+                current_row.append(min(insertions, deletions, substitutions))
+            previous_row = current_row
+        
+        return previous_row[-1]
+    
+    # Banded variant: cells outside |i - j| <= max_distance can't be on a path
+    # within the bound, so they are treated as "too far"
+    too_far = max_distance + 1
+    previous_row = [j if j <= max_distance else too_far for j in range(len(s2) + 1)]
+    for i, c1 in enumerate(s1, start=1):
+        low = max(1, i - max_distance)
+        high = min(len(s2), i + max_distance)
+        current_row = [too_far] * (len(s2) + 1)
+        current_row[0] = i if i <= max_distance else too_far
+        row_min = current_row[0]
+        for j in range(low, high + 1):
+            value = min(
+                previous_row[j] + 1,
+                current_row[j - 1] + 1,
+                previous_row[j - 1] + (c1 != s2[j - 1])
+            )
+            current_row[j] = min(value, too_far)
+            row_min = min(row_min, current_row[j])
+        if row_min > max_distance:
+            return too_far
         previous_row = current_row
     
-    return previous_row[-1]
+    return min(previous_row[-1], too_far)
 
 # Hungarian Algorithm for fair job assignment
+SAME_LOCATION_COST = 1.0
+OTHER_LOCATION_COST = 10.0
+
+def assignment_cost_matrix(students, jobs):
+    """
+    Build the students x jobs cost matrix with NumPy
+    Cost = location mismatch penalty + (5 - rating) * 2
+    Time Complexity: O(n * m) vectorized
+    """
+    student_codes, job_codes, rating_cost = _assignment_cost_terms(students, jobs)
+    location_cost = np.where(student_codes[:, None] == job_codes[None, :], SAME_LOCATION_COST, OTHER_LOCATION_COST)
+    return location_cost + rating_cost[:, None]
+
+def _assignment_cost_terms(students, jobs):
+    """(student location codes, job location codes, per-student rating cost) of the assignment cost"""
+    # Map locations to integer codes so matching is a single broadcast comparison
+    _, codes = np.unique(
+        [s['location'] or '' for s in students] + [j['location'] or '' for j in jobs],
+        return_inverse=True
+    )
+    ratings = np.array([_to_float(s.get('rating')) for s in students], dtype=np.float64)
+    return codes[:len(students)], codes[len(students):], (5 - ratings) * 2
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def linear_sum_assignment(cost_matrix):
+    """
+    Minimum-cost assignment for a rectangular cost matrix
+    (shortest augmenting path / Jonker-Volgenant form of the Hungarian algorithm).
+    Returns (row_indices, col_indices) of the matched pairs, sorted by row;
+    min(n, m) pairs are always matched.
+    Time Complexity: O(n² m) with the inner column scans vectorized
+    """
+    cost = np.asarray(cost_matrix, dtype=np.float64)
+    if cost.ndim != 2 or cost.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    
+    # The algorithm needs rows <= columns; solve the transpose otherwise
+    if cost.shape[0] > cost.shape[1]:
+        cols, rows = linear_sum_assignment(cost.T)
+        order = np.argsort(rows)
+        return rows[order], cols[order]
+    
+    n, m = cost.shape
+    # Row/column potentials and column -> row matching, 1-based with 0 as sentinel
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+    
+    # Row reduction plus a greedy matching on zero reduced-cost edges; with many
+    # tied costs this settles most rows before any augmenting path is needed
+    u[1:] = cost.min(axis=1)
+    unmatched_rows = []
+    free_cols = np.ones(m, dtype=bool)
+    for i in range(n):
+        tight = np.flatnonzero(free_cols & (cost[i] == u[i + 1]))
+        if tight.size:
+            match[tight[0] + 1] = i + 1
+            free_cols[tight[0]] = False
+        else:
+            unmatched_rows.append(i + 1)
+    
+    for i in unmatched_rows:
+        match[0] = i
+        j0 = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        
+        # Dijkstra-like search for the cheapest augmenting path from row i
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free[1:] & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+            
+            candidates = np.where(free, min_reduced, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            if match[j1]:
+                # Among equally cheap columns prefer an unmatched one: it ends the
+                # search now instead of walking through a long run of ties
+                unmatched_ties = np.flatnonzero((candidates == delta) & (match == 0))
+                if unmatched_ties.size:
+                    j1 = int(unmatched_ties[0])
+            
+            u[match[used]] += delta
+            v[used] -= delta
+            min_reduced[free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        
+        # Flip the matching along the augmenting path
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    
+    cols = np.nonzero(match[1:])[0]
+    rows = match[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+@timed(rows_arg=1)
 def hungarian_job_assignment(students, jobs):
     """
     Implement Hungarian algorithm for optimal job-student assignment
+    Minimizes the total cost over all students x jobs; with unequal counts
+    min(n, m) pairs are assigned.
     Time Complexity: O(n³)
     """
     n = len(students)
@@ -103,38 +336,288 @@ def hungarian_job_assignment(students, jobs):
     if n == 0 or m == 0:
         return []
     
-    # Create cost matrix (students x jobs)
-    cost_matrix = []
-    for student in students:
-        row = []
-        for job in jobs:
-            # Calculate cost based on location match and student rating
-            location_cost = 1 if student['location'] == job['location'] else 10
-            rating_cost = (5 - float(student.get('rating', 0))) * 2
-            total_cost = location_cost + rating_cost
-            row.append(total_cost)
-        cost_matrix.append(row)
-    
-    # Simplified assignment (full Hungarian implementation would be more complex)
-    assignments = []
-    assigned_jobs = set()
-    
-    for i, student in enumerate(students):
-        if i < m:  # Only assign if there are jobs available
-            best_job_idx = -1
-            best_cost = float('inf')
+    cost_matrix = assignment_cost_matrix(students, jobs)
+    rows, cols = linear_sum_assignment(cost_matrix)
+    
+    return [
+        {
+            'student_id': students[i]['id'],
+            'job_id': jobs[j]['id'],
+            'cost': float(cost_matrix[i, j])
+        }
+        for i, j in zip(rows.tolist(), cols.tolist())
+    ]
+
+# Min-cost max-flow for assignments with several jobs per student / students per job
+# Costs are rounded to integer hundredths: zero reduced costs then compare exactly, and
+# the few distinct path costs keep the number of shortest-path rounds small
+FLOW_COST_SCALE = 100
+
+class MinCostFlow:
+    """
+    Min-cost max-flow on a sparse directed graph with integer capacities and costs
+    
+    Primal-dual successive shortest paths: Dijkstra with node potentials
+    finds the current shortest distance to the sink, then a Dinic blocking
+    flow pushes as much as possible along every path of that length before
+    the next Dijkstra. Edge e and its residual twin are stored at e and e ^ 1.
+    Time Complexity: O(P * (E log V + V E)) for P distinct path lengths, which
+    is small when the costs take few distinct values
+    """
+    
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.graph = [[] for _ in range(nodes)]
+        self.to = []
+        self.cap = []
+        self.cost = []
+    
+    def add_edge(self, u, v, capacity, cost):
+        """Add an edge u -> v and return its index (costs must not be negative)"""
+        edge = len(self.to)
+        self.graph[u].append(edge)
+        self.to.append(v)
+        self.cap.append(capacity)
+        self.cost.append(cost)
+        self.graph[v].append(edge + 1)
+        self.to.append(u)
+        self.cap.append(0)
+        self.cost.append(-cost)
+        return edge
+    
+    def flow(self, edge):
+        """Flow currently on an edge returned by add_edge"""
+        return self.cap[edge ^ 1]
+    
+    def solve(self, source, sink):
+        """Push the maximum flow from source to sink at minimum cost; returns (flow, cost)"""
+        potential = [0] * self.nodes
+        total_flow = total_cost = 0
+        while True:
+            distance = self._shortest_paths(source, sink, potential)
+            if distance[sink] is None:
+                return total_flow, total_cost
+            # Keeps every reduced cost non-negative; nodes beyond the sink are capped at its distance
+            for node, d in enumerate(distance):
+                potential[node] += distance[sink] if d is None or d > distance[sink] else d
+            pushed = self._blocking_flow(source, sink, potential)
+            total_flow += pushed
+            total_cost += pushed * (potential[sink] - potential[source])
+    
+    def _shortest_paths(self, source, sink, potential):
+        graph, to, cap, cost = self.graph, self.to, self.cap, self.cost
+        distance = [None] * self.nodes
+        distance[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > distance[u]:
+                continue
+            if u == sink:
+                # Whatever is still queued is no closer than the sink, which is all solve() needs
+                break
+            offset = d + potential[u]
+            for edge in graph[u]:
+                if cap[edge] > 0:
+                    v = to[edge]
+                    nd = offset + cost[edge] - potential[v]
+                    if distance[v] is None or nd < distance[v]:
+                        distance[v] = nd
+                        heapq.heappush(heap, (nd, v))
+        return distance
+    
+    def _blocking_flow(self, source, sink, potential):
+        to, cap = self.to, self.cap
+        # Edges on shortest paths have zero reduced cost; potentials are fixed for the
+        # round, so that set only shrinks (as edges saturate) or gains twins of those edges
+        zero = [[edge for edge in edges if self.cost[edge] + potential[u] - potential[to[edge]] == 0]
+                for u, edges in enumerate(self.graph)]
+        total = 0
+        while True:
+            # BFS levels over zero-cost residual edges, so augmenting paths can't loop
+            level = [-1] * self.nodes
+            level[source] = 0
+            queue = [source]
+            for u in queue:
+                for edge in zero[u]:
+                    if cap[edge] > 0 and level[to[edge]] < 0:
+                        level[to[edge]] = level[u] + 1
+                        queue.append(to[edge])
+            if level[sink] < 0:
+                return total
             
+            # Iterative DFS with current-arc pointers
+            arc = [0] * self.nodes
+            path = []
+            u = source
+            while True:
+                if u == sink:
+                    pushed = min(cap[edge] for edge in path)
+                    for edge in path:
+                        cap[edge] -= pushed
+                        cap[edge ^ 1] += pushed
+                    total += pushed
+                    path = []
+                    u = source
+                    continue
+                edges = zero[u]
+                while arc[u] < len(edges):
+                    edge = edges[arc[u]]
+                    if cap[edge] > 0 and level[to[edge]] == level[u] + 1:
+                        break
+                    arc[u] += 1
+                else:
+                    if u == source:
+                        break
+                    # Dead end: retreat and skip the edge that led here
+                    level[u] = -1
+                    u = to[path.pop() ^ 1]
+                    arc[u] += 1
+                    continue
+                path.append(edge)
+                u = to[edge]
+
+def _amounts(value, rows):
+    """Per-row amounts from one default int or a {row id: int} mapping (default 1)"""
+    if isinstance(value, dict):
+        return [max(int(value.get(row['id'], 1)), 0) for row in rows]
+    return [max(int(value), 0)] * len(rows)
+
+@timed(rows_arg=1)
+def flow_job_assignment(students, jobs, capacity=1, headcount=1):
+    """
+    Capacity-aware job assignment as min-cost max-flow
+    Each student takes up to ``capacity`` jobs and each job takes up to
+    ``headcount`` students (an int for all, or a {id: int} mapping); as many
+    pairs as possible are assigned, at minimum total cost, with the costs of
+    assignment_cost_matrix. A student takes a job at most once.
+    
+    A student's cost is the same for every job at one location and for
+    every job elsewhere, so instead of n * m student -> job edges the graph
+    routes each student through a hub per location plus one "elsewhere"
+    hub, which link to the jobs:
+    
+        source -> student -> location hub (1 + rating cost)  -> job at that location -> sink
+                          -> elsewhere hub (10 + rating cost) -> any job
+    
+    The hub flows are then split into student -> job pairs, giving each
+    student the jobs with the most places left. Hubs don't know that a
+    student can't take one job twice, so when a student's units can't be
+    split over distinct jobs that student gets direct edges to every job
+    instead and the flow is solved again (with capacity 1 this never happens).
+    Time Complexity: O(P * (n + m) log(n + m)) with the graph's O(n + m)
+    edges, P being the number of distinct augmenting path costs
+    """
+    n = len(students)
+    m = len(jobs)
+    if n == 0 or m == 0:
+        return []
+    
+    capacities = _amounts(capacity, students)
+    headcounts = _amounts(headcount, jobs)
+    student_codes, job_codes, rating_cost = _assignment_cost_terms(students, jobs)
+    student_codes, job_codes = student_codes.tolist(), job_codes.tolist()
+    
+    def cost(i, j):
+        location_cost = SAME_LOCATION_COST if student_codes[i] == job_codes[j] else OTHER_LOCATION_COST
+        return float(location_cost + rating_cost[i])
+    
+    direct = set()
+    while True:
+        pairs, unsplit = _solve_assignment_flow(capacities, headcounts, student_codes, job_codes,
+                                                rating_cost, direct)
+        if not unsplit:
+            break
+        direct |= unsplit
+    
+    return [
+        {
+            'student_id': students[i]['id'],
+            'job_id': jobs[j]['id'],
+            'cost': cost(i, j)
+        }
+        for i, j in sorted(pairs)
+    ]
+
+def _solve_assignment_flow(capacities, headcounts, student_codes, job_codes, rating_cost, direct):
+    """
+    One min-cost flow for flow_job_assignment; students in ``direct`` get an
+    edge to every job instead of the hubs. Returns (pairs, students whose
+    hub flow could not be split over distinct jobs).
+    """
+    n, m = len(capacities), len(headcounts)
+    locations = sorted(set(student_codes) | set(job_codes))
+    
+    # Nodes: source, students, one hub per location, the elsewhere hub, jobs, sink
+    source = 0
+    hub = {code: 1 + n + index for index, code in enumerate(locations)}
+    elsewhere = 1 + n + len(locations)
+    first_job = elsewhere + 1
+    sink = first_job + m
+    graph = MinCostFlow(sink + 1)
+    # Costs are shifted to be non-negative; every unit of flow pays exactly one
+    # location + rating cost, so the shift doesn't change the optimum
+    shift = max(0.0, -float(rating_cost.min()) - SAME_LOCATION_COST)
+    
+    def scaled(location_cost, i):
+        return int(round((location_cost + rating_cost[i] + shift) * FLOW_COST_SCALE))
+    
+    hub_edges = []       # (student, edge, location code or None for elsewhere)
+    direct_edges = []    # (student, job, edge)
+    for i in range(n):
+        if not capacities[i]:
+            continue
+        graph.add_edge(source, 1 + i, capacities[i], 0)
+        if i in direct:
             for j in range(m):
-                if j not in assigned_jobs and cost_matrix[i][j] < best_cost:
-                    best_cost = cost_matrix[i][j]
-                    best_job_idx = j
-            
-            if best_job_idx != -1:
-                assignments.append({
-                    'student_id': student['id'],
-                    'job_id': jobs[best_job_idx]['id'],
-                    'cost': best_cost
-                })
-                assigned_jobs.add(best_job_idx)
-    
-    return assignments
\ No newline at end of file
+                location_cost = SAME_LOCATION_COST if student_codes[i] == job_codes[j] else OTHER_LOCATION_COST
+                direct_edges.append((i, j, graph.add_edge(1 + i, first_job + j, 1, scaled(location_cost, i))))
+        else:
+            hub_edges.append((i, graph.add_edge(1 + i, hub[student_codes[i]], capacities[i],
+                                                scaled(SAME_LOCATION_COST, i)), student_codes[i]))
+            hub_edges.append((i, graph.add_edge(1 + i, elsewhere, capacities[i],
+                                                scaled(OTHER_LOCATION_COST, i)), None))
+    job_edges = []       # (job, edge, location code or None for elsewhere)
+    for j in range(m):
+        if headcounts[j]:
+            job_edges.append((j, graph.add_edge(hub[job_codes[j]], first_job + j, headcounts[j], 0), job_codes[j]))
+            job_edges.append((j, graph.add_edge(elsewhere, first_job + j, headcounts[j], 0), None))
+            graph.add_edge(first_job + j, sink, headcounts[j], 0)
+    
+    graph.solve(source, sink)
+    
+    pairs = [(i, j) for i, j, edge in direct_edges if graph.flow(edge)]
+    taken = {}           # student -> jobs it already has
+    for i, j in pairs:
+        taken.setdefault(i, set()).add(j)
+    owed = {}            # hub -> [(units, student)]
+    places = {}          # hub -> {job: units}
+    for i, edge, code in hub_edges:
+        if graph.flow(edge):
+            owed.setdefault(code, []).append((graph.flow(edge), i))
+    for j, edge, code in job_edges:
+        if graph.flow(edge):
+            places.setdefault(code, {})[j] = graph.flow(edge)
+    
+    # Location hubs first, then elsewhere (whose jobs may include ones a student already has);
+    # within a hub the students owed the most go first, each to the jobs with the most places left
+    unsplit = set()
+    for code in sorted(owed, key=lambda code: code is None):
+        heap = [(-units, j) for j, units in places.get(code, {}).items()]
+        heapq.heapify(heap)
+        for units, i in sorted(owed[code], key=lambda entry: (-entry[0], entry[1])):
+            mine = taken.setdefault(i, set())
+            chosen, skipped = [], []
+            while heap and len(chosen) < units:
+                entry = heapq.heappop(heap)
+                (skipped if entry[1] in mine else chosen).append(entry)
+            if len(chosen) < units:
+                unsplit.add(i)
+            for left, j in chosen:
+                mine.add(j)
+                pairs.append((i, j))
+                if left < -1:
+                    skipped.append((left + 1, j))
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+    return pairs, unsplit
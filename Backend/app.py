@@ -1,7 +1,9 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import csv
 import os
+import time
 
 # Support running as a module (python -m Backend.app) or as a script (python app.py)
 try:
@@ -9,29 +11,118 @@ try:
     from .algorithms import (
         linear_search_jobs,
         sort_jobs,
+        job_sort_value,
         dijkstra_nearest_jobs,
-        hungarian_job_assignment
+        hungarian_job_assignment,
+        flow_job_assignment
     )
+    from .storage import JOB_FIELDS, STUDENT_FIELDS, PROVIDER_FIELDS, ASSIGNMENT_FIELDS, open_stores
+    from .store import DuplicateKeyError
+    from .search import SearchIndex
+    from .sorted_view import SortedView
+    from .suggestions import SuggestionCache
+    from .geo import Gazetteer, SpatialJobIndex, normalize_location
+    from .records import json_default
+    from .http_cache import conditional, gzip_response
+    from .bulk import BULK_MAX_ROWS, UploadError, iter_upload, job_from_upload, text_field, upload_format
+    from .pagination import decode_cursor, encode_cursor, row_id, select_page, stream_json_array
+    from .metrics import CONTENT_TYPE, REGISTRY, Callback, Histogram
+    from .profiler import SamplingProfiler
+    from .ranking import RankingEngine
+    from .facets import FACETS, FacetIndex
+    from .locations import LocationIndex
+    from .users import UserDirectory, normalize_email
+    from .writer import default_writer
+    from .server import worker_health
+    from .changes import ChangeFeed, StreamHub, event_stream
 except Exception:
     # When running directly from the Backend directory
     from algorithms import (
         linear_search_jobs,
         sort_jobs,
+        job_sort_value,
         dijkstra_nearest_jobs,
-        hungarian_job_assignment
+        hungarian_job_assignment,
+        flow_job_assignment
     )
+    from storage import JOB_FIELDS, STUDENT_FIELDS, PROVIDER_FIELDS, ASSIGNMENT_FIELDS, open_stores
+    from store import DuplicateKeyError
+    from search import SearchIndex
+    from sorted_view import SortedView
+    from suggestions import SuggestionCache
+    from geo import Gazetteer, SpatialJobIndex, normalize_location
+    from records import json_default
+    from http_cache import conditional, gzip_response
+    from bulk import BULK_MAX_ROWS, UploadError, iter_upload, job_from_upload, text_field, upload_format
+    from pagination import decode_cursor, encode_cursor, row_id, select_page, stream_json_array
+    from metrics import CONTENT_TYPE, REGISTRY, Callback, Histogram
+    from profiler import SamplingProfiler
+    from ranking import RankingEngine
+    from facets import FACETS, FacetIndex
+    from locations import LocationIndex
+    from users import UserDirectory, normalize_email
+    from writer import default_writer
+    from server import worker_health
+    from changes import ChangeFeed, StreamHub, event_stream
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that also serializes the stores' compact row records"""
+
+    @staticmethod
+    def default(o):
+        try:
+            return json_default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app, origins=['http://localhost:3000', 'http://127.0.0.1:3000', 'https://your-netlify-site.netlify.app'], 
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization'])
+     allow_headers=['Content-Type', 'Authorization'],
+     expose_headers=['X-Next-Cursor', 'ETag'])
+
+REQUEST_SECONDS = Histogram('workmate_http_request_duration_seconds', 'Time to build each response',
+                            ['route', 'method', 'status'])
+# Per-request sampling profiles (?profile=1); off unless explicitly enabled
+PROFILING = os.environ.get('WORKMATE_PROFILING', '').lower() in ('1', 'true', 'yes')
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILING and request.args.get('profile', '').lower() in ('1', 'true', 'yes'):
+        g.profiler = SamplingProfiler().start()
+
+def record_request(response):
+    """after_request hook: observe latency per route template, method and status"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        # The profile replaces the body: folded stacks for flamegraph.pl / speedscope
+        profiler.stop()
+        response = Response(profiler.collapsed(), mimetype='text/plain')
+        response.headers['X-Profile-Samples'] = str(sum(profiler.samples.values()))
+        response.headers['X-Profile-Seconds'] = '%.6f' % profiler.elapsed
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Templates, not paths, so ids don't blow up the number of series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+# After-request hooks run in reverse order: timing is registered first so it includes gzip
+app.before_request(start_request_timer)
+app.after_request(record_request)
+# Compress large JSON bodies (see http_cache.GZIP_MIN_BYTES)
+app.after_request(gzip_response)
 
 # Data file paths (always resolve relative to this file's directory)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+DATA_DIR = os.environ.get('WORKMATE_DATA_DIR', os.path.join(BASE_DIR, 'data'))
 JOBS_FILE = os.path.join(DATA_DIR, 'jobs.csv')
 STUDENTS_FILE = os.path.join(DATA_DIR, 'students.csv')
 PROVIDERS_FILE = os.path.join(DATA_DIR, 'providers.csv')
+ASSIGNMENTS_FILE = os.path.join(DATA_DIR, 'assignments.csv')
+# Offline place-name -> coordinates table (reference data, ships with the code)
+GAZETTEER_FILE = os.environ.get('WORKMATE_GAZETTEER', os.path.join(BASE_DIR, 'data', 'gazetteer.csv'))
 
 # Initialize CSV files with headers if they don't exist
 def init_csv_files():
@@ -40,19 +131,103 @@ def init_csv_files():
     if not os.path.exists(JOBS_FILE):
         with open(JOBS_FILE, 'w', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id'])
+            writer.writerow(JOB_FIELDS)
     
     if not os.path.exists(STUDENTS_FILE):
         with open(STUDENTS_FILE, 'w', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(['id', 'name', 'email', 'password', 'location', 'bio', 'rating', 'jobs_completed'])
+            writer.writerow(STUDENT_FIELDS)
     
     if not os.path.exists(PROVIDERS_FILE):
         with open(PROVIDERS_FILE, 'w', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(['id', 'name', 'email', 'password', 'company'])
+            writer.writerow(PROVIDER_FIELDS)
+    
+    if not os.path.exists(ASSIGNMENTS_FILE):
+        with open(ASSIGNMENTS_FILE, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(ASSIGNMENT_FIELDS)
 
 init_csv_files()
+
+# Process-wide table stores (CSV + journal by default, SQLite with WORKMATE_STORAGE=sqlite)
+stores = open_stores(DATA_DIR)
+jobs_store = stores['jobs']
+# Available jobs only (the archive holds the rest): what the listing and suggestion routes read
+hot_jobs_store = jobs_store.hot
+students_store = stores['students']
+providers_store = stores['providers']
+# Students per job filled by /api/assignments/optimal
+assignments_store = stores['assignments']
+
+# Normalized email -> user ids for login and sign-up checks
+user_directory = UserDirectory()
+user_directory.attach('student', students_store)
+user_directory.attach('provider', providers_store)
+
+# Full-text index over available jobs, kept in step with hot_jobs_store mutations
+job_search = SearchIndex(where=lambda job: job['status'] == 'available')
+job_search.attach(hot_jobs_store)
+
+# Available jobs kept pre-sorted for /api/jobs/sort (pay is parsed once per change)
+job_sort_views = {
+    field: SortedView(lambda job, field=field: job_sort_value(job, field),
+                      where=lambda job: job['status'] == 'available')
+    for field in ('pay', 'location')
+}
+for view in job_sort_views.values():
+    view.attach(hot_jobs_store)
+
+# Spatial index over available jobs for nearest-job suggestions
+gazetteer = Gazetteer.from_csv(GAZETTEER_FILE)
+job_locator = SpatialJobIndex(gazetteer, where=lambda job: job['status'] == 'available')
+job_locator.attach(hot_jobs_store)
+
+# Available jobs as NumPy feature arrays for weighted multi-criteria ranking
+job_ranker = RankingEngine(gazetteer, where=lambda job: job['status'] == 'available')
+job_ranker.attach(hot_jobs_store)
+
+# Bitmaps per location, provider, status and pay over every job for /api/jobs/filter (archived
+# jobs come from the archive's in-memory values, so the archive file isn't read to build them)
+job_facets = FacetIndex()
+job_facets.attach(jobs_store)
+
+# Distinct job locations in a BK-tree for typo-tolerant location filters and "did you mean"
+job_locations = LocationIndex()
+job_locations.attach(jobs_store)
+
+# Per-student top-N suggestion lists, patched on job changes
+suggestion_cache = SuggestionCache(gazetteer, job_locator, hot_jobs_store,
+                                   where=lambda job: job['status'] == 'available')
+suggestion_cache.attach(students_store)
+
+# Job change events for /api/jobs/changes, numbered across worker processes
+change_feed = ChangeFeed(os.path.join(DATA_DIR, 'job_changes.jsonl'))
+change_hub = StreamHub(change_feed)
+
+def publish_changes(events):
+    """Announce committed job changes ((type, data) pairs) to change-stream subscribers"""
+    try:
+        change_feed.publish(events)
+    except OSError as error:
+        # The write itself succeeded; subscribers catch up with a reset event later
+        app.logger.warning('Could not publish job changes: %s', error)
+        return
+    change_hub.wake()
+
+# Scrape-time metrics: table sizes, write batching, suggestion cache effectiveness
+Callback('workmate_table_rows', 'Rows per table', ['table'],
+         lambda: {(name,): store.count() for name, store in stores.items()})
+Callback('workmate_change_subscribers', 'Change streams served by the stream thread', [],
+         lambda: {(): len(change_hub)})
+Callback('workmate_writer_batches_total', 'Write batches committed by the writer thread', [],
+         lambda: {(): default_writer.batches}, type_name='counter')
+Callback('workmate_writer_operations_total', 'Mutations committed by the writer thread', [],
+         lambda: {(): default_writer.operations}, type_name='counter')
+Callback('workmate_suggestion_cache_requests_total', 'Suggestion requests served from / missing the cache',
+         ['result'], lambda: {('hit',): suggestion_cache.hits, ('miss',): suggestion_cache.misses},
+         type_name='counter')
+
 # Root and health routes for quick checks
 @app.route('/', methods=['GET'])
 def root():
@@ -60,46 +235,124 @@ def root():
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy'}), 200
-
-
-# Helper functions for CSV operations
-def read_csv(file_path):
-    with open(file_path, 'r') as f:
-        return list(csv.DictReader(f))
-
-def write_csv(file_path, data):
-    with open(file_path, 'w', newline='') as f:
-        if data:
-            # Clean the data to remove None values
-            cleaned_data = []
-            for row in data:
-                cleaned_row = {k: v for k, v in row.items() if v is not None}
-                cleaned_data.append(cleaned_row)
-            
-            writer = csv.DictWriter(f, fieldnames=data[0].keys())
-            writer.writeheader()
-            writer.writerows(cleaned_data)
-
-def append_csv(file_path, row):
-    with open(file_path, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=row.keys())
-        writer.writerow(row)
+    # Ready once every table is loaded, CSV tables from their mapped binary snapshot
+    tables = {name: store.load_state() for name, store in stores.items()}
+    ready = all(state in ('mapped', 'ready') for state in tables.values())
+    body = {'status': 'healthy' if ready else 'starting', 'ready': ready, 'tables': tables}
+    workers = worker_health()
+    if workers:
+        # Served by the pre-fork server: report every worker, not just this one
+        body['workers'] = workers
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def int_arg(name, default=None, minimum=0):
+    """Read an optional non-negative integer query parameter"""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return max(int(value), minimum)
+    except ValueError:
+        return default
+
+def float_arg(name, default=None):
+    """Read an optional float query parameter"""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+def weight_args():
+    """Ranking weights overridden in the query string (w_distance=2&w_pay=0.5 ...)"""
+    return {name[2:]: value for name, value in request.args.items() if name.startswith('w_')}
+
+def ranked_jobs(ranked):
+    return [dict(job, score=round(score, 4)) if distance is None
+            else dict(job, score=round(score, 4), distance_km=round(distance, 2))
+            for score, distance, job in ranked]
+
+def paging_requested():
+    return request.args.get('limit', '') != '' or request.args.get('cursor', '') != ''
+
+def listing_response(rows, sort_key=None, reverse=False, view=None):
+    """
+    Return a job listing as a JSON array, honouring the paging parameters:
+    ``limit`` and ``cursor`` (the previous page's X-Next-Cursor header) select
+    one page ordered by ``sort_key``, which must end with the job id so the
+    cursor is stable; ``stream=1`` sends the array in chunks.
+    Without limit or cursor the rows are returned in the order given.
+    With a SortedView as ``view`` its maintained order is sliced instead.
+    """
+    next_cursor = None
+    if paging_requested():
+        limit = int_arg('limit', minimum=1)
+        try:
+            after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            if view is not None:
+                rows, next_key = view.page(after, limit, reverse)
+            else:
+                rows, next_key = select_page([(sort_key(row), row) for row in rows], after, limit, reverse)
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        if next_key is not None:
+            next_cursor = encode_cursor(next_key)
+    elif view is not None:
+        rows = view.page(reverse=reverse)[0]
+    
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        response = Response(stream_json_array(rows), mimetype='application/json')
+    else:
+        response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def by_id(job):
+    return (row_id(job),)
+
+def fuzzy_requested():
+    return request.args.get('fuzzy', '').lower() in ('1', 'true', 'yes')
+
+def near_location(jobs):
+    """
+    ``jobs`` narrowed to the ``location`` parameter, if given, allowing for
+    typos: any location in use within ``distance`` edits of it (by default
+    one for short names, two for long ones) matches
+    """
+    location = request.args.get('location', '')
+    if not location.strip():
+        return jobs
+    places = job_locations.expand(location, int_arg('distance'))
+    return [job for job in jobs if normalize_location(job.get('location')) in places]
+
+def upload_rows():
+    """(line, row, error) for each record of a bulk upload: a multipart 'file' or the raw body"""
+    upload = request.files.get('file')
+    if upload is not None:
+        return iter_upload(upload.stream, upload_format(upload.mimetype, upload.filename))
+    return iter_upload(request.stream, upload_format(request.mimetype))
+
+def too_many_rows():
+    return jsonify({'error': 'Upload has more than %d rows' % BULK_MAX_ROWS}), 413
+
 
 # Authentication routes
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.json
     user_type = data.get('type', '').lower().strip()
-    email = data.get('email')
+    email = normalize_email(data.get('email'))
     
     if user_type == 'student':
-        users = read_csv(STUDENTS_FILE)
-        if any(u['email'] == email for u in users):
-            return jsonify({'error': 'Email already exists'}), 400
-        
         new_student = {
-            'id': str(len(users) + 1),
             'name': data.get('name'),
             'email': email,
             'password': data.get('password'),
@@ -108,22 +361,26 @@ def register():
             'rating': '0',
             'jobs_completed': '0'
         }
-        append_csv(STUDENTS_FILE, new_student)
+        try:
+            # The email checks run on the writer thread, so two concurrent sign-ups can't both pass them
+            new_student = students_store.insert(new_student, unique=('email',),
+                                                check=user_directory.unique_email('student'))
+        except DuplicateKeyError:
+            return jsonify({'error': 'Email already exists'}), 400
         return jsonify({'message': 'Student registered successfully', 'user': new_student})
     
     elif user_type == 'provider':
-        providers = read_csv(PROVIDERS_FILE)
-        if any(p['email'] == email for p in providers):
-            return jsonify({'error': 'Email already exists'}), 400
-        
         new_provider = {
-            'id': str(len(providers) + 1),
             'name': data.get('name'),
             'email': email,
             'password': data.get('password'),
             'company': data.get('company')
         }
-        append_csv(PROVIDERS_FILE, new_provider)
+        try:
+            new_provider = providers_store.insert(new_provider, unique=('email',),
+                                                  check=user_directory.unique_email('provider'))
+        except DuplicateKeyError:
+            return jsonify({'error': 'Email already exists'}), 400
         return jsonify({'message': 'Provider registered successfully', 'user': new_provider})
     
     return jsonify({'error': 'Invalid user type'}), 400
@@ -135,41 +392,31 @@ def login():
     email = data.get('email')
     password = data.get('password')
     
-    if user_type == 'student':
-        students = read_csv(STUDENTS_FILE)
-        student = next((s for s in students if s['email'] == email and s['password'] == password), None)
-        if student:
-            return jsonify({'message': 'Login successful', 'user': student})
-    
-    elif user_type == 'provider':
-        providers = read_csv(PROVIDERS_FILE)
-        provider = next((p for p in providers if p['email'] == email and p['password'] == password), None)
-        if provider:
-            return jsonify({'message': 'Login successful', 'user': provider})
+    if user_type in ('student', 'provider'):
+        user = user_directory.authenticate(user_type, email, password)
+        if user:
+            return jsonify({'message': 'Login successful', 'user': user})
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
 # Job routes
 @app.route('/api/jobs', methods=['GET'])
+@conditional(hot_jobs_store)
 def get_jobs():
-    jobs = read_csv(JOBS_FILE)
-    # Filter only available jobs
-    available_jobs = [job for job in jobs if job['status'] == 'available']
-    return jsonify(available_jobs)
+    available_jobs = hot_jobs_store.find('status', 'available')
+    return listing_response(available_jobs, by_id)
 
 @app.route('/api/jobs/provider/<provider_id>', methods=['GET'])
+@conditional(jobs_store)
 def get_provider_jobs(provider_id):
-    jobs = read_csv(JOBS_FILE)
-    provider_jobs = [job for job in jobs if job['provider_id'] == provider_id]
-    return jsonify(provider_jobs)
+    provider_jobs = jobs_store.find('provider_id', provider_id)
+    return listing_response(provider_jobs, by_id)
 
 @app.route('/api/jobs', methods=['POST'])
 def create_job():
     data = request.json
-    jobs = read_csv(JOBS_FILE)
     
     new_job = {
-        'id': str(len(jobs) + 1),
         'title': data.get('title'),
         'description': data.get('description'),
         'location': data.get('location'),
@@ -179,82 +426,313 @@ def create_job():
         'assigned_student_id': ''
     }
     
-    append_csv(JOBS_FILE, new_job)
+    new_job = jobs_store.insert(new_job)
+    publish_changes([('create', {'job': new_job})])
     return jsonify({'message': 'Job created successfully', 'job': new_job})
 
 @app.route('/api/jobs/<job_id>/apply', methods=['POST'])
 def apply_job(job_id):
     data = request.json
     student_id = data.get('student_id')
+    if not student_id or students_store.get(student_id) is None:
+        return jsonify({'error': 'Student not found'}), 404
     
-    jobs = read_csv(JOBS_FILE)
-    for job in jobs:
-        if job['id'] == job_id:
-            job['status'] = 'applied'
-            job['assigned_student_id'] = student_id
-            break
-    
-    write_csv(JOBS_FILE, jobs)
-    
-    # Update student's jobs completed
-    students = read_csv(STUDENTS_FILE)
-    for student in students:
-        if student['id'] == student_id:
-            student['jobs_completed'] = str(int(student.get('jobs_completed', 0)) + 1)
-            break
-    
-    write_csv(STUDENTS_FILE, students)
+    taken = []
+    def take(job):
+        # Re-checked on the writer thread, as for bulk applies: the job may have been taken already
+        if job['status'] != 'available':
+            return {}
+        taken.append(job['id'])
+        return {'status': 'applied', 'assigned_student_id': student_id}
+    
+    applied = jobs_store.update(job_id, take)
+    if applied is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not taken:
+        return jsonify({'error': 'Job is no longer available'}), 409
+    publish_changes([('apply', {'job_id': applied['id'], 'student_id': applied['assigned_student_id']})])
+    
+    # Update student's jobs completed (read-modify-write on the writer thread, so no lost increments)
+    students_store.update(student_id, lambda student: {
+        'jobs_completed': int(student.get('jobs_completed') or 0) + 1
+    })
     
     return jsonify({'message': 'Job applied successfully'})
 
+@app.route('/api/jobs/bulk', methods=['POST'])
+def bulk_create_jobs():
+    default_provider = request.args.get('provider_id')
+    known_providers = {}
+    new_jobs = []
+    errors = []
+    try:
+        for number, (line, row, error) in enumerate(upload_rows(), 1):
+            if number > BULK_MAX_ROWS:
+                return too_many_rows()
+            if row is not None:
+                job, error = job_from_upload(row, default_provider)
+            if error is None:
+                provider_id = job['provider_id']
+                if provider_id not in known_providers:
+                    known_providers[provider_id] = providers_store.get(provider_id) is not None
+                if not known_providers[provider_id]:
+                    error = 'Provider not found'
+            if error is None:
+                new_jobs.append(job)
+            else:
+                errors.append({'line': line, 'error': error})
+    except UploadError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    # One block of ids, one journal write
+    created = jobs_store.insert_many(new_jobs) if new_jobs else []
+    publish_changes([('create', {'job': job}) for job in created])
+    return jsonify({
+        'message': 'Imported %d jobs' % len(created),
+        'created': len(created),
+        'ids': [job['id'] for job in created],
+        'errors': errors
+    })
+
+@app.route('/api/jobs/apply', methods=['POST'])
+def bulk_apply_jobs():
+    applications = {}  # job_id -> (line, student_id)
+    known_students = {}
+    errors = []
+    try:
+        for number, (line, row, error) in enumerate(upload_rows(), 1):
+            if number > BULK_MAX_ROWS:
+                return too_many_rows()
+            if row is not None:
+                job_id, student_id = text_field(row, 'job_id'), text_field(row, 'student_id')
+                error = apply_error(job_id, student_id, applications, known_students)
+            if error is None:
+                applications[job_id] = (line, student_id)
+            else:
+                errors.append({'line': line, 'error': error})
+    except UploadError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    def take(student_id):
+        # Re-checked on the writer thread: the job may have been taken since it was validated
+        return lambda job: ({'status': 'applied', 'assigned_student_id': student_id}
+                            if job['status'] == 'available' else {})
+    
+    updated = jobs_store.update_many({job_id: take(student_id)
+                                      for job_id, (_, student_id) in applications.items()}) if applications else []
+    applied = {job['id'] for job in updated
+               if job['status'] == 'applied' and job['assigned_student_id'] == applications[job['id']][1]}
+    publish_changes([('apply', {'job_id': job_id, 'student_id': applications[job_id][1]}) for job_id in applied])
+    per_student = {}
+    for job_id, (line, student_id) in applications.items():
+        if job_id in applied:
+            per_student[student_id] = per_student.get(student_id, 0) + 1
+        else:
+            errors.append({'line': line, 'error': 'Job is no longer available'})
+    
+    if per_student:
+        students_store.update_many({student_id: (lambda student, count=count: {
+            'jobs_completed': int(student.get('jobs_completed') or 0) + count
+        }) for student_id, count in per_student.items()})
+    
+    errors.sort(key=lambda error: error['line'])
+    return jsonify({
+        'message': 'Applied to %d jobs' % len(applied),
+        'applied': len(applied),
+        'job_ids': [job_id for job_id in applications if job_id in applied],
+        'errors': errors
+    })
+
+def apply_error(job_id, student_id, applications, known_students):
+    """Why one row of a bulk apply can't be accepted, or None"""
+    if not job_id or not student_id:
+        return 'Missing %s' % ', '.join(field for field, value in (('job_id', job_id), ('student_id', student_id))
+                                        if not value)
+    if student_id not in known_students:
+        known_students[student_id] = students_store.get(student_id) is not None
+    if not known_students[student_id]:
+        return 'Student not found'
+    if job_id in applications:
+        return 'Job appears earlier in this upload'
+    job = jobs_store.get(job_id)
+    if job is None:
+        return 'Job not found'
+    if job['status'] != 'available':
+        return 'Job is not available'
+    return None
+
 # Algorithm routes
 @app.route('/api/jobs/suggested/<student_id>', methods=['GET'])
+@conditional(students_store, hot_jobs_store)
 def get_suggested_jobs(student_id):
-    students = read_csv(STUDENTS_FILE)
-    jobs = read_csv(JOBS_FILE)
-    
-    student = next((s for s in students if s['id'] == student_id), None)
+    student = students_store.get(student_id)
     if not student:
         return jsonify({'error': 'Student not found'}), 404
     
-    available_jobs = [job for job in jobs if job['status'] == 'available']
-    
-    # Use Dijkstra's algorithm to find nearest jobs
-    suggested_jobs = dijkstra_nearest_jobs(student['location'], available_jobs)
-    return jsonify(suggested_jobs[:5])  # Return top 5 suggested jobs
+    k = int_arg('k', 5, minimum=1)
+    radius_km = float_arg('radius_km')
+    
+    weights = weight_args()
+    if request.args.get('rank') == 'score' or weights:
+        # Weighted ranking on distance, pay, bio relevance and rating
+        try:
+            return jsonify(ranked_jobs(job_ranker.rank(student, k, weights)))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    if radius_km is None:
+        cached = suggestion_cache.suggestions(student, k)
+        if cached is not None:
+            return jsonify([job if distance is None else dict(job, distance_km=round(distance, 2))
+                            for distance, job in cached])
+    
+    point = gazetteer.resolve(student['location'])
+    if point is None:
+        # Unknown student location: fall back to string distance over all available jobs
+        available_jobs = hot_jobs_store.find('status', 'available')
+        suggested_jobs = dijkstra_nearest_jobs(student['location'], available_jobs, k=k)
+        return jsonify(suggested_jobs)
+    
+    # Bounded nearest-neighbour search in the spatial index
+    suggested_jobs = [
+        dict(job, distance_km=round(distance, 2))
+        for distance, job in job_locator.nearest(point[0], point[1], k=k, radius_km=radius_km)
+    ]
+    if len(suggested_jobs) < k and radius_km is None:
+        # Top up with jobs whose location could not be geocoded
+        unresolved = dijkstra_nearest_jobs(student['location'], job_locator.unresolved_jobs(),
+                                           k=k - len(suggested_jobs))
+        suggested_jobs.extend(unresolved)
+    return jsonify(suggested_jobs)
+
+@app.route('/api/jobs/suggested/batch', methods=['POST'])
+def get_suggested_jobs_batch():
+    data = request.json or {}
+    student_ids = [str(sid) for sid in dict.fromkeys(data.get('student_ids', []))]
+    try:
+        k = max(int(data.get('k', 5)), 1)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k must be an integer'}), 400
+    
+    students = [s for s in (students_store.get(sid) for sid in student_ids) if s]
+    try:
+        # One vectorized pass over the jobs per block of students
+        ranked = job_ranker.rank_many(students, k, data.get('weights'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    found = {student['id'] for student in students}
+    return jsonify({
+        'suggestions': {student['id']: ranked_jobs(jobs) for student, jobs in zip(students, ranked)},
+        'missing': [sid for sid in student_ids if sid not in found]
+    })
 
 @app.route('/api/jobs/search', methods=['GET'])
+@conditional(hot_jobs_store)
 def search_jobs():
     query = request.args.get('q', '')
-    jobs = read_csv(JOBS_FILE)
-    available_jobs = [job for job in jobs if job['status'] == 'available']
-    
-    # Use linear search to find jobs matching query
-    matching_jobs = linear_search_jobs(query, available_jobs)
-    return jsonify(matching_jobs)
+    mode = request.args.get('mode', 'index')
+    
+    if mode == 'substring':
+        # Compatibility mode: linear substring scan over every available job
+        available_jobs = hot_jobs_store.find('status', 'available')
+        matching_jobs = linear_search_jobs(query, available_jobs)
+        return listing_response(near_location(matching_jobs), by_id)
+    
+    # Relevance-ranked lookup in the inverted index
+    if not paging_requested():
+        return listing_response(near_location(job_search.search(query)), by_id)
+    # Pages are ordered by (score, id) so a cursor survives ties
+    scored = job_search.scored(query)
+    scores = {job['id']: score for score, job in scored}
+    return listing_response(near_location([job for _, job in scored]),
+                            lambda job: (scores[job['id']], -row_id(job)), reverse=True)
 
 @app.route('/api/jobs/sort', methods=['GET'])
+@conditional(hot_jobs_store)
 def sort_jobs_route():
     sort_by = request.args.get('by', 'pay')
     order = request.args.get('order', 'desc')
     
-    jobs = read_csv(JOBS_FILE)
-    available_jobs = [job for job in jobs if job['status'] == 'available']
+    if sort_by in job_sort_views:
+        # Slice of a maintained order; equal values keep id order
+        return listing_response(None, reverse=(order == 'desc'), view=job_sort_views[sort_by])
+    
+    available_jobs = hot_jobs_store.find('status', 'available')
+    
+    if paging_requested():
+        # Only the requested page gets sorted; equal values keep id order
+        if order == 'desc':
+            return listing_response(available_jobs, lambda job: (job_sort_value(job, sort_by), -row_id(job)),
+                                    reverse=True)
+        return listing_response(available_jobs, lambda job: (job_sort_value(job, sort_by), row_id(job)))
     
     sorted_jobs = sort_jobs(available_jobs, sort_by, order)
-    return jsonify(sorted_jobs)
+    return listing_response(sorted_jobs, by_id)
+
+@app.route('/api/jobs/filter', methods=['GET'])
+@conditional(jobs_store)
+def filter_jobs_route():
+    filters = {facet: [value for value in request.args.getlist(facet) if value] for facet in FACETS}
+    locations = filters['location']
+    if fuzzy_requested():
+        # Every location in use within a typo or two of the ones asked for
+        filters['location'] = sorted({place for location in locations
+                                      for place in job_locations.expand(location, int_arg('distance'))})
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        if len(after) != 1 or not isinstance(after[0], int):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        after = after[0]
+    
+    # Matching page, total and per-facet counts from one pass over the bitmaps
+    jobs, total, facets, next_id = job_facets.search(filters, float_arg('min_pay'), float_arg('max_pay'),
+                                                     after, int_arg('limit', minimum=1))
+    result = {'jobs': jobs, 'total': total, 'facets': facets}
+    if locations and not total:
+        result['did_you_mean'] = location_suggestions(locations)
+    response = jsonify(result)
+    if next_id is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor((next_id,))
+    return response
+
+def location_suggestions(locations):
+    """Locations in use close to any of ``locations`` that no job uses, closest first, without repeats"""
+    suggestions = {}
+    for location in locations:
+        if job_locations.expand(location, 0):
+            continue
+        for suggestion in job_locations.suggest(location, max_distance=int_arg('distance')):
+            key = normalize_location(suggestion['location'])
+            if key not in suggestions or suggestion['distance'] < suggestions[key]['distance']:
+                suggestions[key] = suggestion
+    return sorted(suggestions.values(), key=lambda suggestion: (suggestion['distance'], -suggestion['count']))
+
+@app.route('/api/locations/suggest', methods=['GET'])
+@conditional(jobs_store)
+def suggest_locations():
+    query = request.args.get('q', '')
+    suggestions = job_locations.suggest(query, int_arg('limit', default=5, minimum=1), int_arg('distance'))
+    return jsonify({'query': query, 'suggestions': suggestions})
 
 # Student routes
 @app.route('/api/students/<student_id>', methods=['GET'])
+@conditional(students_store, jobs_store, assignments_store)
 def get_student(student_id):
-    students = read_csv(STUDENTS_FILE)
-    student = next((s for s in students if s['id'] == student_id), None)
+    student = students_store.get(student_id)
     
     if student:
-        # Get student's job history
-        jobs = read_csv(JOBS_FILE)
-        student_jobs = [job for job in jobs if job['assigned_student_id'] == student_id]
-        student['job_history'] = student_jobs
+        # Get student's job history: jobs they applied to or were assigned, alone or with others
+        history = {job['id']: job for job in jobs_store.find('assigned_student_id', student_id)}
+        for assignment in assignments_store.find('student_id', student_id):
+            job = jobs_store.get(assignment['job_id'])
+            if job is not None and job['status'] == 'assigned':
+                history.setdefault(job['id'], job)
+        student['job_history'] = sorted(history.values(), key=row_id)
         return jsonify(student)
     
     return jsonify({'error': 'Student not found'}), 404
@@ -267,35 +745,30 @@ def rate_student(student_id):
     if rating < 1 or rating > 5:
         return jsonify({'error': 'Rating must be between 1 and 5'}), 400
     
-    students = read_csv(STUDENTS_FILE)
-    for student in students:
-        if student['id'] == student_id:
-            # Update rating (simple average for now)
-            current_rating = float(student.get('rating', 0))
-            jobs_completed = int(student.get('jobs_completed', 0))
-            
-            if jobs_completed > 0:
-                new_rating = (current_rating * jobs_completed + rating) / (jobs_completed + 1)
-            else:
-                new_rating = rating
-            
-            student['rating'] = str(round(new_rating, 2))
-            break
+    def apply_rating(student):
+        # Update rating (simple average for now)
+        current_rating = float(student.get('rating') or 0)
+        jobs_completed = int(student.get('jobs_completed') or 0)
+        
+        if jobs_completed > 0:
+            new_rating = (current_rating * jobs_completed + rating) / (jobs_completed + 1)
+        else:
+            new_rating = rating
+        
+        return {'rating': str(round(new_rating, 2))}
     
-    write_csv(STUDENTS_FILE, students)
+    students_store.update(student_id, apply_rating)
     return jsonify({'message': 'Student rated successfully'})
 
 # Provider routes
 @app.route('/api/providers/<provider_id>', methods=['GET'])
+@conditional(providers_store, jobs_store)
 def get_provider(provider_id):
-    providers = read_csv(PROVIDERS_FILE)
-    provider = next((p for p in providers if p['id'] == provider_id), None)
+    provider = providers_store.get(provider_id)
     
     if provider:
         # Get provider's jobs
-        jobs = read_csv(JOBS_FILE)
-        provider_jobs = [job for job in jobs if job['provider_id'] == provider_id]
-        provider['jobs'] = provider_jobs
+        provider['jobs'] = jobs_store.find('provider_id', provider_id)
         return jsonify(provider)
     
     return jsonify({'error': 'Provider not found'}), 404
@@ -304,50 +777,111 @@ def get_provider(provider_id):
 @app.route('/api/jobs/<job_id>', methods=['PUT'])
 def update_job(job_id):
     data = request.json
-    jobs = read_csv(JOBS_FILE)
-    
-    for job in jobs:
-        if job['id'] == job_id:
-            job.update(data)
-            break
-    
-    write_csv(JOBS_FILE, jobs)
+    updated = jobs_store.update(job_id, data)
+    if updated is not None:
+        changes = {field: updated[field] for field in data if field in JOB_FIELDS and field != 'id'}
+        publish_changes([('update', {'job_id': updated['id'], 'changes': changes})])
     return jsonify({'message': 'Job updated successfully'})
 
 @app.route('/api/jobs/<job_id>', methods=['DELETE'])
 def delete_job(job_id):
-    jobs = read_csv(JOBS_FILE)
-    jobs = [job for job in jobs if job['id'] != job_id]
-    
-    write_csv(JOBS_FILE, jobs)
+    if jobs_store.delete(job_id):
+        publish_changes([('delete', {'job_id': str(job_id)})])
     return jsonify({'message': 'Job deleted successfully'})
 
+@app.route('/api/jobs/changes', methods=['GET'])
+def job_changes():
+    """
+    Server-sent events: create / update / delete / apply deltas of jobs.
+    Resumes after the ``Last-Event-ID`` header (sent by EventSource on
+    reconnect) or ``?since=<seq>``; without either only new events are sent.
+    A ``reset`` event means events were missed and the lists should be re-read.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since in (None, ''):
+        since = change_feed.last_seq
+    else:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since must be an event id'}), 400
+    stream = event_stream(change_feed, since, change_hub, request.environ.get('workmate.detach'))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Hungarian algorithm route for optimal assignment
+def amount_param(value):
+    """A capacity / headcount payload value: a whole number of at least 1, or {id: such a number}"""
+    if isinstance(value, dict):
+        return {str(key): amount_param(amount) for key, amount in value.items()}
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value) or value < 1:
+        raise ValueError(value)
+    return int(value)
+
 @app.route('/api/assignments/optimal', methods=['POST'])
 def optimal_assignment():
     data = request.json
     student_ids = data.get('student_ids', [])
     job_ids = data.get('job_ids', [])
     
-    students = read_csv(STUDENTS_FILE)
-    jobs = read_csv(JOBS_FILE)
-    
-    selected_students = [s for s in students if s['id'] in student_ids]
-    selected_jobs = [j for j in jobs if j['id'] in job_ids and j['status'] == 'available']
-    
-    assignments = hungarian_job_assignment(selected_students, selected_jobs)
-    
-    # Update job assignments
-    for assignment in assignments:
-        for job in jobs:
-            if job['id'] == assignment['job_id']:
-                job['assigned_student_id'] = assignment['student_id']
-                job['status'] = 'assigned'
-                break
-    
-    write_csv(JOBS_FILE, jobs)
-    
-    return jsonify({'message': 'Optimal assignments completed', 'assignments': assignments})
+    selected_students = [s for s in (students_store.get(sid) for sid in dict.fromkeys(student_ids)) if s]
+    selected_jobs = [j for j in (hot_jobs_store.get(jid) for jid in dict.fromkeys(job_ids))
+                     if j and j['status'] == 'available']
+    
+    mode = data.get('mode', 'hungarian')
+    if mode not in ('hungarian', 'flow'):
+        return jsonify({'error': "mode must be 'hungarian' or 'flow'"}), 400
+    
+    started = time.perf_counter()
+    if mode == 'flow':
+        # Several jobs per student / students per job: capacity and headcount are
+        # a number for everyone or a {id: number} mapping (default 1)
+        try:
+            capacity = amount_param(data.get('capacity', 1))
+            headcount = amount_param(data.get('headcount', 1))
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'capacity and headcount must be integers of at least 1 or '
+                                     '{id: integer} objects'}), 400
+        assignments = flow_job_assignment(selected_students, selected_jobs, capacity=capacity, headcount=headcount)
+    else:
+        assignments = hungarian_job_assignment(selected_students, selected_jobs)
+    solve_time_ms = (time.perf_counter() - started) * 1000
+    
+    def assign(student_id):
+        # Re-checked on the writer thread: the job may have been taken since it was selected
+        return lambda job: ({'assigned_student_id': student_id, 'status': 'assigned'}
+                            if job['status'] == 'available' else {})
+    
+    # A job's students go in the assignments table; the job row records the first of them
+    chosen = {}
+    for a in assignments:
+        chosen.setdefault(a['job_id'], []).append(a['student_id'])
+    updated = jobs_store.update_many({job_id: assign(student_ids[0]) for job_id, student_ids in chosen.items()})
+    assigned = {job['id']: job for job in updated
+                if job['status'] == 'assigned' and job['assigned_student_id'] == chosen[job['id']][0]}
+    # Rows left from an earlier assignment of a job that was reopened since
+    for job_id in assigned:
+        for stale in assignments_store.find('job_id', job_id):
+            assignments_store.delete(stale['id'])
+    assignments_store.insert_many([{'job_id': job_id, 'student_id': student_id}
+                                   for job_id in assigned for student_id in chosen[job_id]])
+    publish_changes([('update', {'job_id': job['id'], 'changes': {'status': job['status'],
+                                                                  'assigned_student_id': job['assigned_student_id'],
+                                                                  'assigned_student_ids': chosen[job['id']]}})
+                     for job in assigned.values()])
+    
+    # Only what was saved is reported; jobs taken in the meantime are listed separately
+    applied = [a for a in assignments if a['job_id'] in assigned]
+    response = {
+        'message': 'Optimal assignments completed',
+        'assignments': applied,
+        'total_cost': sum(a['cost'] for a in applied),
+        'solve_time_ms': round(solve_time_ms, 3)
+    }
+    unavailable = [a['job_id'] for a in assignments if a['job_id'] not in assigned]
+    if unavailable:
+        response['unavailable_job_ids'] = unavailable
+    return jsonify(response)
 
 if __name__ == '__main__':
     app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,529 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    from .metrics import record_io
+    from .pagination import row_id
+    from .store import StoreBase, file_lock
+except ImportError:
+    from metrics import record_io
+    from pagination import row_id
+    from store import StoreBase, file_lock
+
+
+class Archive:
+    """
+    Append-only log of rows that left the hot partition
+
+    One JSON record per line: ``{"op": "put", "row": {...}}`` stores the
+    latest version of a row, ``{"op": "delete", "row": {...}}`` keeps a
+    deleted row on file but drops it from every lookup. Only the byte range
+    of each row's latest version, hash indexes on the ``indexes`` fields and
+    the values of the ``resident`` fields are kept in memory; rows are read
+    back from the file when asked for, so the archive costs memory and parse
+    time only when it is actually read.
+
+    Writes happen in batches under a cross-process file lock, and a file
+    that grew because another process appended is caught up incrementally;
+    the changes read that way are queued for ``take_changes``.
+    """
+
+    def __init__(self, path, fieldnames, indexes=(), key='id', resident=()):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.index_fields = tuple(indexes)
+        # Indexed values plus the resident ones, for summaries()
+        self.resident_fields = tuple(dict.fromkeys(self.index_fields + tuple(resident)))
+        self._lock = threading.RLock()
+        self._clear()
+        self._signature = None
+        self._loaded = False
+        self._pending = []
+        self._pending_rows = {}
+        self._batch_file_lock = None
+        self._changes = []    # (event, old_row, new_row) appended by other processes
+
+    def _clear(self):
+        self._spans = {}      # id -> (offset, length) of its latest put
+        self._values = {}     # id -> {resident field: value}
+        self._indexes = {field: {} for field in self.index_fields}
+        self._max_id = 0
+        self._end = 0
+
+    # Loading
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _ensure_fresh(self):
+        signature = self._file_signature()
+        if self._loaded and signature == self._signature:
+            return
+        grown = (self._loaded and signature is not None and self._signature is not None
+                 and signature[0] == self._signature[0] and signature[1] > self._signature[1])
+        if not grown:
+            # New or replaced file: index it from the start
+            if self._loaded:
+                self._changes.append(('reload', None, None))
+            self._clear()
+        self._read_from(self._end, track=grown)
+        self._signature = signature
+        self._loaded = True
+
+    def _read_from(self, offset, track=False):
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A torn last line (crash mid-append) is left for a later read
+        end = data.rfind(b'\n') + 1
+        records = 0
+        position = 0
+        for line in data[:end].splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if record:
+                self._apply(record, offset + position, len(line), track)
+                records += 1
+            position += len(line)
+        self._end = offset + end
+        if end:
+            record_io(self.path, 'read', records, end, time.perf_counter() - started)
+
+    def _apply(self, record, offset, length, track=False):
+        row = record.get('row') or {}
+        key = row.get(self.key)
+        if not key:
+            return
+        if track:
+            old_row = self._read_row(key)
+            if record.get('op') == 'put':
+                self._changes.append(('update' if old_row else 'insert', old_row, row))
+            elif old_row is not None:
+                self._changes.append(('delete', old_row, None))
+        self._unindex(key)
+        if key.isdigit() and int(key) > self._max_id:
+            self._max_id = int(key)
+        if record.get('op') == 'put':
+            self._spans[key] = (offset, length)
+            self._values[key] = values = {field: sys.intern(row.get(field) or '') for field in self.resident_fields}
+            for field in self.index_fields:
+                self._indexes[field].setdefault(values[field], {})[key] = None
+
+    def _unindex(self, key):
+        self._spans.pop(key, None)
+        values = self._values.pop(key, {})
+        for field in self.index_fields:
+            value = values.get(field)
+            bucket = self._indexes[field].get(value)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._indexes[field][value]
+
+    def refresh(self):
+        with self._lock:
+            self._ensure_fresh()
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+            self._ensure_fresh()
+
+    def take_changes(self):
+        """
+        The changes other processes appended since the last call, as
+        (event, old_row, new_row) like a store listener gets them; ``reload``
+        if the file was replaced
+        """
+        with self._lock:
+            self._ensure_fresh()
+            changes, self._changes = self._changes, []
+            return changes
+
+    def signature(self):
+        with self._lock:
+            self._ensure_fresh()
+            return self._signature
+
+    # Reads
+    def _read_row(self, key):
+        row = self._pending_rows.get(key)
+        if row is not None:
+            return dict(row)
+        span = self._spans.get(key)
+        if span is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(span[0])
+            return json.loads(f.read(span[1]))['row']
+
+    def __contains__(self, key):
+        with self._lock:
+            self._ensure_fresh()
+            return str(key) in self._spans
+
+    def get(self, key):
+        with self._lock:
+            self._ensure_fresh()
+            return self._read_row(str(key))
+
+    def ids(self, field=None, value=None):
+        """Ids of the archived rows, or of those whose ``field`` equals ``value``, in id order"""
+        with self._lock:
+            self._ensure_fresh()
+            keys = self._spans if field is None else self._indexes[field].get(value, {})
+            return sorted(keys, key=lambda key: (row_id({self.key: key}), key))
+
+    def find(self, field, value):
+        with self._lock:
+            return [self._read_row(key) for key in self.ids(field, value)]
+
+    def all(self):
+        with self._lock:
+            return [self._read_row(key) for key in self.ids()]
+
+    def summaries(self):
+        """The key and resident fields of every archived row, in id order, without reading the file"""
+        with self._lock:
+            return [dict(self._values[key], **{self.key: key}) for key in self.ids()]
+
+    def count(self, field=None, value=None):
+        with self._lock:
+            self._ensure_fresh()
+            if field is None:
+                return len(self._spans)
+            return len(self._indexes[field].get(value, ()))
+
+    def max_id(self):
+        with self._lock:
+            self._ensure_fresh()
+            return self._max_id
+
+    # Writes (only between begin_batch and commit_batch)
+    def begin_batch(self):
+        self._batch_file_lock = file_lock(self.lock_path)
+        self._batch_file_lock.__enter__()
+        try:
+            with self._lock:
+                self._ensure_fresh()
+                if self._signature is not None and self._signature[1] > self._end:
+                    # Torn record from a writer that crashed mid-append: drop it before appending
+                    os.truncate(self.path, self._end)
+                    self._signature = self._file_signature()
+        except BaseException:
+            self._release_batch()
+            raise
+
+    def _write(self, op, row):
+        row = {field: '' if row.get(field) is None else str(row.get(field)) for field in self.fieldnames}
+        line = (json.dumps({'op': op, 'row': row}, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            # Holding the file lock, nobody else can append before this batch is written
+            offset = self._end + sum(len(pending) for pending in self._pending)
+            self._pending.append(line)
+            self._apply({'op': op, 'row': row}, offset, len(line))
+            if op == 'put':
+                self._pending_rows[row[self.key]] = row
+            else:
+                self._pending_rows.pop(row[self.key], None)
+        return dict(row)
+
+    def put(self, row):
+        """Store ``row`` as the archived version of its id"""
+        return self._write('put', row)
+
+    def delete(self, row):
+        """Record ``row`` as deleted; it stays on file but no longer shows up"""
+        return self._write('delete', row)
+
+    def commit_batch(self):
+        if self._pending:
+            started = time.perf_counter()
+            payload = b''.join(self._pending)
+            with open(self.path, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            record_io(self.path, 'append', len(self._pending), len(payload), time.perf_counter() - started)
+            with self._lock:
+                self._end += len(payload)
+                self._signature = self._file_signature()
+                self._pending = []
+                self._pending_rows = {}
+        self._release_batch()
+
+    def abort_batch(self):
+        with self._lock:
+            self._pending = []
+            self._pending_rows = {}
+            self._loaded = False
+            self._clear()
+        self._release_batch()
+
+    def _release_batch(self):
+        if self._batch_file_lock is not None:
+            self._batch_file_lock.__exit__(None, None, None)
+            self._batch_file_lock = None
+
+
+class PartitionedStore(StoreBase):
+    """
+    One table split into a hot store for the rows matching ``is_hot`` and
+    an append-only ``Archive`` for the rest, behind the usual store interface
+
+    Reads and indexes that only need hot rows (the derived indexes over
+    available jobs) use ``hot`` directly and never touch the archive. A row
+    whose update takes it out of the hot set is written to the archive and
+    then deleted from the hot store, in one batch; one coming back is
+    inserted into the hot store again. The archive is committed first and
+    a row present in the hot store always wins over its archived copy, so
+    a crash between the two commits leaves the row where it was.
+
+    Listeners hear about logical changes: a row moving between partitions is
+    an ``update``, not a delete and an insert. Changes other processes made
+    to archived rows only are passed on by ``refresh``.
+    """
+
+    def __init__(self, hot, archive, is_hot, writer=None):
+        self.hot = hot
+        self.archive = archive
+        self.is_hot = is_hot
+        self.writer = writer
+        self.fieldnames = hot.fieldnames
+        self.key = hot.key
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._batch_lock = threading.RLock()
+        self._moved_out = set()   # ids another process moved out, already reported by their hot update
+        hot.add_listener(self._on_hot_change)
+
+    def archive_cold_rows(self):
+        """
+        Move the cold rows of a hot store written before partitioning (or by
+        hand) to the archive; returns how many were moved. Not done on open,
+        so starting the app never rewrites the data files: run
+        ``python storage.py archive`` once. Until then such rows are served
+        from the hot store and move out on their next update.
+        """
+        self.hot.refresh()
+        cold = [row[self.key] for row in self.hot.all() if not self.is_hot(row)]
+        if cold:
+            self._mutate(lambda: [self._move_out(self.hot.get(key)) for key in cold])
+        return len(cold)
+
+    def _on_hot_change(self, event, old_row, new_row):
+        # Translate partition moves (here or in another process) into logical events
+        if event == 'reload':
+            # Listeners re-read everything, archived rows included
+            self.archive.take_changes()
+        elif event == 'delete':
+            archived = self.archive.get(old_row[self.key])
+            if archived is not None:
+                if not self.is_hot(old_row):
+                    # Second half of a move out: the update before it already told the new state
+                    if self._batch_owner != threading.get_ident():
+                        self._moved_out.add(old_row[self.key])
+                    return
+                return self._notify('update', old_row, archived)
+        elif event == 'insert':
+            archived = self.archive.get(new_row[self.key])
+            if archived is not None:
+                return self._notify('update', archived, new_row)
+        self._notify(event, old_row, new_row)
+
+    def _on_archive_changes(self, changes):
+        moved_out, self._moved_out = self._moved_out, set()
+        for event, old_row, new_row in changes:
+            if event == 'reload':
+                self._notify('reload', None, None)
+                continue
+            key = (old_row or new_row)[self.key]
+            # Hot rows win, and rows moved out were already reported by their hot update
+            if key in moved_out or self.hot.get(key) is not None:
+                continue
+            self._notify(event, old_row, new_row)
+
+    # Reads
+    def refresh(self):
+        self.hot.refresh()
+        self._on_archive_changes(self.archive.take_changes())
+
+    def reload(self):
+        self.archive.reload()
+        self.hot.reload()
+
+    def get(self, row_id):
+        return self.hot.get(row_id) or self._archived(row_id)
+
+    def _archived(self, row_id):
+        # An archived copy of a row that is back in the hot store is stale
+        row = self.archive.get(row_id)
+        if row is None or self.hot.get(row_id) is not None:
+            return None
+        return row
+
+    def find(self, field, value):
+        rows = self.hot.find(field, value)
+        if field == 'status' and self.is_hot({field: value}):
+            return rows
+        hot_ids = {row[self.key] for row in rows}
+        archived = [row for row in (self._archived(key) for key in self.archive.ids(field, value))
+                    if row is not None and row[self.key] not in hot_ids]
+        if not archived:
+            return rows
+        return sorted(rows + archived, key=row_id)
+
+    def all(self):
+        rows = self.hot.all()
+        hot_ids = {row[self.key] for row in rows}
+        archived = [row for row in self.archive.all() if row[self.key] not in hot_ids]
+        return sorted(rows + archived, key=row_id) if archived else rows
+
+    def summaries(self, fields):
+        """
+        As for StoreBase; archived rows come from the archive's resident
+        values when it keeps all of ``fields``, so the file isn't read
+        """
+        if not set(fields) <= set(self.archive.resident_fields):
+            return self.all()
+        rows = self.hot.all()
+        hot_ids = {row[self.key] for row in rows}
+        archived = [row for row in self.archive.summaries() if row[self.key] not in hot_ids]
+        return sorted(rows + archived, key=row_id) if archived else rows
+
+    def count(self, field=None, value=None):
+        if field == 'status' and self.is_hot({field: value}):
+            return self.hot.count(field, value)
+        # Counted from the indexes; archived ids only need a membership check against the hot store
+        archived = sum(self.hot.get(key) is None for key in self.archive.ids(field, value))
+        return self.hot.count(field, value) + archived
+
+    def next_id(self):
+        return str(max(int(self.hot.next_id()), self.archive.max_id() + 1))
+
+    def load_state(self):
+        # The archive is read on demand; only the hot store has anything to load
+        return self.hot.load_state()
+
+    def data_version(self):
+        """(token, modified) as for the hot store, covering the archive too"""
+        token, modified = self.hot.data_version()
+        inode, size = self.archive.signature() or (0, 0)
+        return '%s-%x-%x' % (token, inode, size), max(modified, self._modified)
+
+    # Batching: one batch of the hot store and one of the archive, archive committed first
+    def begin_batch(self):
+        self._batch_lock.acquire()
+        self._batch_owner = threading.get_ident()
+        try:
+            self.hot.begin_batch()
+            try:
+                self.archive.begin_batch()
+            except BaseException:
+                self.hot.abort_batch()
+                raise
+        except BaseException:
+            self._release_batch()
+            raise
+
+    def commit_batch(self):
+        try:
+            self.archive.commit_batch()
+        except BaseException:
+            self.hot.abort_batch()
+            self._release_batch()
+            raise
+        try:
+            self.hot.commit_batch()
+        finally:
+            self._release_batch()
+
+    def abort_batch(self):
+        self.archive.abort_batch()
+        self.hot.abort_batch()
+        self._release_batch()
+
+    def _release_batch(self):
+        self._batch_owner = None
+        self._batch_lock.release()
+
+    # Writes
+    def _move_out(self, row):
+        self.archive.put(row)
+        self.hot.delete(row[self.key])
+        return self.archive.get(row[self.key])
+
+    def insert(self, row, unique=(), check=None):
+        """As for the hot store; a row that isn't hot goes straight on to the archive"""
+        return self._mutate(lambda: self._insert(row, unique, check))
+
+    def insert_many(self, rows):
+        return self._mutate(lambda: [self._insert(row, (), None) for row in rows])
+
+    def _insert(self, row, unique, check):
+        row = dict(row)
+        if not row.get(self.key):
+            # The archive holds ids the hot store may never have seen
+            row[self.key] = self.next_id()
+        row = self.hot.insert(row, unique=unique, check=check)
+        return row if self.is_hot(row) else self._move_out(row)
+
+    def update_many(self, changes_by_id):
+        return self._mutate(lambda: self._update_many(changes_by_id))
+
+    def _update_many(self, changes_by_id):
+        results = []
+        for key, changes in changes_by_id.items():
+            key = str(key)
+            if self.hot.get(key) is not None:
+                updated = self.hot.update_many({key: changes})
+                if updated:
+                    row = updated[0]
+                    results.append(row if self.is_hot(row) else self._move_out(row))
+                continue
+            current = self._archived(key)
+            if current is None:
+                continue
+            if callable(changes):
+                changes = changes(dict(current))
+            row = dict(current)
+            row.update(self._changes(changes))
+            if self.is_hot(row):
+                results.append(self.hot.insert(row))
+            else:
+                results.append(self.archive.put(row))
+                self._notify('update', current, self.archive.get(key))
+        return results
+
+    def delete(self, row_id):
+        return self._mutate(lambda: self._delete(str(row_id)))
+
+    def _delete(self, key):
+        current = self.hot.get(key)
+        if current is not None:
+            # Deleted rows are archived too, as deleted
+            self.archive.delete(current)
+            return self.hot.delete(key)
+        current = self._archived(key)
+        if current is None:
+            return False
+        self.archive.delete(current)
+        self._notify('delete', current, None)
+        return True
+
+    def compact(self):
+        self.hot.compact()
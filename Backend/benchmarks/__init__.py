@@ -0,0 +1 @@
+# Benchmark scripts for the WorkMate backend (not collected by pytest)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Resident memory of the jobs table: csv.DictReader dicts vs compact records
+
+    python -m Backend.benchmarks.bench_memory [--sizes 100000 1000000]
+
+Both representations are parsed from the same CSV file, the way the store
+loads it, and measured with tracemalloc (row objects plus their strings).
+"""
+
+import argparse
+import csv
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import record_type
+from storage import INTERNED_FIELDS, JOB_FIELDS, TABLES
+from store import write_csv
+from benchmarks.synthetic import generate_jobs
+
+
+def measure(load):
+    # Timed and traced separately: tracing slows allocation down a lot
+    gc.collect()
+    started = time.perf_counter()
+    rows = load()
+    elapsed = time.perf_counter() - started
+    del rows
+    gc.collect()
+    tracemalloc.start()
+    rows = load()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    gc.collect()
+    return size, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args(argv)
+
+    Job = record_type(JOB_FIELDS, set(INTERNED_FIELDS['jobs']) | set(TABLES['jobs'][1]))
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix='workmate-bench-')
+        try:
+            path = os.path.join(data_dir, 'jobs.csv')
+            write_csv(path, list(generate_jobs(size)), JOB_FIELDS)
+
+            def load_dicts():
+                with open(path, newline='') as f:
+                    return list(csv.DictReader(f))
+
+            def load_records():
+                with open(path, newline='') as f:
+                    return [Job.from_mapping(row) for row in csv.DictReader(f)]
+
+            for name, load in (('dict', load_dicts), ('record', load_records)):
+                size_bytes, elapsed = measure(load)
+                print(f"{size:>8} jobs  {name:<6}  {size_bytes / 2 ** 20:8.1f} MiB"
+                      f"  {size_bytes / size:6.0f} B/row  load={elapsed:.2f}s")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
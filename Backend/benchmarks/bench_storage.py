@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Compare the CSV (+ journal) and SQLite storage backends on typical route operations
+
+    python -m Backend.benchmarks.bench_storage [--sizes 10000 100000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JOB_FIELDS, open_stores
+from store import write_csv
+from benchmarks.synthetic import generate_jobs
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+def bench_backend(backend, data_dir, size, repeat):
+    started = time.perf_counter()
+    jobs = open_stores(data_dir, backend=backend)['jobs']
+    jobs.count()
+    results = {'open_ms': (time.perf_counter() - started) * 1000}
+    # A second process start: the CSV tables now map their binary snapshots
+    started = time.perf_counter()
+    open_stores(data_dir, backend=backend)['jobs'].count()
+    results['reopen_ms'] = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(1)
+    ids = [str(rng.randint(1, size)) for _ in range(repeat)]
+    id_iter = iter(ids * 4)
+
+    results['get_by_id_ms'] = timed(lambda: jobs.get(next(id_iter)), repeat)
+    results['find_provider_ms'] = timed(lambda: jobs.find('provider_id', str(rng.randint(1, 1000))), repeat)
+    results['find_available_ms'] = timed(lambda: jobs.find('status', 'available'), max(1, repeat // 20))
+    results['update_ms'] = timed(lambda: jobs.update(next(id_iter), {'pay': '30'}), repeat)
+    results['insert_ms'] = timed(lambda: jobs.insert({'title': 'Bench', 'status': 'available'}), repeat)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix='workmate-bench-')
+        try:
+            write_csv(os.path.join(data_dir, 'jobs.csv'), list(generate_jobs(size)), JOB_FIELDS)
+            write_csv(os.path.join(data_dir, 'students.csv'), [], ['id'])
+            write_csv(os.path.join(data_dir, 'providers.csv'), [], ['id'])
+            for backend in ('csv', 'sqlite'):
+                results = bench_backend(backend, data_dir, size, args.repeat)
+                cells = '  '.join(f"{name}={value:.3f}" for name, value in results.items())
+                print(f"{size:>8} jobs  {backend:<6}  {cells}")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
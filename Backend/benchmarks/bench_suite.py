@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Time the algorithms and the API routes on synthetic data of growing size
+
+    python -m Backend.benchmarks.bench_suite [--sizes 1000 10000 100000] [--output results.json]
+    python -m Backend.benchmarks.bench_suite --baseline baseline.json [--threshold 0.25]
+
+Each size gets a fresh synthetic dataset (see synthetic.py) and its own
+process, so the app loads that dataset at startup the way it would in
+production. Every operation is timed as the median of --repeat samples, in
+milliseconds per call. Results are written as JSON; pass an earlier results
+file as --baseline to exit with status 1 when any operation got slower than
+the baseline by more than --threshold (a fraction).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import dataset_sizes, write_dataset
+
+# Side of the square assignment problem (the solver is O(n³), so it doesn't scale with the data)
+ASSIGNMENT_SIZE = 100
+# Students and jobs in the min-cost flow assignment (sparse, so it can be much larger)
+FLOW_ASSIGNMENT_SIZE = 1000
+# Slowdowns smaller than this are clock noise, whatever the ratio
+NOISE_FLOOR_MS = 0.05
+# A sample runs the operation enough times to last at least this long
+SAMPLE_SECONDS = 0.01
+
+
+def measure(fn, repeat, calls=None):
+    """Median milliseconds per call of fn over ``repeat`` samples"""
+    if calls is None:
+        # Like timeit's autorange: batch fast calls so a sample is well above timer resolution
+        calls = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            if time.perf_counter() - started >= SAMPLE_SECONDS or calls >= 10000:
+                break
+            calls *= 10
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        samples.append((time.perf_counter() - started) / calls * 1000)
+    return statistics.median(samples)
+
+def cycle(values):
+    while True:
+        yield from values
+
+def bench_algorithms(data_dir, repeat):
+    import csv
+    from algorithms import (dijkstra_nearest_jobs, flow_job_assignment, hungarian_job_assignment, linear_search_jobs,
+                            sort_jobs)
+
+    with open(os.path.join(data_dir, 'jobs.csv'), newline='') as f:
+        jobs = [job for job in csv.DictReader(f) if job['status'] == 'available']
+    with open(os.path.join(data_dir, 'students.csv'), newline='') as f:
+        students = list(csv.DictReader(f))
+
+    return {
+        'algorithms.linear_search_jobs': measure(lambda: linear_search_jobs('tutor', jobs), repeat),
+        'algorithms.sort_jobs': measure(lambda: sort_jobs(jobs, 'pay', 'desc'), repeat),
+        'algorithms.dijkstra_nearest_jobs': measure(lambda: dijkstra_nearest_jobs('Brooklin', jobs, k=5), repeat),
+        'algorithms.hungarian_job_assignment': measure(
+            lambda: hungarian_job_assignment(students[:ASSIGNMENT_SIZE], jobs[:ASSIGNMENT_SIZE]), repeat),
+        'algorithms.flow_job_assignment': measure(
+            lambda: flow_job_assignment(students[:FLOW_ASSIGNMENT_SIZE], jobs[:FLOW_ASSIGNMENT_SIZE], capacity=2),
+            repeat, calls=1),
+    }
+
+def bench_routes(data_dir, sizes, repeat):
+    os.environ['WORKMATE_DATA_DIR'] = data_dir
+    started = time.perf_counter()
+    import app as workmate
+    results = {'app.startup': (time.perf_counter() - started) * 1000}
+    client = workmate.app.test_client()
+
+    def get(url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError('GET %s returned %d' % (url, response.status_code))
+        response.get_data()
+
+    def post(url, payload):
+        response = client.post(url, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError('POST %s returned %d' % (url, response.status_code))
+
+    student_ids = cycle([str(i) for i in range(1, sizes['students'] + 1, max(1, sizes['students'] // 997))])
+    provider_ids = cycle([str(i) for i in range(1, sizes['providers'] + 1)])
+    reads = {
+        'routes.jobs': '/api/jobs',
+        'routes.jobs_page': '/api/jobs?limit=50',
+        'routes.search': '/api/jobs/search?q=tutor&limit=50',
+        'routes.sort_pay_page': '/api/jobs/sort?by=pay&order=desc&limit=50',
+        'routes.sort_title_page': '/api/jobs/sort?by=title&limit=50',
+    }
+    for name, url in reads.items():
+        results[name] = measure(lambda: get(url), repeat)
+    results['routes.suggested'] = measure(lambda: get('/api/jobs/suggested/%s?k=5' % next(student_ids)), repeat)
+    results['routes.suggested_ranked'] = measure(
+        lambda: get('/api/jobs/suggested/%s?k=5&rank=score' % next(student_ids)), repeat)
+    results['routes.student'] = measure(lambda: get('/api/students/%s' % next(student_ids)), repeat)
+    results['routes.provider'] = measure(lambda: get('/api/providers/%s' % next(provider_ids)), repeat)
+    results['routes.create_job'] = measure(lambda: post('/api/jobs', {
+        'title': 'Benchmark', 'location': 'Queens', 'pay': '20', 'provider_id': '1'}), repeat)
+
+    # Each call takes fresh jobs: assigned ones are no longer available
+    available = [job['id'] for job in workmate.jobs_store.find('status', 'available')]
+    batches = iter([available[i:i + ASSIGNMENT_SIZE] for i in range(0, len(available), ASSIGNMENT_SIZE)])
+    assigned_students = [str(i) for i in range(1, min(sizes['students'], ASSIGNMENT_SIZE) + 1)]
+    rounds = min(repeat, len(available) // ASSIGNMENT_SIZE)
+    if rounds:
+        results['routes.optimal_assignment'] = measure(lambda: post('/api/assignments/optimal', {
+            'student_ids': assigned_students, 'job_ids': next(batches)}), rounds, calls=1)
+    return results
+
+def run_child(data_dir, size, repeat, output):
+    sizes = dataset_sizes(size)
+    results = bench_algorithms(data_dir, repeat)
+    results.update(bench_routes(data_dir, sizes, repeat))
+    with open(output, 'w') as f:
+        json.dump(results, f)
+
+def run_size(size, repeat):
+    data_dir = tempfile.mkdtemp(prefix='workmate-bench-')
+    try:
+        write_dataset(data_dir, size)
+        output = os.path.join(data_dir, 'results.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', data_dir,
+                        '--sizes', str(size), '--repeat', str(repeat), '--output', output], check=True)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def regressions(results, baseline, threshold):
+    """(size, operation, baseline ms, current ms) for each operation slower than allowed"""
+    slower = []
+    for size, metrics in results.items():
+        for name, current in metrics.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous is not None and current > previous * (1 + threshold) and current - previous > NOISE_FLOOR_MS:
+                slower.append((size, name, previous, current))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='numbers of jobs (students and providers scale with them)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against the baseline, as a fraction (default 0.25)')
+    parser.add_argument('--child', metavar='DATA_DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.sizes[0], args.repeat, args.output)
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = metrics = run_size(size, args.repeat)
+        for name, value in metrics.items():
+            print(f"{size:>8} jobs  {name:<40} {value:12.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        slower = regressions(results, baseline, args.threshold)
+        for size, name, previous, current in slower:
+            print(f"REGRESSION {size:>8} jobs  {name}: {previous:.3f} ms -> {current:.3f} ms"
+                  f" (+{(current / previous - 1) * 100:.0f}%)")
+        if slower:
+            return 1
+        print('No regressions beyond %d%% of %s' % (args.threshold * 100, args.baseline))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data for benchmarks
+
+    python -m Backend.benchmarks.synthetic --jobs 100000 --out /tmp/workmate-data
+
+Writes jobs.csv, students.csv and providers.csv in the layout of Backend/data.
+The same sizes and seed always give byte-identical files. Students and
+providers scale with the number of jobs unless given.
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from geo import Gazetteer
+from storage import JOB_FIELDS, PROVIDER_FIELDS, STUDENT_FIELDS
+
+LOCATIONS = ['New York', 'Brooklyn', 'Manhattan', 'Queens', 'Bronx', 'Staten Island',
+             'Harlem', 'Astoria', 'Williamsburg', 'Jersey City', 'Hoboken', 'Flushing']
+# Free-text locations the gazetteer can't resolve, as real users type them
+UNRESOLVED_LOCATIONS = ['Remote', 'Downtown', 'Near campus', 'Brooklin', 'Manhatan']
+TITLES = ['Tutor', 'Delivery Assistant', 'Event Staff', 'Data Entry', 'Research Assistant',
+          'Graphic Designer', 'Social Media Manager', 'Photography Assistant', 'Content Writer',
+          'Web Developer', 'Customer Service Rep', 'Barista', 'Pet Sitter', 'House Cleaner']
+WORDS = ['help', 'with', 'local', 'weekend', 'remote', 'part-time', 'students', 'small', 'business',
+         'marketing', 'support', 'team', 'customers', 'events', 'flexible', 'hours', 'training']
+FIRST_NAMES = ['Alex', 'Jordan', 'Taylor', 'Sam', 'Priya', 'Wei', 'Maria', 'Omar', 'Aisha', 'Lucas',
+               'Mei', 'Diego', 'Fatima', 'Noah', 'Zara', 'Ivan', 'Kofi', 'Hana', 'Leo', 'Nina']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Nguyen', 'Okafor', 'Rossi', 'Cohen',
+              'Silva', 'Ali', 'Novak', 'Haddad', 'Jensen', 'Moreau', 'Tanaka', 'Mensah', 'Lopez']
+COMPANY_WORDS = ['Bright', 'City', 'Hudson', 'Metro', 'Harbor', 'Summit', 'Maple', 'Union',
+                 'Studio', 'Labs', 'Works', 'Kitchen', 'Events', 'Media', 'Care', 'Logistics']
+
+# The share of unresolved locations is only what it claims if the gazetteer really misses them all
+_gazetteer = Gazetteer.from_csv(os.environ.get('WORKMATE_GAZETTEER',
+                                               os.path.join(BACKEND_DIR, 'data', 'gazetteer.csv')))
+_resolved = [location for location in UNRESOLVED_LOCATIONS if _gazetteer.resolve(location) is not None]
+assert not _resolved, 'UNRESOLVED_LOCATIONS resolve in the gazetteer: %s' % ', '.join(_resolved)
+
+
+def _location(rng):
+    # About one location in twelve doesn't resolve, so the fallbacks get exercised
+    return rng.choice(UNRESOLVED_LOCATIONS) if rng.random() < 0.08 else rng.choice(LOCATIONS)
+
+def generate_jobs(count, seed=42, providers=1000, students=10000):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        status = rng.choices(['available', 'applied', 'assigned'], weights=[6, 2, 2])[0]
+        yield {
+            'id': str(i),
+            'title': rng.choice(TITLES),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))),
+            'location': rng.choice(LOCATIONS),
+            'pay': str(rng.randint(12, 60)),
+            'provider_id': str(rng.randint(1, providers)),
+            'status': status,
+            'assigned_student_id': '' if status == 'available' else str(rng.randint(1, students))
+        }
+
+def generate_students(count, seed=43):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        jobs_completed = rng.choices([0, rng.randint(1, 5), rng.randint(6, 40)], weights=[4, 4, 1])[0]
+        yield {
+            'id': str(i),
+            'name': '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+            'email': 'student%d@example.edu' % i,
+            'password': 'password%d' % i,
+            'location': _location(rng),
+            'bio': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+            'rating': str(round(rng.uniform(3, 5), 2)) if jobs_completed else '0',
+            'jobs_completed': str(jobs_completed)
+        }
+
+def generate_providers(count, seed=44):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        company = '%s %s' % (rng.choice(COMPANY_WORDS), rng.choice(COMPANY_WORDS))
+        yield {
+            'id': str(i),
+            'name': '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+            'email': 'provider%d@example.com' % i,
+            'password': 'password%d' % i,
+            'company': company
+        }
+
+def dataset_sizes(jobs, students=None, providers=None):
+    """Default table sizes for a dataset with ``jobs`` jobs: ten jobs per student, a hundred per provider"""
+    return {
+        'jobs': jobs,
+        'students': students if students is not None else max(10, jobs // 10),
+        'providers': providers if providers is not None else max(5, jobs // 100),
+    }
+
+def write_table(path, rows, fieldnames):
+    """Write rows to a CSV as they are generated (a million rows never sit in memory)"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_dataset(data_dir, jobs, students=None, providers=None, seed=42):
+    """Write jobs.csv, students.csv and providers.csv into data_dir; returns the table sizes"""
+    sizes = dataset_sizes(jobs, students, providers)
+    os.makedirs(data_dir, exist_ok=True)
+    write_table(os.path.join(data_dir, 'jobs.csv'),
+                generate_jobs(sizes['jobs'], seed, sizes['providers'], sizes['students']), JOB_FIELDS)
+    write_table(os.path.join(data_dir, 'students.csv'),
+                generate_students(sizes['students'], seed + 1), STUDENT_FIELDS)
+    write_table(os.path.join(data_dir, 'providers.csv'),
+                generate_providers(sizes['providers'], seed + 2), PROVIDER_FIELDS)
+    return sizes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10000)
+    parser.add_argument('--students', type=int)
+    parser.add_argument('--providers', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', required=True, help='directory to write the CSV files to')
+    args = parser.parse_args(argv)
+
+    sizes = write_dataset(args.out, args.jobs, args.students, args.providers, args.seed)
+    print('Wrote %(jobs)d jobs, %(students)d students and %(providers)d providers' % sizes, 'to', args.out)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
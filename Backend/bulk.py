@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+
+# Rows accepted in one upload; larger files should be split
+BULK_MAX_ROWS = int(os.environ.get('WORKMATE_BULK_MAX_ROWS', 10000))
+
+CSV_TYPES = {'text/csv', 'application/csv'}
+JSONL_TYPES = {'application/x-ndjson', 'application/jsonl', 'application/x-jsonlines', 'application/json-lines'}
+JSON_TYPES = {'application/json'}
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'json'}
+
+
+class UploadError(ValueError):
+    """The upload as a whole can't be read (as opposed to a single bad row)"""
+
+
+def upload_format(mimetype, filename=None):
+    """Return 'csv', 'jsonl' or 'json' for an upload, judged by file extension, then media type"""
+    if filename:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in EXTENSIONS:
+            return EXTENSIONS[extension]
+    if mimetype in CSV_TYPES:
+        return 'csv'
+    if mimetype in JSONL_TYPES:
+        return 'jsonl'
+    if mimetype in JSON_TYPES:
+        return 'json'
+    raise UploadError('Unsupported upload type: send CSV, JSON Lines or a JSON array')
+
+def iter_upload(stream, fmt):
+    """
+    Yield (line, row, error) for each record of a binary upload stream
+
+    CSV and JSON Lines are decoded and parsed one record at a time, so the
+    upload is never held in memory as a whole; a JSON array is parsed in one
+    go. ``row`` is None when the record is unusable, with ``error`` saying
+    why. Raises UploadError when the stream as a whole can't be parsed.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                if None in row:
+                    yield reader.line_num, None, 'Row has more cells than the header'
+                else:
+                    yield reader.line_num, row, None
+        elif fmt == 'jsonl':
+            for line_number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_number, None, 'Invalid JSON'
+                    continue
+                if isinstance(row, dict):
+                    yield line_number, row, None
+                else:
+                    yield line_number, None, 'Expected a JSON object'
+        else:
+            try:
+                rows = json.load(text)
+            except ValueError:
+                raise UploadError('Invalid JSON')
+            if not isinstance(rows, list):
+                raise UploadError('Expected a JSON array of objects')
+            for number, row in enumerate(rows, 1):
+                if isinstance(row, dict):
+                    yield number, row, None
+                else:
+                    yield number, None, 'Expected a JSON object'
+    except UnicodeDecodeError:
+        raise UploadError('Upload is not valid UTF-8')
+    except csv.Error as exc:
+        raise UploadError('Malformed CSV: %s' % exc)
+    finally:
+        # Leave the request stream open for the server
+        text.detach()
+
+def text_field(row, field):
+    """Return a field of an uploaded row as stripped text ('' when missing)"""
+    value = row.get(field)
+    if value is None or isinstance(value, (dict, list)):
+        return ''
+    return str(value).strip()
+
+def job_from_upload(row, provider_id=None):
+    """
+    Return (job, error) for one uploaded job row: the new job ready to
+    insert, or None and the reason it was rejected. ``provider_id`` fills
+    in rows that don't name a provider.
+    """
+    job = {
+        'title': text_field(row, 'title'),
+        'description': text_field(row, 'description'),
+        'location': text_field(row, 'location'),
+        'pay': text_field(row, 'pay'),
+        'provider_id': text_field(row, 'provider_id') or (provider_id or ''),
+        'status': 'available',
+        'assigned_student_id': ''
+    }
+    missing = [field for field in ('title', 'location', 'provider_id') if not job[field]]
+    if missing:
+        return None, 'Missing %s' % ', '.join(missing)
+    return job, None
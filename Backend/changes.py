@@ -0,0 +1,339 @@
+import json
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+try:
+    from .store import file_lock
+except ImportError:
+    from store import file_lock
+
+# Recent events kept in memory (and on file) for subscribers resuming after a disconnect
+DEFAULT_CAPACITY = 1000
+# How often waiting streams look for events published by other processes
+POLL_INTERVAL = 0.25
+# Idle streams get a comment line this often, so proxies don't time them out
+KEEPALIVE_INTERVAL = 15.0
+# A subscriber with this much unsent data is dropped; it reconnects and resumes from its last event id
+MAX_BUFFER_BYTES = 1 << 20
+# Reconnection delay suggested to EventSource clients
+RETRY_MS = 3000
+
+KEEPALIVE = b': keep-alive\n\n'
+
+
+def _frame(seq, event_type, data):
+    """One server-sent event"""
+    payload = json.dumps(data, separators=(',', ':'), default=str)
+    return ('id: %d\nevent: %s\ndata: %s\n\n' % (seq, event_type, payload)).encode('utf-8')
+
+def _chunk(data):
+    """``data`` as one HTTP/1.1 chunk (the stream's Transfer-Encoding)"""
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+
+class ChangeFeed:
+    """
+    Numbered job change events, shared by every process using ``path``
+
+    ``publish`` takes the file lock, numbers the events after the last one
+    on file and appends them as JSON lines; every process follows the file
+    (a stat, plus reading just the new lines) so sequence numbers are the same
+    whichever worker a client reconnects to. The last ``capacity`` events are
+    kept in a ring buffer, each already encoded as a server-sent event, so
+    replaying them to a resuming client costs no serialization; the file is
+    cut back to the same window once it holds twice as many.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.capacity = capacity
+        self._changed = threading.Condition(threading.RLock())
+        self._events = deque(maxlen=capacity)   # (seq, frame)
+        self._seq = 0
+        self._offset = 0
+        self._lines = 0
+        self._signature = None
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _catch_up(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        if signature is None or self._signature is None or signature[0] != self._signature[0] \
+                or signature[1] < self._offset:
+            # New or cut-back file: read it again; events already held are skipped by number
+            self._offset = 0
+            self._lines = 0
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        # A torn last line (writer crashed mid-append) is dropped by the next publish
+        end = data.rfind(b'\n') + 1
+        added = False
+        for line in data[:end].splitlines():
+            self._lines += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record['seq'] > self._seq:
+                self._append(record)
+                added = True
+        self._offset += end
+        self._signature = signature
+        if added:
+            self._changed.notify_all()
+
+    def _append(self, record):
+        self._seq = record['seq']
+        self._events.append((record['seq'], _frame(record['seq'], record['type'], record['data'])))
+
+    def refresh(self):
+        """Pick up events published by other processes"""
+        with self._changed:
+            self._catch_up()
+
+    @property
+    def last_seq(self):
+        with self._changed:
+            self._catch_up()
+            return self._seq
+
+    def publish(self, events):
+        """
+        Append ``events`` ((type, data) pairs) to the feed; returns their
+        sequence numbers. Best effort: a failure is the feed's problem, not
+        the mutation's, so callers publish after their write has committed.
+        """
+        if not events:
+            return []
+        with file_lock(self.lock_path):
+            with self._changed:
+                self._catch_up()
+                signature = self._file_signature()
+                if signature is not None and signature[1] > self._offset:
+                    os.truncate(self.path, self._offset)
+                records = []
+                for event_type, data in events:
+                    records.append({'seq': self._seq + len(records) + 1, 'type': event_type, 'data': data,
+                                    'time': round(time.time(), 3)})
+                payload = b''.join(json.dumps(record, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+                                   for record in records)
+                with open(self.path, 'ab') as f:
+                    f.write(payload)
+                self._offset += len(payload)
+                self._lines += len(records)
+                for record in records:
+                    self._append(record)
+                if self._lines > 2 * self.capacity:
+                    self._cut_back()
+                self._signature = self._file_signature()
+                self._changed.notify_all()
+                return [record['seq'] for record in records]
+
+    def _cut_back(self):
+        # Keep the ring buffer's window on file (the records themselves are re-read from it)
+        with open(self.path, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)[-self.capacity:]
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._offset = sum(len(line) for line in lines)
+        self._lines = len(lines)
+
+    def frames_since(self, seq):
+        """
+        (bytes of every event after ``seq``, number of the last one). When
+        events after ``seq`` have already left the ring buffer, or ``seq`` is
+        from before the feed was reset, a single ``reset`` event tells the
+        client to re-read the job lists instead.
+        """
+        with self._changed:
+            self._catch_up()
+            if seq == self._seq:
+                return b'', seq
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            if seq > self._seq or seq < oldest - 1:
+                return _frame(self._seq, 'reset', {'seq': self._seq}), self._seq
+            return b''.join(frame for _, frame in islice(self._events, seq - oldest + 1, None)), self._seq
+
+    def wait(self, seq, timeout):
+        """Block until there are events after ``seq`` or ``timeout`` seconds pass"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                self._catch_up()
+                remaining = deadline - time.monotonic()
+                if self._seq != seq or remaining <= 0:
+                    return
+                self._changed.wait(min(remaining, POLL_INTERVAL))
+
+
+class _Subscriber:
+    __slots__ = ('connection', 'seq', 'buffer', 'last_write')
+
+    def __init__(self, connection, seq):
+        self.connection = connection
+        self.seq = seq
+        self.buffer = bytearray()
+        self.last_write = time.monotonic()
+
+
+class StreamHub:
+    """
+    Serves every change stream handed over to it from one thread
+
+    A request thread only sends the response headers and the replayed
+    events, then gives the connection to the hub (see ``event_stream``) and
+    goes back to the pool. The hub waits on all connections with one
+    selector, copies each new event's pre-encoded frame into the buffers of
+    the subscribers that haven't had it and writes without blocking, so
+    thousands of idle subscribers cost a socket and a small buffer each, not
+    a thread. The thread is started on first use in each process (after the
+    pre-fork server has forked).
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self._lock = threading.Lock()
+        self._pending = []
+        self._subscribers = {}
+        self._pid = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, connection, seq):
+        """Stream events after ``seq`` to ``connection`` (already sent the response headers)"""
+        connection.setblocking(False)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            self._pending.append(_Subscriber(connection, seq))
+        self.wake()
+
+    def wake(self):
+        """Send events published by this process now rather than at the next poll"""
+        if self._pid == os.getpid():
+            try:
+                self._wake_writer.send(b'\0')
+            except BlockingIOError:
+                pass  # a wake-up is already pending
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._subscribers = {}
+        self._selector = selectors.DefaultSelector()
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ)
+        threading.Thread(target=self._run, name='workmate-changes', daemon=True).start()
+
+    def _run(self):
+        while True:
+            for key, mask in self._selector.select(POLL_INTERVAL):
+                if key.data is None:
+                    try:
+                        self._wake_reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self._read(key.data)
+                if mask & selectors.EVENT_WRITE and key.data.connection.fileno() in self._subscribers:
+                    self._flush(key.data)
+            with self._lock:
+                pending, self._pending = self._pending, []
+            for subscriber in pending:
+                self._subscribers[subscriber.connection.fileno()] = subscriber
+                self._selector.register(subscriber.connection, selectors.EVENT_READ, subscriber)
+            self._broadcast()
+
+    def _broadcast(self):
+        last = self.feed.last_seq
+        now = time.monotonic()
+        frames = {}
+        for subscriber in list(self._subscribers.values()):
+            if subscriber.seq != last:
+                # Subscribers are mostly at the same position: encode each backlog once
+                if subscriber.seq not in frames:
+                    frames[subscriber.seq] = _chunk(self.feed.frames_since(subscriber.seq)[0])
+                subscriber.buffer += frames[subscriber.seq]
+                subscriber.seq = last
+            elif not subscriber.buffer and now - subscriber.last_write >= KEEPALIVE_INTERVAL:
+                subscriber.buffer += _chunk(KEEPALIVE)
+            if subscriber.buffer:
+                self._flush(subscriber)
+
+    def _read(self, subscriber):
+        # Clients send nothing after the request; readable means closed (or garbage)
+        try:
+            data = subscriber.connection.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(subscriber)
+
+    def _flush(self, subscriber):
+        try:
+            sent = subscriber.connection.send(subscriber.buffer)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(subscriber)
+            return
+        if sent:
+            del subscriber.buffer[:sent]
+            subscriber.last_write = time.monotonic()
+        if len(subscriber.buffer) > MAX_BUFFER_BYTES:
+            self._close(subscriber)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.buffer else 0)
+        if self._selector.get_key(subscriber.connection).events != events:
+            self._selector.modify(subscriber.connection, events, subscriber)
+
+    def _close(self, subscriber):
+        self._subscribers.pop(subscriber.connection.fileno(), None)
+        try:
+            self._selector.unregister(subscriber.connection)
+        except (KeyError, ValueError):
+            pass
+        subscriber.connection.close()
+
+
+def event_stream(feed, seq, hub=None, detach=None):
+    """
+    Body of a ``text/event-stream`` response: the events after ``seq``, then
+    new ones as they are published. With a hub and a ``detach`` callable (the
+    pre-fork server puts one in the WSGI environ as ``workmate.detach``) the
+    connection is handed over to the hub after the replay; otherwise this
+    generator keeps the request's thread and streams itself.
+    """
+    frames, seq = feed.frames_since(seq)
+    yield b'retry: %d\n\n' % RETRY_MS + frames
+    if hub is not None and detach is not None:
+        hub.subscribe(detach(), seq)
+        return
+    while True:
+        feed.wait(seq, KEEPALIVE_INTERVAL)
+        frames, seq = feed.frames_since(seq)
+        yield frames or KEEPALIVE
@@ -0,0 +1,276 @@
+import bisect
+import threading
+
+import numpy as np
+
+try:
+    from .algorithms import parse_pay
+    from .geo import normalize_location
+    from .pagination import row_id
+except ImportError:
+    from algorithms import parse_pay
+    from geo import normalize_location
+    from pagination import row_id
+
+# Fields a listing can be filtered on by value (any of several values per field)
+FACETS = ('location', 'provider_id', 'status')
+# Everything a job has a bitmap for, in the order of the per-slot value tuples
+_BITMAPS = FACETS + ('pay', 'pay_bucket')
+# Job fields the bitmaps are built from
+FIELDS = FACETS + ('pay',)
+# Lower bounds of the pay ranges counted in the ``pay`` facet
+PAY_BUCKETS = (0, 10, 15, 20, 25, 30, 40, 50)
+# Counting a job's value in Python costs about as much as ANDing this many bitmap bits
+TALLY_FACTOR = 4096
+INITIAL_CAPACITY = 64
+
+
+def pay_bucket(pay):
+    """Label of the PAY_BUCKETS range ``pay`` falls in, e.g. '20-25' or '50+'"""
+    index = max(bisect.bisect_right(PAY_BUCKETS, pay) - 1, 0)
+    if index == len(PAY_BUCKETS) - 1:
+        return '%d+' % PAY_BUCKETS[index]
+    return '%d-%d' % (PAY_BUCKETS[index], PAY_BUCKETS[index + 1])
+
+if hasattr(int, 'bit_count'):
+    def popcount(bitmap):
+        """Number of set bits in ``bitmap``"""
+        return bitmap.bit_count()
+else:
+    # int.bit_count is new in Python 3.10
+    def popcount(bitmap):
+        """Number of set bits in ``bitmap``"""
+        return bin(bitmap).count('1')
+
+def _bitmap_of(slots):
+    """Bitmap (a Python int) with the bits of ``slots`` set"""
+    bits = np.zeros(max(slots) + 1, dtype=bool)
+    bits[slots] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+def _slots_in(bitmap):
+    """Positions of the set bits of ``bitmap``, ascending"""
+    if not bitmap:
+        return np.zeros(0, dtype=np.int64)
+    data = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder='little'))
+
+
+class FacetIndex:
+    """
+    Bitmap indexes over job facets, for filtered listings with facet counts
+
+    Every job gets a slot number, and every value of a facet (normalized
+    location, provider, status, and each distinct pay) a bitmap of the slots
+    holding it, kept as a Python int and updated from the store's change
+    events. A filter ORs the bitmaps of the values asked for within a facet
+    (a pay range: the distinct pays between its bounds, found by bisect in
+    their sorted list) and ANDs the facets together; the count of each
+    facet value is the popcount of its bitmap ANDed with the other facets'
+    filters, so the counts say what picking that value instead would return.
+    When few jobs are left to count, their values are tallied one slot at a
+    time instead. Only the page of matching jobs is ever read from the store.
+    Time Complexity: O(min(v * n / 64, k)) word operations per facet for v
+    facet values, n jobs and k matches, plus O(k log k) to order the matches,
+    instead of reading every row
+    """
+
+    def __init__(self, key='id'):
+        self.key = key
+        self._lock = threading.RLock()
+        self._store = None
+        self._clear()
+
+    def _clear(self, capacity=INITIAL_CAPACITY):
+        self._numbers = np.zeros(capacity, dtype=np.int64)   # slot -> numeric id, for id order
+        self._keys = [None] * capacity                        # slot -> job id
+        self._values = [None] * capacity                      # slot -> (location, provider, status, pay, pay range)
+        self._slots = {}        # job id -> slot
+        self._free = []         # slots of removed jobs, reused first so bitmaps stay short
+        self._active = 0        # bitmap of used slots
+        self._bitmaps = {facet: {} for facet in _BITMAPS}
+        self._labels = {}       # normalized location -> location as first written
+        self._pays = []         # distinct pay values, sorted
+
+    # Maintenance
+    def attach(self, store):
+        """Index every row of ``store`` and follow its changes from now on"""
+        self._store = store
+        store.refresh()
+        store.add_listener(self._on_change)
+        self.rebuild(store.summaries(FIELDS))
+
+    def rebuild(self, rows):
+        with self._lock:
+            rows = list(rows)
+            self._clear(max(INITIAL_CAPACITY, len(rows)))
+            # Slots in row order, and each bitmap built once from all of its slots
+            slots_by_value = {facet: {} for facet in _BITMAPS}
+            for slot, row in enumerate(rows):
+                job_id = row[self.key]
+                if job_id in self._slots:
+                    continue
+                values = self._row_values(row)
+                for facet, value in zip(_BITMAPS, values):
+                    slots_by_value[facet].setdefault(value, []).append(slot)
+                self._numbers[slot] = row_id(row)
+                self._keys[slot] = job_id
+                self._values[slot] = values
+                self._slots[job_id] = slot
+            for facet, values in slots_by_value.items():
+                self._bitmaps[facet] = {value: _bitmap_of(slots) for value, slots in values.items()}
+            self._pays = sorted(self._bitmaps['pay'])
+            self._free = [slot for slot in range(len(rows)) if self._keys[slot] is None]
+            self._active = _bitmap_of(list(self._slots.values())) if self._slots else 0
+
+    def _on_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(self._store.summaries(FIELDS))
+            return
+        with self._lock:
+            if old_row is not None:
+                self.remove(old_row[self.key])
+            if new_row is not None:
+                self.add(new_row)
+
+    def _grow(self):
+        capacity = len(self._keys) * 2
+        numbers = np.zeros(capacity, dtype=np.int64)
+        numbers[:len(self._numbers)] = self._numbers
+        self._numbers = numbers
+        self._keys.extend([None] * (capacity - len(self._keys)))
+        self._values.extend([None] * (capacity - len(self._values)))
+
+    def _row_values(self, row):
+        location = row.get('location') or ''
+        place = normalize_location(location)
+        if place and place not in self._labels:
+            self._labels[place] = location.strip()
+        pay = parse_pay(row.get('pay'))
+        return (place, row.get('provider_id') or '', row.get('status') or '', pay, pay_bucket(pay))
+
+    def add(self, row):
+        with self._lock:
+            job_id = row[self.key]
+            self.remove(job_id)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._slots)
+                if slot == len(self._keys):
+                    self._grow()
+            values = self._row_values(row)
+            bit = 1 << slot
+            for facet, value in zip(_BITMAPS, values):
+                bitmaps = self._bitmaps[facet]
+                if facet == 'pay' and value not in bitmaps:
+                    bisect.insort(self._pays, value)
+                bitmaps[value] = bitmaps.get(value, 0) | bit
+            self._active |= bit
+            self._numbers[slot] = row_id(row)
+            self._keys[slot] = job_id
+            self._values[slot] = values
+            self._slots[job_id] = slot
+
+    def remove(self, job_id):
+        with self._lock:
+            slot = self._slots.pop(job_id, None)
+            if slot is None:
+                return
+            bit = 1 << slot
+            for facet, value in zip(_BITMAPS, self._values[slot]):
+                bitmaps = self._bitmaps[facet]
+                bitmaps[value] ^= bit
+                if not bitmaps[value]:
+                    del bitmaps[value]
+                    if facet == 'pay':
+                        del self._pays[bisect.bisect_left(self._pays, value)]
+                    elif facet == 'location':
+                        self._labels.pop(value, None)
+            self._active ^= bit
+            self._keys[slot] = None
+            self._values[slot] = None
+            self._free.append(slot)
+
+    def __len__(self):
+        return len(self._slots)
+
+    # Queries
+    def _mask(self, facet, values):
+        bitmaps = self._bitmaps[facet]
+        if facet == 'location':
+            values = [normalize_location(value) for value in values]
+        mask = 0
+        for value in values:
+            mask |= bitmaps.get(value, 0)
+        return mask
+
+    def _pay_mask(self, pay_min, pay_max):
+        low = 0 if pay_min is None else bisect.bisect_left(self._pays, pay_min)
+        high = len(self._pays) if pay_max is None else bisect.bisect_right(self._pays, pay_max)
+        mask = 0
+        for pay in self._pays[low:high]:
+            mask |= self._bitmaps['pay'][pay]
+        return mask
+
+    def _counts(self, facet, base):
+        bitmaps = self._bitmaps[facet]
+        counts = {}
+        if popcount(base) * TALLY_FACTOR < len(bitmaps) * base.bit_length():
+            # Few jobs left against many values: tally the jobs' own values
+            position = _BITMAPS.index(facet)
+            for slot in _slots_in(base).tolist():
+                value = self._values[slot][position]
+                counts[value] = counts.get(value, 0) + 1
+        else:
+            for value, bitmap in bitmaps.items():
+                count = popcount(bitmap & base)
+                if count:
+                    counts[value] = count
+        if facet == 'location':
+            return {self._labels.get(value, value): count for value, count in counts.items()}
+        return counts
+
+    def search(self, filters=None, pay_min=None, pay_max=None, after=None, limit=None):
+        """
+        Filter on ``filters`` ({facet: values}, a job matching any of a
+        facet's values) and the pay range [``pay_min``, ``pay_max``] (either
+        bound optional). Returns (rows, total, facets, next_id): up to
+        ``limit`` matching rows in id order after the numeric id ``after``,
+        how many match in all, {facet: {value: count}} for FACETS plus
+        ``pay`` (by PAY_BUCKETS range), and the id to continue from or None
+        on the last page.
+        """
+        filters = {facet: list(values) for facet, values in (filters or {}).items() if values}
+        unknown = set(filters) - set(FACETS)
+        if unknown:
+            raise ValueError('Unknown facet %r (expected one of %s)' % (sorted(unknown)[0], ', '.join(FACETS)))
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            masks = {facet: self._mask(facet, values) for facet, values in filters.items()}
+            if pay_min is not None or pay_max is not None:
+                masks['pay'] = self._pay_mask(pay_min, pay_max)
+
+            def matching(excluded=None):
+                mask = self._active
+                for facet, facet_mask in masks.items():
+                    if facet != excluded:
+                        mask &= facet_mask
+                return mask
+
+            selected = matching()
+            facets = {facet: self._counts(facet, matching(facet)) for facet in FACETS}
+            buckets = self._counts('pay_bucket', matching('pay'))
+            facets['pay'] = {label: buckets[label] for label in map(pay_bucket, PAY_BUCKETS) if label in buckets}
+
+            slots = _slots_in(selected)
+            numbers = self._numbers[slots]
+            order = np.argsort(numbers, kind='stable')
+            start = 0 if after is None else int(np.searchsorted(numbers[order], after, side='right'))
+            end = len(order) if limit is None else min(start + limit, len(order))
+            keys = [self._keys[slot] for slot in slots[order[start:end]]]
+            next_id = int(numbers[order[end - 1]]) if end < len(order) and end > start else None
+        # Rows are read outside the lock: the store's listeners take it too
+        rows = [row for row in map(self._store.get, keys) if row is not None]
+        return rows, len(slots), facets, next_id
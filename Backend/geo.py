@@ -0,0 +1,244 @@
+import csv
+import heapq
+import math
+import re
+import threading
+
+try:
+    from .pagination import row_id
+except ImportError:
+    from pagination import row_id
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def normalize_location(name):
+    """Lowercase a free-text location and collapse punctuation and whitespace"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).split())
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def _to_unit_vector(lat, lon):
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class Gazetteer:
+    """
+    Offline place-name lookup backed by a CSV of name, lat, lon and
+    '|'-separated aliases. Unknown names resolve to None.
+    """
+
+    def __init__(self, places=None):
+        self._places = {}
+        for name, lat, lon in places or ():
+            self.add(name, lat, lon)
+
+    @classmethod
+    def from_csv(cls, path):
+        gazetteer = cls()
+        try:
+            with open(path, 'r', newline='') as f:
+                for row in csv.DictReader(f):
+                    try:
+                        lat, lon = float(row['lat']), float(row['lon'])
+                    except (TypeError, ValueError):
+                        continue
+                    gazetteer.add(row['name'], lat, lon)
+                    for alias in (row.get('aliases') or '').split('|'):
+                        if alias.strip():
+                            gazetteer.add(alias, lat, lon)
+        except FileNotFoundError:
+            pass
+        return gazetteer
+
+    def add(self, name, lat, lon):
+        self._places[normalize_location(name)] = (lat, lon)
+
+    def resolve(self, location):
+        """Return (lat, lon) for a location, trying 'Brooklyn, NY' style prefixes too"""
+        key = normalize_location(location)
+        if key in self._places:
+            return self._places[key]
+        head = (location or '').split(',')[0]
+        return self._places.get(normalize_location(head))
+
+    def __len__(self):
+        return len(self._places)
+
+
+class KDTree:
+    """
+    Static 3-d tree over points on the unit sphere
+
+    Points are stored as unit vectors so straight-line (chord) distance orders
+    them exactly like great-circle distance.
+    Time Complexity: O(P log P) build, nearest-first iteration visits only
+    the nodes whose bounding box is closer than the current result
+    """
+
+    def __init__(self, points):
+        # points: iterable of (key, lat, lon)
+        items = [(_to_unit_vector(lat, lon), key) for key, lat, lon in points]
+        self._root = self._build(items, 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        mid = len(items) // 2
+        lows = tuple(min(item[0][d] for item in items) for d in range(3))
+        highs = tuple(max(item[0][d] for item in items) for d in range(3))
+        return (items[mid], lows, highs,
+                self._build(items[:mid], depth + 1), self._build(items[mid + 1:], depth + 1))
+
+    @staticmethod
+    def _box_distance(q, lows, highs):
+        total = 0.0
+        for d in range(3):
+            if q[d] < lows[d]:
+                total += (lows[d] - q[d]) ** 2
+            elif q[d] > highs[d]:
+                total += (q[d] - highs[d]) ** 2
+        return math.sqrt(total)
+
+    def iter_nearest(self, lat, lon, max_km=None):
+        """Yield (distance_km, key) in increasing distance, up to max_km"""
+        if self._root is None:
+            return
+        q = _to_unit_vector(lat, lon)
+        max_chord = _km_to_chord(max_km) if max_km is not None else math.inf
+        counter = 0
+        heap = [(0.0, counter, 'node', self._root)]
+        while heap:
+            distance, _, kind, payload = heapq.heappop(heap)
+            if distance > max_chord:
+                return
+            if kind == 'point':
+                yield _chord_to_km(distance), payload
+                continue
+            (vector, key), _, _, left, right = payload
+            counter += 1
+            heapq.heappush(heap, (math.dist(q, vector), counter, 'point', key))
+            for child in (left, right):
+                if child is not None:
+                    counter += 1
+                    heapq.heappush(heap, (self._box_distance(q, child[1], child[2]), counter, 'node', child))
+
+
+class SpatialJobIndex:
+    """
+    Spatial index over jobs whose location resolves in the gazetteer
+
+    Jobs are bucketed by resolved coordinate; the KD-tree over the distinct
+    coordinates is rebuilt lazily when a new place appears. Jobs whose
+    location does not resolve are kept aside for the string-distance fallback.
+    """
+
+    def __init__(self, gazetteer, where=None, key='id'):
+        self.gazetteer = gazetteer
+        self.where = where
+        self.key = key
+        self._lock = threading.RLock()
+        self._store = None
+        self._clear()
+
+    def _clear(self):
+        self._buckets = {}      # (lat, lon) -> {job_id: (numeric id, row)}
+        self._job_points = {}   # job_id -> (lat, lon) or None when unresolved
+        self._unresolved = {}   # job_id -> (numeric id, row)
+        self._tree = None
+
+    def attach(self, store):
+        self._store = store
+        store.refresh()
+        store.add_listener(self._on_change)
+        self.rebuild(store.all())
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._clear()
+            for row in rows:
+                self.add(row)
+
+    def _on_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(self._store.all())
+            return
+        with self._lock:
+            if old_row is not None:
+                self.remove(old_row[self.key])
+            if new_row is not None:
+                self.add(new_row)
+
+    def add(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        with self._lock:
+            job_id = row[self.key]
+            self.remove(job_id)
+            point = self.gazetteer.resolve(row.get('location'))
+            # Ties at one point come out in id order, stable across updates
+            entry = (row_id(row), row)
+            self._job_points[job_id] = point
+            if point is None:
+                self._unresolved[job_id] = entry
+                return
+            if point not in self._buckets:
+                self._buckets[point] = {}
+                self._tree = None
+            self._buckets[point][job_id] = entry
+
+    def remove(self, job_id):
+        with self._lock:
+            if job_id not in self._job_points:
+                return
+            point = self._job_points.pop(job_id)
+            if point is None:
+                self._unresolved.pop(job_id, None)
+                return
+            bucket = self._buckets[point]
+            bucket.pop(job_id, None)
+            if not bucket:
+                del self._buckets[point]
+                self._tree = None
+
+    def unresolved_jobs(self):
+        with self._lock:
+            return [row for _, row in sorted(self._unresolved.values(), key=lambda entry: entry[0])]
+
+    def nearest(self, lat, lon, k=5, radius_km=None):
+        """
+        Return up to k (distance_km, job) pairs nearest to (lat, lon),
+        optionally limited to radius_km. Stops as soon as k jobs are found.
+        """
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            if self._tree is None:
+                self._tree = KDTree((point, point[0], point[1]) for point in self._buckets)
+            results = []
+            for distance, point in self._tree.iter_nearest(lat, lon, radius_km):
+                entries = self._buckets[point].values()
+                needed = k - len(results)
+                if len(entries) > needed:
+                    entries = heapq.nsmallest(needed, entries, key=lambda entry: entry[0])
+                else:
+                    entries = sorted(entries, key=lambda entry: entry[0])
+                results.extend((distance, row) for _, row in entries)
+                if len(results) >= k:
+                    break
+            return results
@@ -0,0 +1,65 @@
+import gzip
+import os
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+# Bodies smaller than this are sent as they are: gzip wouldn't pay for itself
+GZIP_MIN_BYTES = int(os.environ.get('WORKMATE_GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+
+
+def conditional(*stores):
+    """
+    Decorate a GET view with validators derived from the data versions of
+    the stores it reads
+
+    A request whose If-None-Match (or, without one, If-Modified-Since) still
+    matches is answered with 304 before the view runs, so no rows are read or
+    serialized. The versions are taken before the view runs: a write that
+    lands in between only costs the client one more full response later.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = [store.data_version() for store in stores]
+            etag = '.'.join(token for token, _ in versions)
+            # HTTP dates have one-second resolution
+            modified = int(max(modified for _, modified in versions))
+
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                fresh = since is not None and modified <= since.timestamp()
+
+            if fresh:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # Weak: the gzip and identity encodings of a body share the tag
+            response.set_etag(etag, weak=True)
+            if time.time() >= modified + 1:
+                # Only once that second is over can no later change share its date
+                response.last_modified = modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+def gzip_response(response):
+    """after_request hook: gzip JSON bodies of at least GZIP_MIN_BYTES when the client accepts it"""
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip'] or response.content_length is None:
+        return response
+    if response.content_length < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+try:
+    from .metrics import record_io
+except ImportError:
+    from metrics import record_io
+
+
+class Journal:
+    """
+    Append-only mutation log that sits beside a CSV snapshot
+
+    One JSON record per line: ``{"seq": n, "op": "insert"|"update"|"delete", ...}``.
+    Records are idempotent (inserts are upserts, updates set fields), so
+    replaying the log over any snapshot taken while it was being written
+    yields the same state. After compaction the log restarts with a single
+    ``{"op": "base", "seq": n, "max_id": m}`` record carrying the sequence and
+    the id high-water mark forward.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def signature(self):
+        """(inode, size) of the log file, or None if it does not exist"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def read(self, offset=0):
+        """
+        Return (records, end_offset) for the complete lines after ``offset``.
+        A torn last line (crash mid-append) is left for a later read.
+        """
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1
+        records = []
+        for line in data[:end].splitlines():
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Skip a corrupt line rather than refusing to start
+                    continue
+        if end:
+            record_io(self.path, 'read', len(records), end, time.perf_counter() - started)
+        return records, offset + end
+
+    def append(self, records):
+        """Durably append records; returns the new end offset"""
+        started = time.perf_counter()
+        payload = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            end = f.tell()
+        record_io(self.path, 'append', len(records), len(payload), time.perf_counter() - started)
+        return end
+
+    def restart(self, base_seq, tail=b'', max_id=None):
+        """
+        Atomically replace the log with a base record followed by ``tail``
+        (raw bytes of records written after the snapshot was taken).
+        ``max_id`` is the id high-water mark, kept so deleted ids aren't reused.
+        Returns the offset just past the base record.
+        """
+        record = {'seq': base_seq, 'op': 'base'}
+        if max_id is not None:
+            record['max_id'] = max_id
+        base = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(base + tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(base)
+
+    def read_bytes(self, offset):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read()
+        except FileNotFoundError:
+            return b''
@@ -0,0 +1,181 @@
+import threading
+
+try:
+    from .algorithms import levenshtein_distance
+    from .geo import normalize_location
+except ImportError:
+    from algorithms import levenshtein_distance
+    from geo import normalize_location
+
+# Suggestions returned by LocationIndex.suggest unless asked for more
+SUGGESTION_LIMIT = 5
+
+
+def typo_budget(place):
+    """Edits tolerated in a normalized location: none for very short names, two for long ones"""
+    if len(place) < 4:
+        return 0
+    return 1 if len(place) < 8 else 2
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over strings under Levenshtein distance
+
+    Each node's children are keyed by their distance to it. By the triangle
+    inequality, every word within ``max_distance`` of a query lies under a
+    child whose key is within ``max_distance`` of the query's distance to the
+    node, so the other subtrees are never visited. Words can be added at any
+    time; there is no removal (LocationIndex keeps unused words and skips them).
+    Time Complexity: O(depth) distance computations per add; a search visits
+    a small fraction of the words for small distances
+    """
+
+    def __init__(self, words=()):
+        self._root = None    # [word, {distance: child}]
+        self._size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        """Add ``word``; returns False if it was already there"""
+        if self._root is None:
+            self._root = [word, {}]
+            self._size = 1
+            return True
+        node = self._root
+        while True:
+            distance = levenshtein_distance(word, node[0])
+            if distance == 0:
+                return False
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self._size += 1
+                return True
+            node = child
+
+    def search(self, word, max_distance):
+        """(distance, word) for every word within ``max_distance`` of ``word``, closest first"""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = levenshtein_distance(word, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0]))
+            for edge, child in node[1].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+    def __len__(self):
+        return self._size
+
+
+class LocationIndex:
+    """
+    Distinct normalized locations of a table's rows in a BK-tree, with the
+    number of rows using each
+
+    Backs typo-tolerant location filters (``expand``) and "did you mean"
+    suggestions (``suggest``) without comparing the query against every row.
+    New locations are added to the tree as rows come in through the store's
+    change events; a location no row uses any more stays in the tree with a
+    count of zero and is left out of results until it is used again.
+    """
+
+    def __init__(self, field='location', key='id'):
+        self.field = field
+        self.key = key
+        self._lock = threading.RLock()
+        self._store = None
+        self._clear()
+
+    def _clear(self):
+        self._tree = BKTree()
+        self._counts = {}     # normalized location -> rows using it
+        self._labels = {}     # normalized location -> location as first written
+        self._place_of = {}   # row id -> normalized location
+
+    # Maintenance
+    def attach(self, store):
+        """Index every row of ``store`` and follow its changes from now on"""
+        self._store = store
+        store.refresh()
+        store.add_listener(self._on_change)
+        self.rebuild(store.summaries((self.field,)))
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._clear()
+            for row in rows:
+                self.add(row)
+
+    def _on_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(self._store.summaries((self.field,)))
+            return
+        with self._lock:
+            if old_row is not None:
+                self.remove(old_row[self.key])
+            if new_row is not None:
+                self.add(new_row)
+
+    def add(self, row):
+        with self._lock:
+            self.remove(row[self.key])
+            location = row.get(self.field) or ''
+            place = normalize_location(location)
+            if not place:
+                return
+            if place not in self._counts:
+                self._tree.add(place)
+                self._counts[place] = 0
+            if not self._counts[place]:
+                self._labels[place] = location.strip()
+            self._counts[place] += 1
+            self._place_of[row[self.key]] = place
+
+    def remove(self, row_id):
+        with self._lock:
+            place = self._place_of.pop(row_id, None)
+            if place is not None:
+                self._counts[place] -= 1
+
+    def __len__(self):
+        return sum(1 for count in self._counts.values() if count)
+
+    # Queries
+    def similar(self, location, max_distance=None):
+        """
+        (normalized location, distance, rows) for the locations in use within
+        ``max_distance`` edits of ``location`` (by default its typo_budget),
+        closest first, then most used
+        """
+        place = normalize_location(location)
+        if not place:
+            return []
+        if max_distance is None:
+            max_distance = typo_budget(place)
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            found = [(match, distance, self._counts[match])
+                     for distance, match in self._tree.search(place, max_distance) if self._counts[match]]
+        return sorted(found, key=lambda item: (item[1], -item[2], item[0]))
+
+    def expand(self, location, max_distance=None):
+        """Normalized locations in use that ``location`` could be a misspelling of, itself included"""
+        return {match for match, _, _ in self.similar(location, max_distance)}
+
+    def suggest(self, location, limit=SUGGESTION_LIMIT, max_distance=None):
+        """
+        "Did you mean" candidates for ``location``: [{location, distance,
+        count}] for the closest locations in use other than itself
+        """
+        place = normalize_location(location)
+        matches = [item for item in self.similar(location, max_distance) if item[0] != place][:limit]
+        with self._lock:
+            return [{'location': self._labels.get(match, match), 'distance': distance, 'count': count}
+                    for match, distance, count in matches]
@@ -0,0 +1,399 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+# Latency buckets in seconds, from sub-millisecond index lookups to full-table work
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Per-process temporary copies written before a rename (e.g. jobs.csv.1234.tmp)
+_TEMP_SUFFIX = re.compile(r'\.\d+\.tmp$')
+# Metric types summed over processes sharing a directory (see Registry.share); gauges stay per process
+SHARED_TYPES = ('counter', 'histogram')
+# Least time between two writes of a process's metrics to the shared directory
+PUBLISH_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+def _add(total, value):
+    """Sum of two values of a shared metric: numbers, or [bucket counts, sum, count] of histograms"""
+    if total is None:
+        return value
+    if isinstance(value, list):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+    return total + value
+
+def _subtract(value, base):
+    if base is None:
+        return value
+    if isinstance(value, list):
+        return [[a - b for a, b in zip(value[0], base[0])], value[1] - base[1], value[2] - base[2]]
+    return value - base
+
+def _merge(totals, state):
+    """Add ``state`` ({name: [[label values, value], ...]}, as published) into ``totals``"""
+    for name, items in state.items():
+        series = totals.setdefault(name, {})
+        for values, value in items:
+            values = tuple(values)
+            series[values] = _add(series.get(values), value)
+    return totals
+
+def _serialize(totals):
+    return {name: [[list(values), value] for values, value in sorted(series.items())]
+            for name, series in totals.items()}
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    # Written aside and renamed, so readers never see half a file
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temporary, path)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+class Registry:
+    """
+    Metrics of one process, rendered in the Prometheus text exposition format
+
+    The processes of the pre-fork server share a directory (``share``):
+    each one writes the counters and histograms it recorded to
+    ``<pid>.json`` there at most every PUBLISH_INTERVAL, and any of them
+    renders the sums over all the files, so the series stay monotonic
+    whichever worker a scrape lands on. The master folds the files of
+    workers that exited into ``retired.json``. Gauges are rendered from the
+    process answering the scrape.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self._directory = None
+        self._baseline = {}     # name -> {label values: value} inherited from the parent process
+        self._published = 0.0
+        self._retired = None    # master only: {'pids': [...], 'totals': {name: {label values: value}}}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def _shared_metrics(self):
+        with self._lock:
+            return [metric for metric in self._metrics if metric.type_name in SHARED_TYPES]
+
+    # Sharing between processes
+    def share(self, directory):
+        """Aggregate counters and histograms over every process publishing to ``directory``"""
+        self._directory = directory
+        self._published = 0.0
+        self.publish(force=True)
+
+    def forked(self):
+        """
+        In a newly forked child of a sharing process: publish only what is
+        recorded from now on, since the parent's own file has the rest
+        """
+        if self._directory is None:
+            return
+        self._baseline = {metric.name: dict(metric.collect()) for metric in self._shared_metrics()}
+        self._retired = None
+        self._published = 0.0
+        self.publish(force=True)
+
+    def _state(self):
+        state = {}
+        for metric in self._shared_metrics():
+            base = self._baseline.get(metric.name, {})
+            state[metric.name] = [[list(values), _subtract(value, base.get(values))]
+                                  for values, value in metric.collect()]
+        return state
+
+    def publish(self, force=False):
+        """Write this process's counters and histograms to the shared directory (if due, or ``force``)"""
+        if self._directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._published < PUBLISH_INTERVAL:
+            return
+        self._published = now
+        _write_json(os.path.join(self._directory, '%d.json' % os.getpid()), self._state())
+
+    def retire(self, pid):
+        """In the master: fold the file of the exited process ``pid`` into retired.json"""
+        if self._directory is None:
+            return
+        path = os.path.join(self._directory, '%d.json' % pid)
+        try:
+            state = _read_json(path)
+        except (FileNotFoundError, ValueError):
+            return
+        if self._retired is None:
+            self._retired = {'pids': [], 'totals': {}}
+        self._retired['pids'].append(pid)
+        _merge(self._retired['totals'], state)
+        # retired.json names the pids it covers, so readers skip their files until they are gone
+        _write_json(os.path.join(self._directory, 'retired.json'),
+                    {'pids': self._retired['pids'], 'state': _serialize(self._retired['totals'])})
+        os.remove(path)
+
+    def _aggregate(self):
+        """{name: {label values: value}} summed over every process of the shared directory"""
+        while True:
+            try:
+                retired = _read_json(os.path.join(self._directory, 'retired.json'))
+            except FileNotFoundError:
+                retired = {'pids': [], 'state': {}}
+            totals = _merge({}, retired['state'])
+            covered = {'%d.json' % pid for pid in retired['pids']}
+            try:
+                for name in os.listdir(self._directory):
+                    if name.endswith('.json') and name[:-5].isdigit() and name not in covered:
+                        _merge(totals, _read_json(os.path.join(self._directory, name)))
+            except FileNotFoundError:
+                # Retired while being read: retired.json has its totals now
+                continue
+            return totals
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        totals = None
+        if self._directory is not None:
+            self.publish(force=True)
+            totals = self._aggregate()
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation.replace('\n', ' ')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type_name))
+            if totals is not None and metric.type_name in SHARED_TYPES:
+                lines.extend(metric.samples(sorted(totals.get(metric.name, {}).items())))
+            else:
+                lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """The child for one combination of label values (keep the set of values small)"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('%s expects labels %s' % (self.name, ', '.join(self.labelnames)))
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def collect(self):
+        """[(label values, value)] of every child, sorted"""
+        return [(values, child.value) for values, child in self._items()]
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+
+    type_name = 'counter'
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self, items=None):
+        for values, value in self.collect() if items is None else items:
+            yield '%s%s %s' % (self.name, _format_labels(self.labelnames, values), _format_value(value))
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    type_name = 'gauge'
+
+    def _child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'total', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets
+
+    An observation is one bisect and three additions under a lock; the
+    cumulative bucket counts Prometheus expects are only built on render.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def collect(self):
+        return [(values, list(child.snapshot())) for values, child in self._items()]
+
+    def samples(self, items=None):
+        for values, (counts, total, count) in self.collect() if items is None else items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '%s_bucket%s %d' % (self.name, _format_labels(self.labelnames, values,
+                                                                    [('le', _format_value(float(bound)))]),
+                                          cumulative)
+            labels = _format_labels(self.labelnames, values)
+            yield '%s_sum%s %s' % (self.name, labels, _format_value(total))
+            yield '%s_count%s %d' % (self.name, labels, count)
+
+
+class Callback(_Metric):
+    """Metric read at scrape time from ``function``, which returns {label values tuple: value}"""
+
+    def __init__(self, name, documentation, labelnames, function, type_name='gauge', registry=REGISTRY):
+        self.type_name = type_name
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def collect(self):
+        return sorted((tuple(str(value) for value in values), value) for values, value in self.function().items())
+
+    def samples(self, items=None):
+        for values, value in self.collect() if items is None else items:
+            yield '%s%s %s' % (self.name, _format_labels(self.labelnames, values), _format_value(value))
+
+
+# Metrics recorded by the algorithms and the storage files (CSV snapshots and journals)
+ALGORITHM_SECONDS = Histogram('workmate_algorithm_duration_seconds', 'Time spent in each algorithm',
+                              ['algorithm'])
+ALGORITHM_ROWS = Counter('workmate_algorithm_rows_total', 'Rows passed to each algorithm', ['algorithm'])
+IO_SECONDS = Histogram('workmate_storage_io_duration_seconds', 'Time spent reading and writing data files',
+                       ['file', 'operation'])
+IO_ROWS = Counter('workmate_storage_rows_total', 'Rows (or journal records) read and written', ['file', 'operation'])
+IO_BYTES = Counter('workmate_storage_bytes_total', 'Bytes read and written', ['file', 'operation'])
+PROCESS_START = Gauge('process_start_time_seconds', 'Start time of the process since the epoch')
+PROCESS_START.set(time.time())
+
+
+def timed(rows_arg=None, name=None):
+    """
+    Decorate an algorithm to record its duration, and the length of its
+    positional argument ``rows_arg`` as rows processed
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+        seconds = ALGORITHM_SECONDS.labels(label)
+        rows = ALGORITHM_ROWS.labels(label)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds.observe(time.perf_counter() - started)
+                if rows_arg is not None and len(args) > rows_arg and hasattr(args[rows_arg], '__len__'):
+                    rows.inc(len(args[rows_arg]))
+        return wrapper
+    return decorator
+
+def record_io(path, operation, rows, size, seconds):
+    """
+    Record one read, write or append of ``rows`` rows and ``size`` bytes on
+    a data file. Series are per file name; a temporary copy counts as the
+    file it replaces, so pids don't add series.
+    """
+    name = _TEMP_SUFFIX.sub('', os.path.basename(path))
+    IO_SECONDS.labels(name, operation).observe(seconds)
+    IO_ROWS.labels(name, operation).inc(rows)
+    IO_BYTES.labels(name, operation).inc(size)
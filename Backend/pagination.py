@@ -0,0 +1,81 @@
+import base64
+import heapq
+import json
+
+try:
+    from .records import json_default
+except ImportError:
+    from records import json_default
+
+# Rows serialized per chunk of a streamed response
+STREAM_CHUNK_ROWS = 100
+
+
+def encode_cursor(key):
+    """Opaque, URL-safe token for a position in a listing (the last row's sort key)"""
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything it didn't produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if (not isinstance(key, list) or not key
+            or not all(isinstance(part, (str, int, float)) and not isinstance(part, bool) for part in key)):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+def row_id(row):
+    """Numeric id used to break ties between equal sort keys"""
+    try:
+        return int(row['id'])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+def select_page(entries, after=None, limit=None, reverse=False):
+    """
+    Pick one page out of (key, row) pairs given in any order
+
+    Rows come out ordered by key (descending with ``reverse``), starting right
+    after the key ``after``. Keys must be unique, so they should end with the
+    row id. Returns (rows, next_key), where next_key is None on the last page.
+    Time Complexity: O(n log limit) - only the page itself is ever sorted
+    """
+    if after is not None:
+        try:
+            if reverse:
+                entries = [entry for entry in entries if entry[0] < after]
+            else:
+                entries = [entry for entry in entries if entry[0] > after]
+        except TypeError:
+            # Cursor from a listing sorted by a different kind of key
+            raise ValueError('Invalid cursor')
+
+    by_key = lambda entry: entry[0]
+    if limit is None:
+        page = sorted(entries, key=by_key, reverse=reverse)
+        return [row for _, row in page], None
+
+    # One extra row tells us whether there is a next page
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    page = select(limit + 1, entries, key=by_key)
+    next_key = page[limit - 1][0] if len(page) > limit and limit > 0 else None
+    return [row for _, row in page[:limit]], next_key
+
+def stream_json_array(rows, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield a JSON array chunk by chunk so the whole document is never built in memory"""
+    yield '['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(json.dumps(row, default=json_default))
+        if len(chunk) >= chunk_rows:
+            yield ('' if first else ',') + ','.join(chunk)
+            chunk = []
+            first = False
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+    yield ']'
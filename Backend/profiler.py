@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between stack samples; the interpreter switches threads every 5 ms,
+# so sampling a busy thread faster than that mostly sees the same stack
+DEFAULT_INTERVAL = 0.005
+# Deepest stack kept per sample (innermost frames win)
+MAX_DEPTH = 64
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread
+
+    A background thread reads the target thread's current stack every
+    ``interval`` seconds, so the profiled code runs unmodified and the cost
+    is independent of how many calls it makes. ``collapsed()`` returns the
+    samples in the folded-stack format (``outer;inner count``) read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='workmate-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join('%s %d\n' % (stack, count) for stack, count in self.samples.most_common())
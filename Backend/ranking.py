@@ -0,0 +1,269 @@
+import math
+import threading
+
+import numpy as np
+
+try:
+    from .algorithms import parse_pay
+    from .geo import EARTH_RADIUS_KM, normalize_location
+    from .pagination import row_id
+    from .search import tokenize
+except ImportError:
+    from algorithms import parse_pay
+    from geo import EARTH_RADIUS_KM, normalize_location
+    from pagination import row_id
+    from search import tokenize
+
+# Weight of each signal in a job's score; any of them can be overridden per request
+DEFAULT_WEIGHTS = {'distance': 1.0, 'pay': 0.5, 'relevance': 0.5, 'rating': 0.25}
+# Distance at which the proximity signal drops to one half
+DISTANCE_SCALE_KM = 10.0
+# Job text matched against a student's bio
+TEXT_FIELDS = ('title', 'description')
+# Upper bound on score matrix cells computed at once when scoring many students
+CHUNK_CELLS = 1 << 22
+INITIAL_CAPACITY = 64
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if math.isfinite(value) else 0.0
+
+def parse_weights(overrides=None):
+    """
+    DEFAULT_WEIGHTS updated with ``overrides`` ({signal: number});
+    raises ValueError for unknown signals and non-finite or negative numbers
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    if not isinstance(overrides or {}, dict):
+        raise ValueError('Weights must map signal names to numbers')
+    for name, value in (overrides or {}).items():
+        if name not in weights:
+            raise ValueError('Unknown weight %r (expected one of %s)' % (name, ', '.join(sorted(weights))))
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError('Weight %r must be a number' % name)
+        if not math.isfinite(value) or value < 0:
+            raise ValueError('Weight %r must be a non-negative number' % name)
+        weights[name] = value
+    return weights
+
+
+class RankingEngine:
+    """
+    Multi-criteria job ranking over NumPy feature arrays
+
+    Every job gets a slot in parallel arrays (coordinates, pay, location
+    code, numeric id), updated in place from the store's change events; a
+    token -> slots map gives bio relevance. A student's score for every job
+    is one vectorized expression:
+
+        distance  * 1 / (1 + km / DISTANCE_SCALE_KM)   (same-place match when either side has no coordinates)
+        pay       * pay / highest pay
+        relevance * IDF-weighted share of the bio's words found in the job's title or description
+        rating    * student rating / 5 * pay / highest pay   (well-rated students lean towards better pay)
+
+    and the top k come from ``argpartition``, so only those k are sorted.
+    ``rank_many`` scores a block of students per pass over the arrays.
+    Time Complexity: O(n) per student plus O(k log k), with n the number of jobs
+    """
+
+    def __init__(self, gazetteer, where=None, key='id'):
+        self.gazetteer = gazetteer
+        self.where = where
+        self.key = key
+        self._lock = threading.RLock()
+        self._store = None
+        self._clear()
+
+    def _clear(self, capacity=INITIAL_CAPACITY):
+        self._lat = np.full(capacity, np.nan)
+        self._lon = np.full(capacity, np.nan)
+        self._pay = np.zeros(capacity)
+        self._place = np.full(capacity, -1, dtype=np.int64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._rows = [None] * capacity
+        self._tokens = [()] * capacity
+        self._slots = {}       # job_id -> slot
+        self._free = []        # slots of removed jobs, reused first
+        self._size = 0         # slots ever used; arrays are only scanned up to here
+        self._places = {}      # normalized location -> code
+        self._postings = {}    # token -> {slot: None}
+
+    # Maintenance
+    def attach(self, store):
+        self._store = store
+        store.refresh()
+        store.add_listener(self._on_change)
+        self.rebuild(store.all())
+
+    def rebuild(self, rows):
+        with self._lock:
+            rows = [row for row in rows if self.where is None or self.where(row)]
+            self._clear(max(INITIAL_CAPACITY, len(rows)))
+            for row in rows:
+                self.add(row)
+
+    def _on_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(self._store.all())
+            return
+        with self._lock:
+            if old_row is not None:
+                self.remove(old_row[self.key])
+            if new_row is not None:
+                self.add(new_row)
+
+    def _grow(self):
+        old_capacity = len(self._rows)
+        capacity = old_capacity * 2
+        for name, fill in (('_lat', np.nan), ('_lon', np.nan), ('_pay', 0), ('_place', -1), ('_ids', 0),
+                           ('_active', False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:old_capacity] = old
+            setattr(self, name, new)
+        self._rows.extend([None] * old_capacity)
+        self._tokens.extend([()] * old_capacity)
+
+    def _place_code(self, location, create=False):
+        place = normalize_location(location)
+        if not place:
+            return -1
+        code = self._places.get(place)
+        if code is None:
+            if not create:
+                return -1
+            code = self._places[place] = len(self._places)
+        return code
+
+    def add(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        with self._lock:
+            job_id = row[self.key]
+            self.remove(job_id)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._size == len(self._rows):
+                    self._grow()
+                slot = self._size
+                self._size += 1
+            point = self.gazetteer.resolve(row.get('location'))
+            self._lat[slot], self._lon[slot] = point if point is not None else (np.nan, np.nan)
+            self._pay[slot] = parse_pay(row.get('pay'))
+            self._place[slot] = self._place_code(row.get('location'), create=True)
+            self._ids[slot] = row_id(row)
+            self._active[slot] = True
+            self._rows[slot] = row
+            tokens = set()
+            for field in TEXT_FIELDS:
+                tokens.update(tokenize(row.get(field)))
+            self._tokens[slot] = tuple(tokens)
+            for token in tokens:
+                self._postings.setdefault(token, {})[slot] = None
+            self._slots[job_id] = slot
+
+    def remove(self, job_id):
+        with self._lock:
+            slot = self._slots.pop(job_id, None)
+            if slot is None:
+                return
+            for token in self._tokens[slot]:
+                postings = self._postings[token]
+                del postings[slot]
+                if not postings:
+                    del self._postings[token]
+            self._active[slot] = False
+            self._rows[slot] = None
+            self._tokens[slot] = ()
+            self._free.append(slot)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+    # Scoring
+    def _student_features(self, students):
+        points = [self.gazetteer.resolve(student.get('location')) for student in students]
+        lat = np.array([point[0] if point else np.nan for point in points])
+        lon = np.array([point[1] if point else np.nan for point in points])
+        place = np.array([self._place_code(student.get('location')) for student in students], dtype=np.int64)
+        rating = np.clip([_to_float(student.get('rating')) / 5.0 for student in students], 0.0, 1.0)
+        return np.radians(lat), np.radians(lon), place, rating
+
+    def _relevance(self, bio, n):
+        """IDF-weighted share of the bio's distinct words that each job contains"""
+        relevance = np.zeros(n)
+        # Words no job contains can't tell jobs apart, so they don't dilute the share
+        tokens = [token for token in set(tokenize(bio)) if token in self._postings]
+        total = 0.0
+        for token in tokens:
+            postings = self._postings[token]
+            idf = math.log(1.0 + len(self._slots) / len(postings))
+            relevance[np.fromiter(postings, dtype=np.intp, count=len(postings))] += idf
+            total += idf
+        return relevance / total if total else relevance
+
+    def _score_block(self, students, weights):
+        """(scores, distances) matrices of shape (students, slots); inactive slots score -inf"""
+        n = self._size
+        lat, lon, place, rating = self._student_features(students)
+        job_lat, job_lon = np.radians(self._lat[:n]), np.radians(self._lon[:n])
+        active = self._active[:n]
+        pay = self._pay[:n]
+        top_pay = pay[active].max() if active.any() else 0.0
+        pay = pay / top_pay if top_pay > 0 else np.zeros(n)
+
+        # Haversine for every (student, job) pair; NaN where either side has no coordinates
+        a = (np.sin((job_lat[None, :] - lat[:, None]) / 2) ** 2
+             + np.cos(lat)[:, None] * np.cos(job_lat)[None, :] * np.sin((job_lon[None, :] - lon[:, None]) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        same_place = (place[:, None] == self._place[None, :n]) & (place[:, None] >= 0)
+        proximity = np.where(np.isnan(distances), same_place.astype(float),
+                             1.0 / (1.0 + np.nan_to_num(distances) / DISTANCE_SCALE_KM))
+
+        scores = weights['distance'] * proximity
+        scores += (weights['pay'] + weights['rating'] * rating[:, None]) * pay[None, :]
+        if weights['relevance']:
+            for i, student in enumerate(students):
+                scores[i] += weights['relevance'] * self._relevance(student.get('bio'), n)
+        scores[:, ~active] = -np.inf
+        return scores, distances
+
+    def _top(self, scores, distances, k):
+        count = min(k, len(self._slots))
+        if count <= 0:
+            return []
+        if count < len(scores):
+            slots = np.argpartition(-scores, count - 1)[:count]
+        else:
+            slots = np.flatnonzero(scores > -np.inf)
+        # Highest score first, ties in id order
+        slots = slots[np.lexsort((self._ids[slots], -scores[slots]))]
+        return [(float(scores[slot]), None if math.isnan(distances[slot]) else float(distances[slot]),
+                 self._rows[slot]) for slot in slots]
+
+    def rank(self, student, k=5, weights=None):
+        """Top k (score, distance_km or None, job) for one student, best first"""
+        return self.rank_many([student], k, weights)[0]
+
+    def rank_many(self, students, k=5, weights=None):
+        """``rank`` for each of ``students``, scoring a block of them per vectorized pass"""
+        weights = parse_weights(weights)
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            block = max(1, CHUNK_CELLS // max(self._size, 1))
+            results = []
+            for start in range(0, len(students), block):
+                scores, distances = self._score_block(students[start:start + block], weights)
+                results.extend(self._top(row_scores, row_distances, k)
+                               for row_scores, row_distances in zip(scores, distances))
+            return results
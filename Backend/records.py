@@ -0,0 +1,93 @@
+import sys
+from collections.abc import Mapping
+
+
+class Record(Mapping):
+    """
+    Compact table row (treat as read-only: rows are shared between callers)
+
+    Subclasses made by ``record_type`` keep one slot per field instead of a
+    per-row hash table, and intern the values of low-cardinality fields so
+    every row with the same location or status shares one string object.
+    A record reads like the dict it replaces (``row['pay']``, ``row.get``,
+    ``dict(row)``); ``json_default`` turns it back into a dict when a
+    response is serialized.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _field_set = frozenset()
+    _interned = frozenset()
+
+    @classmethod
+    def from_mapping(cls, row):
+        """Build a record from any mapping; missing or None values become ''"""
+        record = object.__new__(cls)
+        interned = cls._interned
+        for field in cls._fields:
+            value = row.get(field)
+            if value is None:
+                value = ''
+            elif value.__class__ is not str:
+                value = str(value)
+            setattr(record, field, sys.intern(value) if field in interned else value)
+        return record
+
+    def __getitem__(self, field):
+        if field in self._field_set:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def get(self, field, default=None):
+        if field in self._field_set:
+            return getattr(self, field)
+        return default
+
+    def __contains__(self, field):
+        return field in self._field_set
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __reduce__(self):
+        return (_rebuild_record, (type(self)._fields, type(self)._interned, self.to_dict()))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+
+_record_types = {}
+
+def record_type(fieldnames, interned=(), name='Row'):
+    """Return the Record subclass for a table with these fields (one class per schema)"""
+    fields = tuple(fieldnames)
+    interned = frozenset(interned)
+    cached = _record_types.get((fields, interned))
+    if cached is not None:
+        return cached
+    for field in fields:
+        if not field.isidentifier() or hasattr(Record, field):
+            raise ValueError('%r cannot be used as a record field' % field)
+    cls = type(name, (Record,), {
+        '__slots__': fields,
+        '_fields': fields,
+        '_field_set': frozenset(fields),
+        '_interned': interned,
+    })
+    _record_types[(fields, interned)] = cls
+    return cls
+
+def _rebuild_record(fields, interned, values):
+    return record_type(fields, interned).from_mapping(values)
+
+def json_default(value):
+    """``default`` hook for json.dumps and the Flask JSON provider"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
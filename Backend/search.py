@@ -0,0 +1,169 @@
+import heapq
+import math
+import re
+import threading
+
+# Relative importance of a term depending on the field it appears in
+FIELD_WEIGHTS = {'title': 3.0, 'location': 2.0, 'description': 1.0}
+
+# A query term that only matches as the prefix of an indexed word scores lower
+PREFIX_MATCH_FACTOR = 0.6
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class SearchIndex:
+    """
+    Tokenized inverted index over job text fields
+
+    Each token maps to the documents containing it, weighted by the fields it
+    occurs in, and a prefix index maps every leading substring of a token to
+    the tokens it starts, so partially typed words still match.
+    Query terms are ANDed and results are ranked by a field-weighted TF-IDF score.
+    Time Complexity: O(postings of the query terms) per search instead of O(total text)
+    """
+
+    def __init__(self, fields=None, where=None, key='id'):
+        self.fields = dict(fields or FIELD_WEIGHTS)
+        self.where = where
+        self.key = key
+        self._lock = threading.RLock()
+        self._store = None
+        self._clear()
+
+    def _clear(self):
+        self._postings = {}   # token -> {doc_id: weight}
+        self._prefixes = {}   # prefix -> set of tokens
+        self._docs = {}       # doc_id -> (sequence, row, tokens)
+        self._sequence = 0
+
+    # Maintenance
+    def attach(self, store):
+        """Index every row of ``store`` and follow its changes from now on"""
+        self._store = store
+        store.refresh()
+        store.add_listener(self._on_change)
+        self.rebuild(store.all())
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._clear()
+            for row in rows:
+                self.add(row)
+
+    def _on_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(self._store.all())
+            return
+        with self._lock:
+            if old_row is not None:
+                self.remove(old_row[self.key])
+            if new_row is not None:
+                self.add(new_row)
+
+    def add(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        with self._lock:
+            doc_id = row[self.key]
+            if doc_id in self._docs:
+                self.remove(doc_id)
+            weights = {}
+            for field, field_weight in self.fields.items():
+                for token in tokenize(row.get(field)):
+                    weights[token] = weights.get(token, 0.0) + field_weight
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    for end in range(1, len(token)):
+                        self._prefixes.setdefault(token[:end], set()).add(token)
+                postings[doc_id] = weight
+            self._docs[doc_id] = (self._sequence, row, tuple(weights))
+            self._sequence += 1
+
+    def remove(self, doc_id):
+        with self._lock:
+            entry = self._docs.pop(doc_id, None)
+            if entry is None:
+                return
+            for token in entry[2]:
+                postings = self._postings[token]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+                    for end in range(1, len(token)):
+                        tokens = self._prefixes[token[:end]]
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._prefixes[token[:end]]
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Queries
+    def _term_scores(self, term, total_docs):
+        scores = {}
+        candidates = [(term, 1.0)] if term in self._postings else []
+        candidates += [(token, PREFIX_MATCH_FACTOR) for token in self._prefixes.get(term, ())]
+        for token, factor in candidates:
+            postings = self._postings[token]
+            idf = math.log(1 + total_docs / len(postings))
+            for doc_id, weight in postings.items():
+                score = weight * idf * factor
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def _match(self, terms):
+        # doc_id -> summed score of the docs matching every term
+        total_docs = len(self._docs)
+        # Intersect starting from the rarest term so the candidate set stays small
+        per_term = sorted((self._term_scores(term, total_docs) for term in terms), key=len)
+        scores = per_term[0]
+        for term_scores in per_term[1:]:
+            scores = {doc_id: score + term_scores[doc_id]
+                      for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                break
+        return scores
+
+    def search(self, query, limit=None):
+        """
+        Return indexed rows matching every term of ``query``, best match first.
+        An empty query returns all indexed rows in insertion order.
+        """
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            terms = list(dict.fromkeys(tokenize(query)))
+            if not terms:
+                entries = sorted(self._docs.values(), key=lambda entry: entry[0])
+                rows = [entry[1] for entry in entries]
+                return rows if limit is None else rows[:limit]
+
+            scores = self._match(terms)
+            ranked = ((-score, self._docs[doc_id][0], doc_id) for doc_id, score in scores.items())
+            if limit is None:
+                ranked = sorted(ranked)
+            else:
+                ranked = heapq.nsmallest(limit, ranked)
+            return [self._docs[doc_id][1] for _, _, doc_id in ranked]
+
+    def scored(self, query):
+        """
+        Return unordered (score, row) pairs for every row matching ``query``;
+        every indexed row scores 0 for an empty query. Used for paging.
+        """
+        if self._store is not None:
+            self._store.refresh()
+        with self._lock:
+            terms = list(dict.fromkeys(tokenize(query)))
+            if not terms:
+                return [(0.0, entry[1]) for entry in self._docs.values()]
+            return [(score, self._docs[doc_id][1]) for doc_id, score in self._match(terms).items()]
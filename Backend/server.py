@@ -0,0 +1,395 @@
+import gc
+import io
+import mmap
+import os
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+try:
+    from .metrics import REGISTRY
+except ImportError:
+    from metrics import REGISTRY
+
+DEFAULT_THREADS = 8
+# A worker whose main loop hasn't checked in for this long is killed and replaced
+DEFAULT_TIMEOUT = 30
+# How long stopping workers get to finish the requests they have
+DEFAULT_GRACEFUL_TIMEOUT = 30
+# Idle keep-alive connections are closed after this, so they can't pin the thread pool
+KEEPALIVE_TIMEOUT = 5
+HEARTBEAT_INTERVAL = 1.0
+
+# Per-worker slot in memory shared by every process: pid, generation, heartbeat, requests, active
+_SLOT = struct.Struct('qqdqq')
+
+# Shared slot table, set in every process of a running PreforkServer
+_table = None
+
+
+class WorkerTable:
+    """Fixed array of worker slots in an anonymous shared mapping, created before forking"""
+
+    def __init__(self, size):
+        self.size = size
+        self._memory = mmap.mmap(-1, _SLOT.size * size)
+
+    def read(self, index):
+        return _SLOT.unpack_from(self._memory, index * _SLOT.size)
+
+    def write(self, index, pid, generation, heartbeat=0.0, requests=0, active=0):
+        _SLOT.pack_into(self._memory, index * _SLOT.size, pid, generation, heartbeat, requests, active)
+
+    def free_slot(self):
+        for index in range(self.size):
+            if self.read(index)[0] == 0:
+                return index
+        raise RuntimeError('No free worker slot')
+
+    def workers(self):
+        """(slot index, pid, generation, heartbeat, requests, active) of every occupied slot"""
+        return [(index,) + self.read(index) for index in range(self.size) if self.read(index)[0]]
+
+
+class _Slot:
+    """A worker's own view of its slot; only that worker writes it"""
+
+    def __init__(self, table, index, generation):
+        self.table = table
+        self.index = index
+        self.generation = generation
+        self.requests = 0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def beat(self):
+        with self._lock:
+            self._write()
+
+    def begin(self):
+        with self._lock:
+            self.active += 1
+            self._write()
+
+    def end(self):
+        with self._lock:
+            self.active -= 1
+            self.requests += 1
+            self._write()
+
+    def _write(self):
+        self.table.write(self.index, os.getpid(), self.generation, time.time(), self.requests, self.active)
+
+
+def worker_health():
+    """
+    Health of every worker of the running pre-fork server, as seen from any
+    of them; an empty list when the app is served some other way
+    """
+    if _table is None:
+        return []
+    now = time.time()
+    return [{
+        'pid': pid,
+        'generation': generation,
+        'last_heartbeat_s': round(now - heartbeat, 3) if heartbeat else None,
+        'requests': requests,
+        'active_requests': active,
+    } for _, pid, generation, heartbeat, requests, active in _table.workers() if pid > 0]
+
+
+class _RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ['workmate.detach'] = self.detach
+        return environ
+
+    def detach(self):
+        """
+        Take the connection away from this request: returns a duplicate of
+        the socket for the caller to keep (e.g. a long-lived event stream
+        served from another thread). Whatever the response writes after
+        this is discarded, and the connection isn't shut down when the
+        request ends, so the request's pool thread is free again.
+        """
+        self.wfile.flush()
+        connection = self.connection.dup()
+        self.wfile = io.BytesIO()
+        self.close_connection = True
+        self.server.keep_open(self.connection)
+        return connection
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server on an inherited listening socket that hands connections to a
+    fixed thread pool
+
+    While every thread is busy the worker stops accepting, so the kernel
+    gives new connections to the other workers instead of queueing them here.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, fd, threads, slot):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self.slot = slot
+        self.parent = os.getppid()
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix='workmate-request')
+        self._free = threading.BoundedSemaphore(threads)
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        while not self._free.acquire(timeout=HEARTBEAT_INTERVAL):
+            self.slot.beat()
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        self.slot.begin()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slot.end()
+            self._free.release()
+
+    def keep_open(self, request):
+        """Don't shut ``request``'s connection down at the end of the request; a duplicate lives on"""
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            detached = request in self._detached
+            self._detached.discard(request)
+        if detached:
+            # shutdown() would end the connection for the duplicate too; just drop this handle
+            self.close_request(request)
+        else:
+            super().shutdown_request(request)
+
+    def service_actions(self):
+        # Called by serve_forever between polls: the heartbeat proves the loop is alive
+        self.slot.beat()
+        REGISTRY.publish()
+        if os.getppid() != self.parent:
+            # Master is gone; don't linger as an orphan
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds for in-flight requests after the loop has stopped"""
+        deadline = time.monotonic() + timeout
+        while self.slot.active and time.monotonic() < deadline:
+            self.slot.beat()
+            time.sleep(0.05)
+        self._pool.shutdown(wait=False)
+        REGISTRY.publish(force=True)
+
+
+class PreforkServer:
+    """
+    Pre-forking server: a master process that owns the listening socket and
+    supervises ``workers`` forked worker processes, each serving the app
+    from a pool of ``threads`` threads
+
+    Everything loaded before ``run()`` (the app, its tables and indexes) is
+    shared copy-on-write with the workers. The master restarts workers that
+    exit or stop sending heartbeats. SIGHUP replaces the workers gracefully
+    (new ones are started before the old ones are told to finish), SIGTTIN /
+    SIGTTOU add or remove a worker, and SIGTERM / SIGINT stop the server
+    after in-flight requests finish.
+
+    Metrics are summed over the master and every worker, past ones
+    included, through files in a temporary directory (see metrics.Registry),
+    so /metrics counts the same whichever worker serves it.
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=None, threads=DEFAULT_THREADS,
+                 timeout=DEFAULT_TIMEOUT, graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT, on_reload=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.on_reload = on_reload
+        self.generation = 0
+        self._children = {}      # pid -> (slot index, generation, started)
+        self._signals = []
+        self._socket = None
+        self._table = None
+
+    # Master
+    def run(self):
+        global _table
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self._socket = socket.create_server((self.host, self.port), family=family, backlog=2048)
+        # Non-blocking: workers race for each connection, and the losers must not block in accept()
+        self._socket.setblocking(False)
+        self.port = self._socket.getsockname()[1]
+        # Room for the old and the new workers side by side during a reload, plus SIGTTIN
+        self._table = _table = WorkerTable(max(self.workers * 2 + 8, 16))
+        metrics_dir = tempfile.mkdtemp(prefix='workmate-metrics-')
+        REGISTRY.share(metrics_dir)
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, lambda signum, frame: self._signals.append(signum))
+        self._log('Listening on %s:%d with %d workers x %d threads' % (self.host, self.port, self.workers,
+                                                                       self.threads))
+        # Objects loaded so far never get their GC headers touched, so the pages stay shared
+        gc.freeze()
+        self._spawn_missing()
+        try:
+            while self._supervise():
+                pass
+        finally:
+            self._socket.close()
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    def _supervise(self):
+        time.sleep(0.2)
+        self._reap()
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                self._stop_all()
+                return False
+            if signum == signal.SIGHUP:
+                self._reload()
+            elif signum == signal.SIGTTIN and self.workers * 2 < self._table.size:
+                self.workers += 1
+            elif signum == signal.SIGTTOU and self.workers > 1:
+                self.workers -= 1
+                self._retire(self._current()[-1:])
+        self._kill_stuck()
+        self._spawn_missing()
+        return True
+
+    def _current(self):
+        return sorted(pid for pid, (_, generation, _) in self._children.items() if generation == self.generation)
+
+    def _spawn_missing(self):
+        for _ in range(self.workers - len(self._current())):
+            self._spawn()
+
+    def _spawn(self):
+        index = self._table.free_slot()
+        # Reserved until the child writes its own pid
+        self._table.write(index, -1, self.generation)
+        # The child inherits what the master recorded so far; the master's own file counts it once
+        REGISTRY.publish(force=True)
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)  # never returns
+        self._children[pid] = (index, self.generation, time.time())
+        return pid
+
+    def _reap(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index, generation, _ = self._children.pop(pid, (None, None, None))
+            if index is not None:
+                self._table.write(index, 0, 0)
+                REGISTRY.retire(pid)
+                if generation == self.generation and os.waitstatus_to_exitcode(status) != 0:
+                    self._log('Worker %d exited with %s; replacing it' % (pid, os.waitstatus_to_exitcode(status)))
+
+    def _kill_stuck(self):
+        now = time.time()
+        for pid, (index, _, started) in list(self._children.items()):
+            heartbeat = self._table.read(index)[2]
+            if now - (heartbeat or started) > self.timeout:
+                self._log('Worker %d sent no heartbeat for %ds; killing it' % (pid, self.timeout))
+                self._signal(pid, signal.SIGKILL)
+
+    def _reload(self):
+        self._log('Reloading: starting generation %d' % (self.generation + 1))
+        if self.on_reload is not None:
+            self.on_reload()
+            gc.freeze()
+        old = list(self._children)
+        self.generation += 1
+        new = [self._spawn() for _ in range(self.workers)]
+        # Old workers keep serving until every new one is up
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            self._reap()
+            if all(pid not in self._children or self._table.read(self._children[pid][0])[2] for pid in new):
+                break
+            time.sleep(0.05)
+        self._retire(old)
+
+    def _retire(self, pids):
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+
+    def _stop_all(self):
+        self._log('Shutting down')
+        self._retire(list(self._children))
+        deadline = time.time() + self.graceful_timeout + 1
+        while self._children and time.time() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGKILL)
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self._children.pop(pid, None)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def _log(message):
+        print('[workmate %d] %s' % (os.getpid(), message), file=sys.stderr, flush=True)
+
+    # Worker
+    def _run_worker(self, index):
+        status = 0
+        try:
+            for signum in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            # Ctrl-C reaches the whole process group; the master decides what happens
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            REGISTRY.forked()
+            slot = _Slot(self._table, index, self.generation)
+            slot.beat()
+            server = PooledWSGIServer(self.host, self.port, self.app, self._socket.fileno(), self.threads, slot)
+            signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+                target=server.shutdown, daemon=True).start())
+            server.serve_forever(poll_interval=HEARTBEAT_INTERVAL / 2)
+            server.drain(self.graceful_timeout)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(status)
@@ -0,0 +1,197 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Mapping
+
+try:
+    from .metrics import record_io
+except ImportError:
+    from metrics import record_io
+
+MAGIC = b'WMSNAP\x00\x00'
+# Bumped whenever the layout changes; snapshots of another version are rebuilt
+FORMAT_VERSION = 1
+
+# magic, format version, CSV mtime_ns, CSV size, row count, field count, meta length
+_HEADER = struct.Struct('<8sIqqQII')
+
+
+def _aligned(position):
+    return (position + 7) & ~7
+
+def write_snapshot(path, fieldnames, rows, indexes=(), key='id', source_signature=(0, 0)):
+    """
+    Write ``rows`` to ``path`` as a binary snapshot stamped with the
+    (mtime_ns, size) signature of the CSV file they were read from.
+
+    Layout: fixed header, JSON meta (fields, every row's key, id high-water
+    mark, and for each indexed field its value -> (start, count) run in the
+    postings array), a
+    uint64 array of cell offsets (one per row and field, plus the end), a
+    uint32 postings array of row numbers, and every cell's UTF-8 bytes.
+    The file is written beside ``path`` and renamed into place, so readers
+    only ever map complete snapshots.
+    """
+    started = time.perf_counter()
+    fieldnames = list(fieldnames)
+    offsets = array('Q', [0])
+    cells = bytearray()
+    postings = {field: {} for field in indexes}
+    keys = []
+    max_id = 0
+    for number, row in enumerate(rows):
+        for field in fieldnames:
+            value = row.get(field)
+            value = '' if value is None else str(value)
+            cells += value.encode('utf-8')
+            offsets.append(len(cells))
+            if field in postings:
+                postings[field].setdefault(value, []).append(number)
+        row_key = row.get(key) or ''
+        keys.append(row_key)
+        if row_key.isdigit() and int(row_key) > max_id:
+            max_id = int(row_key)
+    numbers = array('I')
+    runs = {}
+    for field, values in postings.items():
+        runs[field] = {}
+        for value, run in values.items():
+            runs[field][value] = (len(numbers), len(run))
+            numbers.extend(run)
+    meta = json.dumps({'fields': fieldnames, 'key': key, 'keys': keys, 'max_id': max_id, 'indexes': runs,
+                       'postings': len(numbers)}, separators=(',', ':')).encode('utf-8')
+
+    row_count = (len(offsets) - 1) // len(fieldnames) if fieldnames else 0
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, source_signature[0], source_signature[1], row_count,
+                          len(fieldnames), len(meta))
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(header + meta)
+        f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        f.write(offsets.tobytes())
+        f.write(numbers.tobytes())
+        f.write(cells)
+        size = f.tell()
+    os.replace(tmp_path, path)
+    record_io(path, 'write', row_count, size, time.perf_counter() - started)
+
+
+class Snapshot:
+    """
+    A snapshot file mapped read-only into memory
+
+    Opening costs one header and meta parse however many rows there are;
+    cells are decoded one at a time when a row is read (see SnapshotRow), and
+    the pages of a snapshot shared by several worker processes are kept in
+    memory once, by the OS page cache.
+    """
+
+    def __init__(self, path, memory, header, meta, interned=()):
+        self.path = path
+        self._memory = memory
+        self.source_signature = (header[2], header[3])
+        self.rows = header[4]
+        self.fields = tuple(meta['fields'])
+        self.key = meta['key']
+        self.keys = meta['keys']
+        self.max_id = meta['max_id']
+        self._field_numbers = {field: number for number, field in enumerate(self.fields)}
+        # Low-cardinality fields whose decoded values are shared, as in records.Record
+        self._interned = frozenset(self._field_numbers[field] for field in interned if field in self._field_numbers)
+        self._runs = meta['indexes']
+        start = _aligned(_HEADER.size + header[6])
+        end = start + 8 * (self.rows * len(self.fields) + 1)
+        self._offsets = memoryview(memory)[start:end].cast('Q')
+        self._postings = memoryview(memory)[end:end + 4 * meta['postings']].cast('I')
+        self._cells = end + 4 * meta['postings']
+
+    @classmethod
+    def open(cls, path, fieldnames, source_signature, interned=()):
+        """
+        Map the snapshot at ``path``, or return None if there is none or it
+        is of another format version, another schema or another CSV file
+        version than ``source_signature`` (in which case it should be rebuilt)
+        """
+        started = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError: an empty file can't be mapped
+            return None
+        try:
+            header = _HEADER.unpack_from(memory)
+            if header[0] != MAGIC or header[1] != FORMAT_VERSION or (header[2], header[3]) != tuple(source_signature):
+                return None
+            meta = json.loads(memory[_HEADER.size:_HEADER.size + header[6]])
+            snapshot = cls(path, memory, header, meta, interned)
+            if list(snapshot.fields) != list(fieldnames) or snapshot._cells + snapshot._offsets[-1] != len(memory):
+                return None
+        except (struct.error, ValueError, KeyError, TypeError, IndexError):
+            # Truncated or otherwise unreadable: treat as missing
+            return None
+        record_io(path, 'map', snapshot.rows, len(memory), time.perf_counter() - started)
+        return snapshot
+
+    def cell(self, row, field_number):
+        position = row * len(self.fields) + field_number
+        start, end = self._offsets[position], self._offsets[position + 1]
+        value = str(self._memory[self._cells + start:self._cells + end], 'utf-8')
+        return sys.intern(value) if field_number in self._interned else value
+
+    def row(self, number):
+        return SnapshotRow(self, number)
+
+    def index(self, field):
+        """{value: row numbers in file order} for an indexed field"""
+        return {value: self._postings[start:start + count].tolist()
+                for value, (start, count) in self._runs.get(field, {}).items()}
+
+
+class SnapshotRow(Mapping):
+    """
+    One row of a mapped snapshot: reads like a dict (and like records.Record),
+    but each value is only decoded from the mapping when it is asked for.
+    Treat as read-only, like any resident row.
+    """
+
+    __slots__ = ('_snapshot', '_row')
+
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+
+    def __getitem__(self, field):
+        number = self._snapshot._field_numbers.get(field)
+        if number is None:
+            raise KeyError(field)
+        return self._snapshot.cell(self._row, number)
+
+    def get(self, field, default=None):
+        number = self._snapshot._field_numbers.get(field)
+        if number is None:
+            return default
+        return self._snapshot.cell(self._row, number)
+
+    def __contains__(self, field):
+        return field in self._snapshot._field_numbers
+
+    def __iter__(self):
+        return iter(self._snapshot.fields)
+
+    def __len__(self):
+        return len(self._snapshot.fields)
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def to_dict(self):
+        snapshot = self._snapshot
+        return {field: snapshot.cell(self._row, number) for number, field in enumerate(snapshot.fields)}
+
+    def __repr__(self):
+        return 'SnapshotRow(%r)' % self.to_dict()
@@ -0,0 +1,275 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+try:
+    from .store import DuplicateKeyError, StoreBase
+except ImportError:
+    from store import DuplicateKeyError, StoreBase
+
+
+class SqliteTableStore(StoreBase):
+    """
+    SQLite-backed table with the same interface as ``TableStore``
+
+    Every column is stored as TEXT so rows come back exactly as the CSV
+    backend would return them, and insertion order is kept through the rowid.
+    The database runs in WAL mode with one connection per thread; secondary
+    indexes are created for the ``indexes`` fields. A per-table version in
+    ``_meta`` is bumped by every write so readers can tell when another
+    process changed the table and tell listeners to rebuild.
+
+    Mutations are grouped into one IMMEDIATE transaction per batch, each in
+    its own savepoint so a failing operation doesn't undo its neighbours.
+    """
+
+    def __init__(self, db_path, table, fieldnames, indexes=(), key='id', writer=None):
+        self.path = db_path
+        self.writer = writer
+        self.table = table
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.index_fields = tuple(indexes)
+        self._local = threading.local()
+        self._forked_connections = []
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._batch_lock = threading.RLock()
+        self._pending_events = []
+        self._columns = ', '.join('"%s"' % field for field in self.fieldnames)
+        self._create_schema()
+        self._version = self._read_version()
+        # Changes made before this handle existed are only known to be older than now
+        self._modified = time.time()
+
+    # Connections
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            if conn is not None:
+                # Inherited through fork: SQLite connections must not cross processes,
+                # and closing it here could disturb the parent's locks, so just keep it
+                self._forked_connections.append(conn)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_schema(self):
+        conn = self._connection()
+        columns = ', '.join(
+            '"%s" TEXT PRIMARY KEY' % field if field == self.key else '"%s" TEXT NOT NULL DEFAULT \'\'' % field
+            for field in self.fieldnames
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)' % (self.table, columns))
+        for field in self.index_fields:
+            conn.execute('CREATE INDEX IF NOT EXISTS "idx_%s_%s" ON "%s" ("%s")'
+                         % (self.table, field, self.table, field))
+        # Expression index so MAX(CAST(id AS INTEGER)), which seeds the id high-water mark, is a lookup
+        conn.execute('CREATE INDEX IF NOT EXISTS "idx_%s_%s_int" ON "%s" (CAST("%s" AS INTEGER))'
+                     % (self.table, self.key, self.table, self.key))
+        conn.execute('CREATE TABLE IF NOT EXISTS _meta (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        conn.execute('INSERT OR IGNORE INTO _meta (name, version) VALUES (?, 0)', (self.table,))
+        # Id high-water mark: only ever raised, so ids of deleted rows are never handed out again
+        self._max_id_name = self.table + '.max_id'
+        conn.execute('INSERT OR IGNORE INTO _meta (name, version) '
+                     'SELECT ?, MAX(COALESCE(MAX(CAST("%s" AS INTEGER)), 0), 0) FROM "%s"'
+                     % (self.key, self.table), (self._max_id_name,))
+        # Random per-database value, so versions of a re-created database never repeat old tags
+        conn.execute("INSERT OR IGNORE INTO _meta (name, version) VALUES ('_epoch', ?)",
+                     (random.getrandbits(31),))
+        self._epoch = conn.execute("SELECT version FROM _meta WHERE name = '_epoch'").fetchone()[0]
+
+    def _read_version(self):
+        row = self._connection().execute('SELECT version FROM _meta WHERE name = ?', (self.table,)).fetchone()
+        return row[0] if row else 0
+
+    # Batching (see writer.WriteQueue)
+    def begin_batch(self):
+        """Open one IMMEDIATE transaction for a group of mutations."""
+        self._batch_lock.acquire()
+        self._batch_owner = threading.get_ident()
+        try:
+            with self._lock:
+                self._ensure_fresh()
+            self._connection().execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self._release_batch()
+            raise
+        self._pending_events = []
+
+    def commit_batch(self):
+        """Bump the table version and commit; listeners hear about the changes afterwards."""
+        conn = self._connection()
+        conn.execute('UPDATE _meta SET version = version + 1 WHERE name = ?', (self.table,))
+        conn.execute('COMMIT')
+        events, self._pending_events = self._pending_events, []
+        with self._lock:
+            self._version = self._read_version()
+            for event in events:
+                self._notify(*event)
+        self._release_batch()
+
+    def abort_batch(self):
+        conn = self._connection()
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        self._pending_events = []
+        self._release_batch()
+
+    def _release_batch(self):
+        self._batch_owner = None
+        self._batch_lock.release()
+
+    def _savepoint(self, fn):
+        conn = self._connection()
+        events = len(self._pending_events)
+        conn.execute('SAVEPOINT op')
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute('ROLLBACK TO op')
+            conn.execute('RELEASE op')
+            del self._pending_events[events:]
+            raise
+        conn.execute('RELEASE op')
+        return result
+
+    # Freshness
+    def _ensure_fresh(self):
+        version = self._read_version()
+        if version != self._version:
+            self._version = version
+            self._notify('reload', None, None)
+
+    def refresh(self):
+        """Tell listeners to rebuild if another process wrote to the table."""
+        with self._lock:
+            self._ensure_fresh()
+
+    def reload(self):
+        with self._lock:
+            self._version = self._read_version()
+            self._notify('reload', None, None)
+
+    # Reads
+    def _select(self, where='', params=()):
+        sql = 'SELECT %s FROM "%s" %s ORDER BY rowid' % (self._columns, self.table, where)
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+    def _check_field(self, field):
+        if field not in self.fieldnames:
+            raise KeyError(field)
+
+    def all(self):
+        return self._select()
+
+    def get(self, row_id):
+        rows = self._select('WHERE "%s" = ?' % self.key, (str(row_id),))
+        return rows[0] if rows else None
+
+    def find(self, field, value):
+        self._check_field(field)
+        return self._select('WHERE "%s" = ?' % field, (value,))
+
+    def count(self, field=None, value=None):
+        conn = self._connection()
+        if field is None:
+            return conn.execute('SELECT COUNT(*) FROM "%s"' % self.table).fetchone()[0]
+        self._check_field(field)
+        return conn.execute('SELECT COUNT(*) FROM "%s" WHERE "%s" = ?' % (self.table, field), (value,)).fetchone()[0]
+
+    def next_id(self):
+        return self._next_id(self._connection())
+
+    def data_version(self):
+        """(token, modified) as for TableStore; one lookup in _meta, no row reads."""
+        with self._lock:
+            self._ensure_fresh()
+            return '%x-%x' % (self._epoch, self._version), self._modified
+
+    def _next_id(self, conn):
+        row = conn.execute('SELECT version FROM _meta WHERE name = ?', (self._max_id_name,)).fetchone()
+        return str(row[0] + 1)
+
+    # Writes
+    def _upsert(self, conn, row):
+        # ON CONFLICT ... DO UPDATE keeps the rowid, and with it the row's position
+        placeholders = ', '.join('?' for _ in self.fieldnames)
+        assignments = ', '.join('"%s" = excluded."%s"' % (field, field)
+                                for field in self.fieldnames if field != self.key)
+        conn.execute('INSERT INTO "%s" (%s) VALUES (%s) ON CONFLICT("%s") DO UPDATE SET %s'
+                     % (self.table, self._columns, placeholders, self.key, assignments),
+                     [row[field] for field in self.fieldnames])
+
+    def insert(self, row, unique=(), check=None):
+        """
+        Add a new row, allocating an id when none is given.
+        Raises DuplicateKeyError if a field listed in ``unique`` clashes;
+        ``check`` is called with the normalized row first, as for TableStore.
+        """
+        return self._mutate(lambda: self._savepoint(lambda conn: self._insert(conn, row, unique, check)))
+
+    def insert_many(self, rows):
+        """Add several rows (ids allocated in one block) in a single transaction."""
+        return self._mutate(lambda: self._savepoint(
+            lambda conn: [self._insert(conn, row, ()) for row in rows]))
+
+    def _insert(self, conn, row, unique, check=None):
+        row = self._normalize(row)
+        for field in unique:
+            if row[field] and self.find(field, row[field]):
+                raise DuplicateKeyError(field, row[field])
+        if check is not None:
+            check(row)
+        if not row[self.key]:
+            row[self.key] = self._next_id(conn)
+        old_row = self.get(row[self.key])
+        self._upsert(conn, row)
+        if row[self.key].isdigit():
+            conn.execute('UPDATE _meta SET version = MAX(version, ?) WHERE name = ?',
+                         (int(row[self.key]), self._max_id_name))
+        self._pending_events.append(('update' if old_row else 'insert', old_row, row))
+        return dict(row)
+
+    def update_many(self, changes_by_id):
+        """Apply several row updates in a single transaction."""
+        return self._mutate(lambda: self._savepoint(lambda conn: self._update_many(conn, changes_by_id)))
+
+    def _update_many(self, conn, changes_by_id):
+        results = []
+        for row_id, changes in changes_by_id.items():
+            current = self.get(row_id)
+            if current is None:
+                continue
+            if callable(changes):
+                changes = changes(dict(current))
+            changes = self._changes(changes)
+            if changes:
+                assignments = ', '.join('"%s" = ?' % field for field in changes)
+                conn.execute('UPDATE "%s" SET %s WHERE "%s" = ?' % (self.table, assignments, self.key),
+                             list(changes.values()) + [current[self.key]])
+            updated = dict(current, **changes)
+            self._pending_events.append(('update', current, updated))
+            results.append(dict(updated))
+        return results
+
+    def delete(self, row_id):
+        return self._mutate(lambda: self._savepoint(lambda conn: self._delete(conn, row_id)))
+
+    def _delete(self, conn, row_id):
+        current = self.get(row_id)
+        if current is None:
+            return False
+        conn.execute('DELETE FROM "%s" WHERE "%s" = ?' % (self.table, self.key), (current[self.key],))
+        self._pending_events.append(('delete', current, None))
+        return True
+
+    def compact(self):
+        """Nothing to fold for SQLite; checkpoint the WAL instead."""
+        self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Storage layer: table schemas and backend selection
+
+The backend is chosen with the WORKMATE_STORAGE environment variable:
+``csv`` (default) keeps the CSV files plus their journals, ``sqlite`` keeps
+everything in one SQLite database (WORKMATE_SQLITE_PATH, default
+``<data dir>/workmate.db``). Both expose the same store interface, so the
+routes don't care which one is active.
+
+Either way jobs are partitioned by status (see archive.PartitionedStore):
+only available jobs stay in the ``jobs`` table; applied, assigned and
+deleted jobs move to the append-only ``jobs.archive.jsonl`` in the data
+directory.
+
+One-shot CSV -> SQLite import:
+    python storage.py import [--data-dir DIR] [--db PATH]
+
+Build the binary snapshots of the CSV tables ahead of a deploy (they are
+otherwise built by the first process to load a table):
+    python storage.py snapshot [--data-dir DIR]
+"""
+
+import argparse
+import os
+import sys
+
+try:
+    from .archive import Archive, PartitionedStore
+    from .store import TableStore
+    from .sqlite_store import SqliteTableStore
+    from .writer import default_writer
+except ImportError:
+    from archive import Archive, PartitionedStore
+    from store import TableStore
+    from sqlite_store import SqliteTableStore
+    from writer import default_writer
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+STUDENT_FIELDS = ['id', 'name', 'email', 'password', 'location', 'bio', 'rating', 'jobs_completed']
+PROVIDER_FIELDS = ['id', 'name', 'email', 'password', 'company']
+# One row per student on a job filled by /api/assignments/optimal (a job can take several)
+ASSIGNMENT_FIELDS = ['id', 'job_id', 'student_id']
+
+# table name -> (fields, indexed fields)
+TABLES = {
+    'jobs': (JOB_FIELDS, ('status', 'provider_id', 'assigned_student_id')),
+    'students': (STUDENT_FIELDS, ('email',)),
+    'providers': (PROVIDER_FIELDS, ('email',)),
+    'assignments': (ASSIGNMENT_FIELDS, ('job_id', 'student_id')),
+}
+
+# Archived job fields kept in memory besides the indexed ones, so the facet and
+# location indexes can be built without reading the archive (see Archive.summaries)
+ARCHIVE_RESIDENT_FIELDS = ('location', 'pay')
+
+# Low-cardinality fields whose values are shared between resident CSV rows
+# (indexed fields are always interned)
+INTERNED_FIELDS = {
+    'jobs': ('location', 'pay'),
+    'students': ('location', 'rating', 'jobs_completed'),
+    'providers': ('company',),
+    'assignments': (),
+}
+
+BACKENDS = ('csv', 'sqlite')
+
+# Jobs kept in the hot partition; every other status lives in the archive
+HOT_JOB_STATUS = 'available'
+
+
+def storage_backend():
+    backend = os.environ.get('WORKMATE_STORAGE', 'csv').strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError('Unknown WORKMATE_STORAGE %r (expected one of %s)' % (backend, ', '.join(BACKENDS)))
+    return backend
+
+def default_db_path(data_dir):
+    return os.environ.get('WORKMATE_SQLITE_PATH', os.path.join(data_dir, 'workmate.db'))
+
+def open_stores(data_dir, backend=None, db_path=None):
+    """Return {table name: store} for every table in TABLES on the chosen backend"""
+    backend = backend or storage_backend()
+    if backend == 'csv':
+        stores = {
+            name: TableStore(os.path.join(data_dir, name + '.csv'), fields, indexes=indexes,
+                             writer=default_writer, interned=INTERNED_FIELDS[name])
+            for name, (fields, indexes) in TABLES.items()
+        }
+        return partition_jobs(data_dir, stores)
+
+    db_path = db_path or default_db_path(data_dir)
+    is_new = not os.path.exists(db_path)
+    stores = partition_jobs(data_dir, sqlite_stores(db_path))
+    if is_new:
+        # First start on SQLite: seed the database from the existing CSV data
+        import_csv(data_dir, stores)
+    return stores
+
+def partition_jobs(data_dir, stores):
+    """Replace stores['jobs'] with a PartitionedStore over it and the job archive"""
+    fields, indexes = TABLES['jobs']
+    archive = Archive(os.path.join(data_dir, 'jobs.archive.jsonl'), fields, indexes=indexes,
+                      resident=ARCHIVE_RESIDENT_FIELDS)
+    stores['jobs'] = PartitionedStore(stores['jobs'], archive, lambda job: job['status'] == HOT_JOB_STATUS,
+                                      writer=default_writer)
+    return stores
+
+def sqlite_stores(db_path):
+    return {
+        name: SqliteTableStore(db_path, name, fields, indexes=indexes, writer=default_writer)
+        for name, (fields, indexes) in TABLES.items()
+    }
+
+def import_csv(data_dir, stores):
+    """Copy every CSV table (snapshot plus journal) into the given SQLite stores"""
+    counts = {}
+    for name, (fields, indexes) in TABLES.items():
+        csv_path = os.path.join(data_dir, name + '.csv')
+        if not os.path.exists(csv_path):
+            continue
+        # A one-off read: no snapshot is written beside the CSV
+        rows = TableStore(csv_path, fields, snapshot=False).all()
+        counts[name] = len(stores[name].insert_many(rows))
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='WorkMate storage tools')
+    parser.add_argument('command', choices=['import', 'snapshot', 'archive'])
+    parser.add_argument('--data-dir', default=os.environ.get(
+        'WORKMATE_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')))
+    parser.add_argument('--db', default=None, help='SQLite database path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'snapshot':
+        for name, (fields, indexes) in TABLES.items():
+            store = TableStore(os.path.join(args.data_dir, name + '.csv'), fields, indexes=indexes,
+                               interned=INTERNED_FIELDS[name], snapshot=True)
+            store.refresh()
+            print(f"{name}: {store.load_state()}")
+        return 0
+
+    if args.command == 'archive':
+        jobs = open_stores(args.data_dir, db_path=args.db)['jobs']
+        print(f"Archived {jobs.archive_cold_rows()} jobs")
+        return 0
+
+    db_path = args.db or default_db_path(args.data_dir)
+    stores = partition_jobs(args.data_dir, sqlite_stores(db_path))
+    counts = import_csv(args.data_dir, stores)
+    for name, count in counts.items():
+        print(f"Imported {count} {name} into {db_path}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
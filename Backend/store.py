@@ -0,0 +1,653 @@
+import csv
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locking
+    fcntl = None
+
+try:
+    from .journal import Journal
+    from .metrics import record_io
+    from .records import record_type
+    from .snapshot import Snapshot, SnapshotRow, write_snapshot
+except ImportError:
+    from journal import Journal
+    from metrics import record_io
+    from records import record_type
+    from snapshot import Snapshot, SnapshotRow, write_snapshot
+
+# Journal size at which it is folded back into the CSV snapshot
+DEFAULT_COMPACT_BYTES = 1024 * 1024
+
+
+def snapshots_enabled():
+    """Binary snapshots beside the CSVs are on unless WORKMATE_SNAPSHOTS is 0 / false / off"""
+    return os.environ.get('WORKMATE_SNAPSHOTS', '1').strip().lower() not in ('0', 'false', 'off', 'no')
+
+
+class DuplicateKeyError(ValueError):
+    """Raised when an insert would duplicate a value that must be unique"""
+
+    def __init__(self, field, value):
+        super().__init__(f"{field} {value!r} already exists")
+        self.field = field
+        self.value = value
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process using ``path``"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# Helper functions for CSV operations
+def read_csv(file_path):
+    started = time.perf_counter()
+    with open(file_path, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+        size = os.fstat(f.fileno()).st_size
+    record_io(file_path, 'read', len(rows), size, time.perf_counter() - started)
+    return rows
+
+def write_csv(file_path, data, fieldnames=None):
+    started = time.perf_counter()
+    with open(file_path, 'w', newline='') as f:
+        if fieldnames is None and data:
+            fieldnames = list(data[0].keys())
+        if fieldnames:
+            # Clean the data to remove None values
+            cleaned_data = []
+            for row in data:
+                cleaned_row = {k: v for k, v in row.items() if v is not None}
+                cleaned_data.append(cleaned_row)
+
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(cleaned_data)
+        size = f.tell()
+    record_io(file_path, 'write', len(data), size, time.perf_counter() - started)
+
+def _ends_with_newline(file_path):
+    with open(file_path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) in (b'\n', b'\r')
+
+def append_csv(file_path, row, fieldnames=None):
+    started = time.perf_counter()
+    with open(file_path, 'a', newline='') as f:
+        # Hand-edited files may lack a trailing newline; don't glue rows together
+        start = f.tell()
+        if start > 0 and not _ends_with_newline(file_path):
+            f.write('\n')
+        writer = csv.DictWriter(f, fieldnames=fieldnames or list(row.keys()), extrasaction='ignore')
+        writer.writerow(row)
+        size = f.tell() - start
+    record_io(file_path, 'write', 1, size, time.perf_counter() - started)
+
+
+class StoreBase:
+    """
+    Shared plumbing of the storage backends: change listeners, value
+    normalization and running mutations as (group-committed) batches.
+    Subclasses provide begin_batch/commit_batch/abort_batch.
+    """
+
+    writer = None
+    _batch_owner = None
+    # Wall-clock time this process last saw the table change
+    _modified = 0.0
+
+    def load_state(self):
+        """
+        'ready' once the table can be served; TableStore also reports
+        'loading', 'mapped' (served from a binary snapshot) and 'parsed'
+        (the snapshot could not be built, so the CSV was parsed instead)
+        """
+        return 'ready'
+
+    def summaries(self, fields):
+        """
+        Every row with at least its key and ``fields``, for indexes that only
+        need those; a store that can skip reading the rest returns less
+        than all() does
+        """
+        return self.all()
+
+    # Change notification
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _notify(self, event, old_row, new_row):
+        self._modified = time.time()
+        for callback in self._listeners:
+            callback(event, old_row, new_row)
+
+    # Values
+    @staticmethod
+    def _cell(value):
+        # Keep in-memory rows identical to what a fresh parse of the file would give
+        return '' if value is None else str(value)
+
+    def _normalize(self, row):
+        return {field: self._cell(row.get(field)) for field in self.fieldnames}
+
+    def _changes(self, changes):
+        return {field: self._cell(value) for field, value in changes.items()
+                if field in self.fieldnames and field != self.key}
+
+    # Batching
+    def _mutate(self, op):
+        # Route a mutation through the writer thread, or run it as its own batch
+        if self._batch_owner == threading.get_ident():
+            # Already inside a batch on this thread (e.g. from a listener)
+            return op()
+        if self.writer is not None and not self.writer.on_writer_thread():
+            return self.writer.submit(self, op).result()
+        self.begin_batch()
+        error = None
+        try:
+            result = op()
+        except Exception as exc:
+            error, result = exc, None
+        try:
+            self.commit_batch()
+        except BaseException:
+            self.abort_batch()
+            raise
+        if error is not None:
+            raise error
+        return result
+
+    def update(self, row_id, changes):
+        """
+        Apply ``changes`` to a row; unknown fields and the key are ignored.
+        ``changes`` may be a callable taking the current row, which makes
+        read-modify-write updates atomic.
+        """
+        return (self.update_many({row_id: changes}) or [None])[0]
+
+
+class TableStore(StoreBase):
+    """
+    Process-wide, in-memory view of one CSV table.
+
+    The file is parsed once and kept resident together with hash indexes on
+    the primary key and on each field listed in ``indexes``. Mutations are
+    not written back by rewriting the CSV: each one is appended as a small
+    record to a journal beside it (``<file>.journal``), and the resident
+    state is the CSV snapshot with the journal replayed on top. Once the
+    journal grows past ``compact_bytes`` a background thread folds it back
+    into a fresh snapshot.
+
+    Both files' signatures are checked on every access: a grown journal is
+    replayed incrementally, anything else that changed triggers a re-parse.
+
+    With a ``writer`` (see writer.WriteQueue) every mutation runs on the
+    single writer thread and concurrent mutations share one journal append
+    and fsync (group commit). Batches hold an exclusive lock on
+    ``<file>.lock`` and catch up with the journal first, so several
+    processes can write the same table without losing updates.
+
+    Resident rows are compact read-only records (see records.Record) with the
+    values of the ``interned`` fields shared between rows. Rows returned by
+    ``all`` and ``find`` are those shared records; ``get`` returns a private
+    dict copy.
+
+    The CSV itself is only parsed when its binary snapshot (``<file>.snap``,
+    see snapshot.py) is missing or older than the file; the snapshot is then
+    rebuilt. Otherwise loading maps the snapshot, decodes just the key column
+    and takes the indexes as stored, and the rows read their values from the
+    mapping when asked (snapshot.SnapshotRow). Rows changed since are
+    ordinary records.
+
+    Derived structures (search indexes and the like) can follow the table with
+    ``add_listener``: the callback receives ``(event, old_row, new_row)`` for
+    'insert', 'update' and 'delete', and ``('reload', None, None)`` after the
+    file was re-parsed, in which case it should rebuild from ``all()``.
+    """
+
+    def __init__(self, path, fieldnames, indexes=(), key='id', compact_bytes=None, writer=None,
+                 interned=(), snapshot=None):
+        self.path = path
+        self.lock_path = path + '.lock'
+        if snapshot is None:
+            snapshot = snapshots_enabled()
+        self.snapshot_path = path + '.snap' if snapshot else None
+        self.snapshot = None
+        self.writer = writer
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.index_fields = tuple(indexes)
+        # Indexed values repeat by definition, so they are always interned
+        self._record = record_type(self.fieldnames, set(interned) | set(self.index_fields))
+        self.journal = Journal(path + '.journal')
+        if compact_bytes is None:
+            compact_bytes = int(os.environ.get('WORKMATE_JOURNAL_COMPACT_BYTES', DEFAULT_COMPACT_BYTES))
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._indexes = {field: {} for field in self.index_fields}
+        self._positions = {}
+        self._next_position = 0
+        self._max_id = 0
+        self._unsorted = set()
+        self._csv_signature = None
+        self._journal_signature = None
+        self._journal_offset = 0
+        self._seq = 0
+        self._loaded = False
+        self._compacting = False
+        self._compact_lock = threading.Lock()
+        self._batch_lock = threading.RLock()
+        self._batch_file_lock = None
+        self._batch_owner = None
+        self._pending_records = []
+        self._listeners = []
+
+    # Loading
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _ensure_fresh(self):
+        csv_signature = self._file_signature()
+        journal_signature = self.journal.signature()
+        if self._loaded and csv_signature == self._csv_signature:
+            if journal_signature == self._journal_signature:
+                return
+            if (journal_signature is not None and self._journal_signature is not None
+                    and journal_signature[0] == self._journal_signature[0]
+                    and journal_signature[1] > self._journal_signature[1]):
+                # Same log, more records: replay just the new tail
+                self._replay_tail()
+                self._journal_signature = journal_signature
+                return
+        self._load(csv_signature, journal_signature)
+
+    def _load(self, csv_signature, journal_signature):
+        snapshot, rows = None, []
+        if csv_signature is not None:
+            snapshot = self._open_snapshot(csv_signature)
+            if snapshot is None:
+                rows = read_csv(self.path)
+                snapshot = self._build_snapshot(rows, csv_signature)
+        self._rows = {}
+        self._indexes = {field: {} for field in self.index_fields}
+        self._positions = {}
+        self._next_position = 0
+        self._max_id = 0
+        self._unsorted = set()
+        self._seq = 0
+        if snapshot is not None:
+            self._add_snapshot(snapshot)
+        else:
+            for row in rows:
+                self._add(self._record.from_mapping(row))
+        self.snapshot = snapshot
+        records, self._journal_offset = self.journal.read(0)
+        for record in records:
+            self._replay(record, notify=False)
+        self._csv_signature = csv_signature
+        self._journal_signature = journal_signature
+        self._loaded = True
+        self._notify('reload', None, None)
+
+    def _open_snapshot(self, csv_signature):
+        if self.snapshot_path is None:
+            return None
+        return Snapshot.open(self.snapshot_path, self.fieldnames, csv_signature, self._record._interned)
+
+    def _write_snapshot(self, rows, csv_signature):
+        if self.snapshot_path is None:
+            return False
+        try:
+            write_snapshot(self.snapshot_path, self.fieldnames, rows, self.index_fields, self.key, csv_signature)
+        except OSError:
+            return False
+        return True
+
+    def _build_snapshot(self, rows, csv_signature):
+        # Freshly parsed rows are written out so the next load (here or in another process) can map them
+        if not self._write_snapshot(rows, csv_signature):
+            return None
+        return self._open_snapshot(csv_signature)
+
+    def _add_snapshot(self, snapshot):
+        keys = snapshot.keys
+        by_number = [SnapshotRow(snapshot, number) for number in range(snapshot.rows)]
+        self._rows = dict(zip(keys, by_number))
+        self._positions = {row_id: number for number, row_id in enumerate(keys)}
+        self._next_position = snapshot.rows
+        self._max_id = snapshot.max_id
+        unique = len(self._rows) == snapshot.rows
+        for field in self.index_fields:
+            index = self._indexes[field]
+            for value, numbers in snapshot.index(field).items():
+                if unique:
+                    bucket = dict(zip(map(keys.__getitem__, numbers), map(by_number.__getitem__, numbers)))
+                else:
+                    # With duplicate ids only the row that won (the last one) is indexed
+                    bucket = {keys[number]: by_number[number] for number in numbers
+                              if self._rows[keys[number]] is by_number[number]}
+                if bucket:
+                    index[value] = bucket
+
+    def load_state(self):
+        if not self._loaded:
+            return 'loading'
+        if self.snapshot is not None:
+            return 'mapped'
+        if self.snapshot_path is None or self._csv_signature is None:
+            return 'ready'
+        return 'parsed'
+
+    def _replay_tail(self):
+        records, self._journal_offset = self.journal.read(self._journal_offset)
+        for record in records:
+            self._replay(record, notify=True)
+
+    def _replay(self, record, notify):
+        self._seq = max(self._seq, record.get('seq', 0))
+        op = record.get('op')
+        if op == 'insert':
+            row = self._record.from_mapping(record['row'])
+            current = self._rows.get(row[self.key])
+            if current is not None:
+                self._replace(current, row)
+            else:
+                self._add(row)
+            if notify:
+                self._notify('update' if current is not None else 'insert', current, row)
+        elif op == 'update':
+            current = self._rows.get(record['id'])
+            if current is not None:
+                updated = dict(current)
+                updated.update(record['changes'])
+                updated = self._record.from_mapping(updated)
+                self._replace(current, updated)
+                if notify:
+                    self._notify('update', current, updated)
+        elif op == 'delete':
+            current = self._rows.get(record['id'])
+            if current is not None:
+                self._remove(current)
+                if notify:
+                    self._notify('delete', current, None)
+        elif op == 'base':
+            # Ids are never reused, even those of rows deleted before the last compaction
+            self._max_id = max(self._max_id, record.get('max_id', 0))
+
+    def refresh(self):
+        """Pick up changes made to the files by other processes."""
+        with self._lock:
+            self._ensure_fresh()
+
+    def reload(self):
+        """Force a re-parse of the snapshot and journal."""
+        with self._lock:
+            self._load(self._file_signature(), self.journal.signature())
+
+    # Index maintenance
+    def _add(self, row):
+        row_id = row[self.key]
+        self._rows[row_id] = row
+        self._positions[row_id] = self._next_position
+        self._next_position += 1
+        if row_id.isdigit() and int(row_id) > self._max_id:
+            self._max_id = int(row_id)
+        for field, index in self._indexes.items():
+            index.setdefault(row.get(field, ''), {})[row_id] = row
+
+    def _bucket_insert(self, field, value, row_id, row):
+        # Buckets list rows in file order; a row moving into a bucket may land
+        # out of order, so flag the bucket and re-sort it lazily on the next read
+        bucket = self._indexes[field].setdefault(value, {})
+        if bucket and self._positions[next(reversed(bucket))] > self._positions[row_id]:
+            self._unsorted.add((field, value))
+        bucket[row_id] = row
+
+    def _remove(self, row):
+        row_id = row[self.key]
+        self._rows.pop(row_id, None)
+        self._positions.pop(row_id, None)
+        for field, index in self._indexes.items():
+            value = row.get(field, '')
+            bucket = index.get(value)
+            if bucket is not None:
+                bucket.pop(row_id, None)
+                if not bucket:
+                    del index[value]
+
+    def _replace(self, current, updated):
+        # Keep the row's position in the table; only the secondary indexes move
+        row_id = current[self.key]
+        self._rows[row_id] = updated
+        for field, index in self._indexes.items():
+            old_value, new_value = current.get(field, ''), updated.get(field, '')
+            if old_value == new_value:
+                index[old_value][row_id] = updated
+                continue
+            bucket = index[old_value]
+            bucket.pop(row_id, None)
+            if not bucket:
+                del index[old_value]
+            self._bucket_insert(field, new_value, row_id, updated)
+
+    # Reads
+    def all(self):
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._rows.values())
+
+    def get(self, row_id):
+        with self._lock:
+            self._ensure_fresh()
+            row = self._rows.get(str(row_id))
+            return dict(row) if row is not None else None
+
+    def find(self, field, value):
+        """Return rows whose ``field`` equals ``value`` using the hash index."""
+        with self._lock:
+            self._ensure_fresh()
+            if field == self.key:
+                row = self._rows.get(value)
+                return [row] if row is not None else []
+            if field not in self._indexes:
+                return [row for row in self._rows.values() if row.get(field) == value]
+            if (field, value) in self._unsorted:
+                self._unsorted.discard((field, value))
+                bucket = self._indexes[field].get(value, {})
+                self._indexes[field][value] = dict(
+                    sorted(bucket.items(), key=lambda item: self._positions[item[0]]))
+            return list(self._indexes[field].get(value, {}).values())
+
+    def count(self, field=None, value=None):
+        with self._lock:
+            self._ensure_fresh()
+            if field is None:
+                return len(self._rows)
+            return len(self._indexes[field].get(value, ()))
+
+    def next_id(self):
+        with self._lock:
+            self._ensure_fresh()
+            return str(self._max_id + 1)
+
+    def data_version(self):
+        """
+        Return (token, modified): the token changes with every mutation, made
+        here or by another process, and is the same in every process looking
+        at the same data; modified is when this process last saw a change.
+        Costs two stat calls, no row reads.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            mtime_ns, size = self._csv_signature or (0, 0)
+            return '%x-%x-%x' % (mtime_ns, size, self._seq), self._modified
+
+    # Writes
+    def _log(self, records):
+        # Stamp journal records; they are written out when the batch commits
+        for record in records:
+            self._seq += 1
+            record['seq'] = self._seq
+        self._pending_records.extend(records)
+
+    def begin_batch(self):
+        """Start a group of mutations: take the cross-process lock and catch up."""
+        self._batch_lock.acquire()
+        self._batch_owner = threading.get_ident()
+        try:
+            self._batch_file_lock = file_lock(self.lock_path)
+            self._batch_file_lock.__enter__()
+            with self._lock:
+                self._ensure_fresh()
+        except BaseException:
+            self._release_batch()
+            raise
+
+    def commit_batch(self):
+        """Durably append every record of the batch with one write and fsync."""
+        if self._pending_records:
+            with self._lock:
+                self._journal_offset = self.journal.append(self._pending_records)
+                self._journal_signature = self.journal.signature()
+                self._pending_records = []
+        self._release_batch()
+        if self._journal_offset >= self.compact_bytes and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def abort_batch(self):
+        """Drop a batch whose commit failed; memory is re-read from disk."""
+        with self._lock:
+            self._pending_records = []
+            self._loaded = False
+        self._release_batch()
+
+    def _release_batch(self):
+        if self._batch_file_lock is not None:
+            self._batch_file_lock.__exit__(None, None, None)
+            self._batch_file_lock = None
+        self._batch_owner = None
+        self._batch_lock.release()
+
+    def insert(self, row, unique=(), check=None):
+        """
+        Add a new row, allocating an id when none is given.
+        Raises DuplicateKeyError if a field listed in ``unique`` clashes.
+        ``check``, if given, is called with the normalized row on the writer
+        thread before anything is written and may raise to reject it.
+        """
+        return self._mutate(lambda: self._insert(row, unique, check))
+
+    def insert_many(self, rows):
+        """Add several rows (ids allocated in one block) in a single batch."""
+        return self._mutate(lambda: [self._insert(row, ()) for row in rows])
+
+    def _insert(self, row, unique, check=None):
+        with self._lock:
+            row = self._normalize(row)
+            for field in unique:
+                if row[field] and self.find(field, row[field]):
+                    raise DuplicateKeyError(field, row[field])
+            if check is not None:
+                check(row)
+            if not row[self.key]:
+                row[self.key] = self.next_id()
+            record = {'op': 'insert', 'row': row}
+            self._log([record])
+            self._replay(record, notify=True)
+            return dict(row)
+
+    def update_many(self, changes_by_id):
+        """Apply several row updates in a single batch."""
+        return self._mutate(lambda: self._update_many(changes_by_id))
+
+    def _update_many(self, changes_by_id):
+        with self._lock:
+            results = []
+            for row_id, changes in changes_by_id.items():
+                current = self._rows.get(str(row_id))
+                if current is None:
+                    continue
+                if callable(changes):
+                    changes = changes(dict(current))
+                changes = self._changes(changes)
+                record = {'op': 'update', 'id': current[self.key], 'changes': changes}
+                self._log([record])
+                self._replay(record, notify=True)
+                results.append(dict(self._rows[current[self.key]]))
+            return results
+
+    def delete(self, row_id):
+        return self._mutate(lambda: self._delete(row_id))
+
+    def _delete(self, row_id):
+        with self._lock:
+            current = self._rows.get(str(row_id))
+            if current is None:
+                return False
+            record = {'op': 'delete', 'id': current[self.key]}
+            self._log([record])
+            self._replay(record, notify=True)
+            return True
+
+    # Compaction
+    def compact(self):
+        """Fold the journal into a fresh CSV snapshot."""
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            self._ensure_fresh()
+            rows = list(self._rows.values())
+            seq = self._seq
+            max_id = self._max_id
+            offset = self._journal_offset
+            csv_signature = self._csv_signature
+        # The slow part (serializing the table) runs without blocking writers
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        write_csv(tmp_path, rows, self.fieldnames)
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        self.begin_batch()
+        try:
+            with self._lock:
+                if self._csv_signature != csv_signature:
+                    # Another process compacted meanwhile; its snapshot wins
+                    os.remove(tmp_path)
+                    return
+                os.replace(tmp_path, self.path)
+                # Records appended while the snapshot was written are carried over
+                tail = self.journal.read_bytes(offset)
+                self._journal_offset = self.journal.restart(seq, tail, max_id) + len(tail)
+                self._csv_signature = csv_signature = self._file_signature()
+                self._journal_signature = self.journal.signature()
+        finally:
+            self._release_batch()
+        # The new CSV gets its snapshot right away instead of on the next cold start
+        self._write_snapshot(rows, csv_signature)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            self._compacting = False
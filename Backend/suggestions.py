@@ -0,0 +1,202 @@
+import bisect
+import heapq
+import threading
+from collections import OrderedDict
+
+try:
+    from .algorithms import location_distance, normalize_location
+    from .geo import haversine_km
+    from .pagination import row_id
+except ImportError:
+    from algorithms import location_distance, normalize_location
+    from geo import haversine_km
+    from pagination import row_id
+
+# Suggestions kept per student; requests for more than this bypass the cache
+DEFAULT_SUGGESTIONS = 20
+# Students whose lists are kept; the least recently served are dropped first
+DEFAULT_MAX_STUDENTS = 2048
+
+
+class _Suggestions:
+    """One student's materialized list"""
+
+    __slots__ = ('point', 'origin', 'keys', 'rows', 'ranks', 'bound')
+
+    def __init__(self, point, origin):
+        self.point = point          # (lat, lon) of the student, None if unresolved
+        self.origin = origin        # normalized location for string distances
+        self.keys = []              # sorted rank keys: (tier, distance, numeric id)
+        self.rows = {}              # rank key -> job
+        self.ranks = {}             # job id -> rank key
+        self.bound = None           # every job ranked up to this key is listed; None: every job
+
+
+class SuggestionCache:
+    """
+    Materialized top-N job suggestions per student
+
+    Each list holds exactly the N best-ranked available jobs for its student
+    (all of them when there are fewer), ranked the same way as the suggestion
+    route: geocoded jobs by great-circle distance first, then the others by
+    string distance between locations. Job changes are applied to the cached
+    lists instead of discarding them: a new job is only inserted where it
+    beats the last entry, and a reverse index finds the lists holding a job
+    that is updated, taken or deleted. A student's list is rebuilt only when
+    their location changes, or when removals left it shorter than a request.
+    Lists are kept for at most ``max_students`` students, in LRU order.
+    """
+
+    def __init__(self, gazetteer, locator, jobs_store, size=DEFAULT_SUGGESTIONS,
+                 max_students=DEFAULT_MAX_STUDENTS, where=None, key='id'):
+        self.gazetteer = gazetteer
+        self.locator = locator
+        self.jobs_store = jobs_store
+        self.size = size
+        self.max_students = max_students
+        self.where = where
+        self.key = key
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # student id -> _Suggestions
+        self._holders = {}              # job id -> set of student ids whose list has it
+        self._generation = 0            # bumped by every change, to spot builds that raced one
+        self.hits = 0
+        self.misses = 0
+
+    # Maintenance
+    def attach(self, students_store):
+        """Follow job changes from the jobs store and location changes from ``students_store``"""
+        self.jobs_store.add_listener(self._on_job_change)
+        students_store.add_listener(self._on_student_change)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._holders.clear()
+            self._generation += 1
+
+    def _on_job_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.clear()
+            return
+        with self._lock:
+            self._generation += 1
+            if old_row is not None:
+                self._remove_job(old_row[self.key])
+            if new_row is not None and (self.where is None or self.where(new_row)):
+                for student_id, entry in self._entries.items():
+                    self._offer(student_id, entry, new_row)
+
+    def _on_student_change(self, event, old_row, new_row):
+        if event == 'reload':
+            self.clear()
+            return
+        if event == 'update' and old_row.get('location') == new_row.get('location'):
+            return
+        with self._lock:
+            self._generation += 1
+            self._drop(old_row[self.key] if old_row is not None else new_row[self.key])
+
+    def _remove_job(self, job_id):
+        for student_id in self._holders.pop(job_id, ()):
+            entry = self._entries[student_id]
+            rank_key = entry.ranks.pop(job_id)
+            del entry.rows[rank_key]
+            del entry.keys[bisect.bisect_left(entry.keys, rank_key)]
+
+    def _offer(self, student_id, entry, job):
+        rank_key = self._rank(entry, job)
+        if entry.bound is not None and rank_key > entry.bound:
+            # Unlisted jobs may rank anywhere past the bound
+            return
+        bisect.insort(entry.keys, rank_key)
+        entry.rows[rank_key] = job
+        entry.ranks[job[self.key]] = rank_key
+        self._holders.setdefault(job[self.key], set()).add(student_id)
+        if len(entry.keys) > self.size:
+            job_id = entry.rows.pop(entry.keys.pop())[self.key]
+            del entry.ranks[job_id]
+            self._release(job_id, student_id)
+            entry.bound = entry.keys[-1]
+
+    def _release(self, job_id, student_id):
+        holders = self._holders.get(job_id)
+        if holders is not None:
+            holders.discard(student_id)
+            if not holders:
+                del self._holders[job_id]
+
+    def _drop(self, student_id):
+        entry = self._entries.pop(student_id, None)
+        if entry is not None:
+            for job_id in entry.ranks:
+                self._release(job_id, student_id)
+
+    # Ranking
+    def _rank(self, entry, job):
+        if entry.point is not None:
+            point = self.gazetteer.resolve(job.get('location'))
+            if point is not None:
+                return (0, haversine_km(entry.point[0], entry.point[1], point[0], point[1]), row_id(job))
+        return (1, location_distance(entry.origin, normalize_location(job.get('location'))), row_id(job))
+
+    def _build(self, location):
+        point = self.gazetteer.resolve(location)
+        entry = _Suggestions(point, normalize_location(location))
+        if point is not None:
+            candidates = [job for _, job in self.locator.nearest(point[0], point[1], k=self.size)]
+            if len(candidates) < self.size:
+                # Top up with jobs whose location could not be geocoded
+                candidates += self.locator.unresolved_jobs()
+        else:
+            candidates = self.jobs_store.find('status', 'available')
+        candidates = {job[self.key]: job for job in candidates}.values()
+        ranked = heapq.nsmallest(self.size, ((self._rank(entry, job), job) for job in candidates
+                                             if self.where is None or self.where(job)),
+                                 key=lambda item: item[0])
+        entry.keys = [rank_key for rank_key, _ in ranked]
+        entry.rows = dict(ranked)
+        entry.ranks = {job[self.key]: rank_key for rank_key, job in ranked}
+        entry.bound = ranked[-1][0] if len(ranked) == self.size else None
+        return entry
+
+    # Queries
+    def suggestions(self, student, k):
+        """
+        Return the k best (distance_km, job) pairs for ``student``, with
+        distance_km None for jobs ranked by string distance, or None when k
+        is beyond what the cache keeps.
+        """
+        if k > self.size:
+            return None
+        # Pick up writes from other processes first (their events patch the lists)
+        self.jobs_store.refresh()
+        student_id = student[self.key]
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None and (entry.bound is None or len(entry.keys) >= k):
+                self._entries.move_to_end(student_id)
+                self.hits += 1
+                return self._top(entry, k)
+            self.misses += 1
+            generation = self._generation
+
+        # Built outside the lock: the locator and the stores take their own
+        # locks, and store listeners call back into this cache
+        entry = self._build(student.get('location'))
+        with self._lock:
+            if generation == self._generation:
+                self._drop(student_id)
+                self._entries[student_id] = entry
+                for job_id in entry.ranks:
+                    self._holders.setdefault(job_id, set()).add(student_id)
+                while len(self._entries) > self.max_students:
+                    self._drop(next(iter(self._entries)))
+            return self._top(entry, k)
+
+    @staticmethod
+    def _top(entry, k):
+        return [(rank_key[1] if rank_key[0] == 0 else None, entry.rows[rank_key]) for rank_key in entry.keys[:k]]
+
+    def __len__(self):
+        return len(self._entries)
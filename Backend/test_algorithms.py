@@ -11,8 +11,13 @@ from algorithms import (
     linear_search_jobs,
     sort_jobs,
     dijkstra_nearest_jobs,
-    hungarian_job_assignment
+    hungarian_job_assignment,
+    flow_job_assignment,
+    assignment_cost_matrix,
+    levenshtein_distance
 )
+import itertools
+import random
 
 def test_linear_search():
     """Test linear search algorithm"""
@@ -85,6 +90,15 @@ def test_dijkstra():
     assert nearest_jobs[0]['location'] == 'New York'
     assert nearest_jobs[1]['location'] == 'New York'
     
+    # Top-k selection keeps the same order as the full ranking
+    for k in range(len(jobs) + 1):
+        assert dijkstra_nearest_jobs(student_location, jobs, k=k) == nearest_jobs[:k]
+    
+    # Banded Levenshtein gives up once the bound is exceeded
+    assert levenshtein_distance('brooklyn', 'brookln') == 1
+    assert levenshtein_distance('brooklyn', 'brookln', max_distance=1) == 1
+    assert levenshtein_distance('brooklyn', 'manhattan', max_distance=2) == 3
+    
     print("Dijkstra's Algorithm: PASSED\n")
 
 def test_hungarian():
@@ -115,8 +129,85 @@ def test_hungarian():
     assert len(assigned_students) == 3
     assert len(assigned_jobs) == 3
     
+    # Greedy row-by-row assignment is not optimal here: student 1 would take
+    # the Brooklyn job and leave student 2 with a location mismatch
+    students = [
+        {'id': '1', 'location': 'Queens', 'rating': '5'},
+        {'id': '2', 'location': 'Brooklyn', 'rating': '5'}
+    ]
+    jobs = [
+        {'id': '1', 'location': 'Brooklyn'},
+        {'id': '2', 'location': 'Bronx'}
+    ]
+    assignments = hungarian_job_assignment(students, jobs)
+    assert {(a['student_id'], a['job_id']) for a in assignments} == {('1', '2'), ('2', '1')}
+    assert sum(a['cost'] for a in assignments) == 11
+    
+    # More students than jobs: the best-matching students get the jobs
+    students = [
+        {'id': '1', 'location': 'Bronx', 'rating': '3'},
+        {'id': '2', 'location': 'Brooklyn', 'rating': '3'},
+        {'id': '3', 'location': 'Queens', 'rating': '3'}
+    ]
+    jobs = [{'id': '1', 'location': 'Queens'}]
+    assignments = hungarian_job_assignment(students, jobs)
+    assert assignments == [{'student_id': '3', 'job_id': '1', 'cost': 5.0}]
+    
     print("Hungarian Algorithm: PASSED\n")
 
+def best_assignment(students, jobs, capacities, headcounts):
+    # Brute force over every set of (student, job) pairs: (pairs assigned, total cost)
+    cost = assignment_cost_matrix(students, jobs)
+    cells = list(itertools.product(range(len(students)), range(len(jobs))))
+    best = (0, 0.0)
+    for size in range(1, len(cells) + 1):
+        for chosen in itertools.combinations(cells, size):
+            if all(sum(1 for i, _ in chosen if i == s) <= capacities[s] for s in range(len(students))) and \
+               all(sum(1 for _, j in chosen if j == k) <= headcounts[k] for k in range(len(jobs))):
+                total = sum(cost[i, j] for i, j in chosen)
+                if size > best[0] or total < best[1]:
+                    best = (size, total)
+    return best
+
+def test_flow_assignment():
+    """Test min-cost flow assignment with student capacities and job headcounts"""
+    print("Testing Min-Cost Flow Assignment...")
+    
+    # With one job per student and one student per job it agrees with the Hungarian algorithm
+    rng = random.Random(5)
+    for _ in range(50):
+        students = [{'id': str(i), 'location': rng.choice('ABC'), 'rating': rng.choice(['0', '2.5', '4.2', '5'])}
+                    for i in range(rng.randint(1, 6))]
+        jobs = [{'id': str(i), 'location': rng.choice('ABC')} for i in range(rng.randint(1, 6))]
+        flow = flow_job_assignment(students, jobs)
+        hungarian = hungarian_job_assignment(students, jobs)
+        assert len(flow) == len(hungarian)
+        assert abs(sum(a['cost'] for a in flow) - sum(a['cost'] for a in hungarian)) < 1e-9
+    
+    # A student can take several jobs, a job several students, never the same pair twice
+    for _ in range(40):
+        students = [{'id': str(i), 'location': rng.choice('AB'), 'rating': rng.choice(['1', '3.5', '5'])}
+                    for i in range(rng.randint(1, 3))]
+        jobs = [{'id': str(i), 'location': rng.choice('AB')} for i in range(rng.randint(1, 3))]
+        capacities = [rng.randint(0, 3) for _ in students]
+        headcounts = [rng.randint(0, 3) for _ in jobs]
+        assignments = flow_job_assignment(students, jobs,
+                                          {s['id']: c for s, c in zip(students, capacities)},
+                                          {j['id']: h for j, h in zip(jobs, headcounts)})
+        pairs = [(a['student_id'], a['job_id']) for a in assignments]
+        assert len(set(pairs)) == len(pairs)
+        size, total = best_assignment(students, jobs, capacities, headcounts)
+        assert len(assignments) == size
+        assert abs(sum(a['cost'] for a in assignments) - total) < 1e-9
+    
+    students = [{'id': '1', 'location': 'Queens', 'rating': '5'}]
+    jobs = [{'id': '1', 'location': 'Queens'}, {'id': '2', 'location': 'Bronx'}, {'id': '3', 'location': 'Queens'}]
+    assignments = flow_job_assignment(students, jobs, capacity=2)
+    assert [a['job_id'] for a in assignments] == ['1', '3']
+    assert flow_job_assignment(students, jobs, capacity=0) == []
+    
+    print("Min-Cost Flow Assignment: PASSED\n")
+
 def main():
     """Run all algorithm tests"""
     print("Testing Job Matching Platform Algorithms\n")
@@ -127,6 +218,7 @@ def main():
         test_sorting()
         test_dijkstra()
         test_hungarian()
+        test_flow_assignment()
         
         print("All algorithms are working correctly!")
         print("=" * 50)
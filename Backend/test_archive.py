@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for hot/cold partitioning of jobs and the append-only job archive
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from facets import FacetIndex
+from locations import LocationIndex
+from storage import open_stores
+
+
+def write_jobs(data_dir):
+    (data_dir / 'jobs.csv').write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,Manhattan,22,1,applied,7\n'
+    )
+    (data_dir / 'students.csv').write_text('id,name,email,password,location,bio,rating,jobs_completed\n')
+    (data_dir / 'providers.csv').write_text('id,name,email,password,company\n')
+
+def open_jobs(data_dir, backend):
+    jobs = open_stores(str(data_dir), backend=backend)['jobs']
+    # As `storage.py archive` does for tables written before partitioning
+    jobs.archive_cold_rows()
+    return jobs
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_finished_jobs_move_to_the_archive(tmp_path, backend):
+    """Test that only available jobs stay hot and history lookups still see every job"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, backend)
+    # Rows saved before partitioning have been moved out
+    assert [job['id'] for job in jobs.hot.all()] == ['1', '2']
+    assert jobs.archive.get('3')['assigned_student_id'] == '7'
+
+    jobs.update('1', {'status': 'applied', 'assigned_student_id': '7'})
+    jobs.update_many({'2': {'status': 'assigned', 'assigned_student_id': '8'}})
+    added = jobs.insert({'title': 'Barista', 'provider_id': '2', 'status': 'assigned', 'assigned_student_id': '8'})
+    assert added['id'] == '4'
+
+    assert jobs.hot.all() == []
+    assert [job['id'] for job in jobs.find('assigned_student_id', '7')] == ['1', '3']
+    assert [job['id'] for job in jobs.find('provider_id', '2')] == ['2', '4']
+    assert jobs.find('status', 'available') == []
+    assert jobs.count('status', 'applied') == 2
+    assert jobs.count() == 4
+    assert jobs.get('1')['status'] == 'applied'
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_restore_and_delete(tmp_path, backend):
+    """Test that a job made available again goes back to the hot store and deletes hide archived jobs"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, backend)
+    events = []
+    jobs.add_listener(lambda event, old, new: events.append((event, (old or new)['id'])))
+
+    jobs.update('3', lambda job: {'status': 'available', 'assigned_student_id': ''})
+    assert jobs.hot.get('3')['status'] == 'available'
+    assert [job['id'] for job in jobs.find('assigned_student_id', '7')] == []
+    assert jobs.count() == 3
+
+    jobs.update('1', {'status': 'applied'})
+    assert jobs.delete('1')
+    assert not jobs.delete('1')
+    assert jobs.get('1') is None
+    assert jobs.delete('2')
+    assert [job['id'] for job in jobs.all()] == ['3']
+    assert events == [('update', '3'), ('update', '1'), ('delete', '1'), ('delete', '2')]
+
+    # Deleted ids are not handed out again
+    assert jobs.insert({'title': 'New', 'status': 'available'})['id'] == '4'
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_other_handles_see_moves(tmp_path, backend):
+    """Test that a handle on the same files picks up rows another one archived"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, backend)
+    other = open_jobs(tmp_path, backend)
+    events = []
+    jobs.add_listener(lambda event, old, new: events.append(event))
+
+    other.update('1', {'status': 'applied', 'assigned_student_id': '9'})
+    jobs.refresh()
+    assert jobs.get('1')['assigned_student_id'] == '9'
+    assert [job['id'] for job in jobs.find('assigned_student_id', '9')] == ['1']
+    assert [job['id'] for job in jobs.hot.find('status', 'available')] == ['2']
+    assert 'insert' not in events and 'delete' not in events
+    assert jobs.next_id() == other.next_id() == '4'
+
+def test_opening_leaves_the_data_files_alone(tmp_path):
+    """Test that cold rows are only moved out when asked to, and are served from the hot store until then"""
+    write_jobs(tmp_path)
+    before = (tmp_path / 'jobs.csv').read_text()
+    jobs = open_stores(str(tmp_path), backend='csv')['jobs']
+    assert [job['id'] for job in jobs.find('status', 'applied')] == ['3']
+    assert jobs.count() == 3
+    assert (tmp_path / 'jobs.csv').read_text() == before
+    assert not os.path.exists(jobs.archive.path)
+
+    assert jobs.archive_cold_rows() == 1
+    assert [job['id'] for job in jobs.hot.all()] == ['1', '2']
+    assert jobs.archive_cold_rows() == 0
+
+def test_hot_row_wins_over_archived_copy(tmp_path):
+    """Test the state after a crash between the archive and hot commits"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, 'csv')
+    # The archive got the applied copy, the hot store never saw the update
+    jobs.archive.begin_batch()
+    jobs.archive.put(dict(jobs.get('2'), status='applied', assigned_student_id='7'))
+    jobs.archive.commit_batch()
+
+    assert jobs.get('2')['status'] == 'available'
+    assert [job['id'] for job in jobs.find('assigned_student_id', '7')] == ['3']
+    assert jobs.count() == 3
+
+def test_torn_archive_line_is_ignored(tmp_path):
+    """Test that a half-written last record is skipped by reads and dropped by the next write"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, 'csv')
+    with open(jobs.archive.path, 'a') as f:
+        f.write('{"op":"put","row":{"id":"9"')
+    reopened = open_jobs(tmp_path, 'csv')
+    assert [job['id'] for job in reopened.archive.all()] == ['3']
+    # The next write replaces it
+    reopened.update('1', {'status': 'applied'})
+    assert [job['id'] for job in open_jobs(tmp_path, 'csv').archive.all()] == ['1', '3']
+
+def test_indexes_are_built_without_reading_archived_rows(tmp_path, monkeypatch):
+    """Test that the facet and location indexes take archived jobs from the archive's resident values"""
+    write_jobs(tmp_path)
+    jobs = open_jobs(tmp_path, 'csv')
+    jobs.update('2', {'status': 'assigned', 'assigned_student_id': '8'})
+    summaries = jobs.summaries(('location', 'pay', 'provider_id', 'status'))
+    assert [(job['id'], job['location'], job['pay'], job['status']) for job in summaries] == [
+        ('1', 'New York', '25', 'available'), ('2', 'Brooklyn', '18', 'assigned'), ('3', 'Manhattan', '22', 'applied')]
+
+    def no_reads(key):
+        raise AssertionError('archived row %s was read' % key)
+    monkeypatch.setattr(jobs.archive, '_read_row', no_reads)
+    facets, locations = FacetIndex(), LocationIndex()
+    facets.attach(jobs)
+    locations.attach(jobs)
+    # A reload (e.g. after another process compacted the table) rebuilds them the same way
+    jobs.reload()
+    assert len(facets) == 3 and facets.search({'status': ['applied', 'assigned']}, limit=0)[1] == 2
+    assert locations.expand('Brooklin') == {'brooklyn'}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk upload parsing and validation
+"""
+
+import io
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from bulk import UploadError, iter_upload, job_from_upload, upload_format
+
+
+def parse(text, fmt):
+    stream = io.BytesIO(text.encode('utf-8') if isinstance(text, str) else text)
+    return list(iter_upload(stream, fmt))
+
+def test_upload_format():
+    """Test that the file extension wins over the media type"""
+    assert upload_format('text/csv') == 'csv'
+    assert upload_format('application/x-ndjson') == 'jsonl'
+    assert upload_format('application/octet-stream', 'jobs.JSONL') == 'jsonl'
+    with pytest.raises(UploadError):
+        upload_format('text/plain')
+
+def test_rows_are_reported_by_line():
+    """Test that bad records are reported with their line and the rest still parse"""
+    rows = parse('﻿title,location\nA,"Queens,\nNY"\nB,Bronx,extra\nC,Bronx\n', 'csv')
+    assert [(line, row and row['title'], error) for line, row, error in rows] == [
+        (3, 'A', None), (4, None, 'Row has more cells than the header'), (5, 'C', None)]
+
+    rows = parse('{"title": "A"}\nnope\n\n[1]\n{"title": "B"}\n', 'jsonl')
+    assert [(line, error) for line, _, error in rows] == [
+        (1, None), (2, 'Invalid JSON'), (4, 'Expected a JSON object'), (5, None)]
+
+    with pytest.raises(UploadError):
+        parse(b'title\n\xff\n', 'csv')
+    with pytest.raises(UploadError):
+        parse('{"title": "A"}', 'json')
+
+def test_job_from_upload():
+    """Test that uploaded jobs are normalized and missing fields named"""
+    job, error = job_from_upload({'title': ' Tutor ', 'location': 'Queens', 'pay': 20}, provider_id='7')
+    assert error is None
+    assert job == {'title': 'Tutor', 'description': '', 'location': 'Queens', 'pay': '20',
+                   'provider_id': '7', 'status': 'available', 'assigned_student_id': ''}
+    assert job_from_upload({'title': 'Tutor', 'location': ['x']}) == (None, 'Missing location, provider_id')
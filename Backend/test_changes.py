@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the job change feed and its server-sent event streams
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import urllib.request
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask, Response, jsonify, request
+
+from changes import ChangeFeed, StreamHub, event_stream
+from server import PreforkServer
+
+
+def events_in(data):
+    """(id, event, data) of every server-sent event in ``data``"""
+    events = []
+    for block in data.decode('utf-8').split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+def test_feed_numbers_events_across_handles(tmp_path):
+    """Test that two handles on one file share sequence numbers and see each other's events"""
+    path = str(tmp_path / 'changes.jsonl')
+    feed, other = ChangeFeed(path), ChangeFeed(path)
+    assert feed.publish([('create', {'job': {'id': '1'}}), ('apply', {'job_id': '1', 'student_id': '7'})]) == [1, 2]
+    assert other.publish([('delete', {'job_id': '1'})]) == [3]
+
+    assert feed.last_seq == 3
+    frames, last = feed.frames_since(1)
+    assert last == 3
+    assert events_in(frames) == [(2, 'apply', {'job_id': '1', 'student_id': '7'}), (3, 'delete', {'job_id': '1'})]
+    assert feed.frames_since(3) == (b'', 3)
+    assert events_in(ChangeFeed(path).frames_since(0)[0])[0] == (1, 'create', {'job': {'id': '1'}})
+
+def test_resume_beyond_the_ring_buffer_sends_reset(tmp_path):
+    """Test the bounded window: old positions get a reset, the file is cut back and still followed"""
+    path = str(tmp_path / 'changes.jsonl')
+    feed, other = ChangeFeed(path, capacity=5), ChangeFeed(path, capacity=5)
+    for number in range(12):
+        feed.publish([('update', {'job_id': str(number)})])
+    assert sum(1 for _ in open(path)) <= 10
+
+    assert events_in(other.frames_since(9)[0]) == [(10, 'update', {'job_id': '9'}), (11, 'update', {'job_id': '10'}),
+                                                   (12, 'update', {'job_id': '11'})]
+    assert events_in(other.frames_since(2)[0]) == [(12, 'reset', {'seq': 12})]
+    assert events_in(other.frames_since(50)[0]) == [(12, 'reset', {'seq': 12})]
+    feed.publish([('delete', {'job_id': '3'})])
+    assert other.last_seq == 13
+
+def test_event_stream_without_handoff_streams_itself(tmp_path):
+    """Test the development-server fallback: replay first, then events as they are published"""
+    feed = ChangeFeed(str(tmp_path / 'changes.jsonl'))
+    feed.publish([('create', {'job': {'id': '1'}})])
+    stream = event_stream(feed, 0)
+    first = next(stream)
+    assert first.startswith(b'retry: ')
+    assert [event[:2] for event in events_in(first)] == [(1, 'create')]
+    feed.publish([('delete', {'job_id': '1'})])
+    assert events_in(next(stream)) == [(2, 'delete', {'job_id': '1'})]
+
+
+def read_until(connection, predicate, timeout=5):
+    connection.settimeout(timeout)
+    data = b''
+    while not predicate(data):
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_idle_streams_do_not_hold_request_threads(tmp_path):
+    """Test more open streams than threads on the pre-fork server, all receiving new events"""
+    path = str(tmp_path / 'changes.jsonl')
+    app = Flask(__name__)
+    feed = ChangeFeed(path)
+    hub = StreamHub(feed)
+    app.add_url_rule('/changes', 'changes', lambda: Response(
+        event_stream(feed, int(request.args.get('since', 0)), hub, request.environ.get('workmate.detach')),
+        mimetype='text/event-stream'))
+    app.add_url_rule('/ping', 'ping', lambda: jsonify('pong'))
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    master = os.fork()
+    if master == 0:
+        try:
+            PreforkServer(app, '127.0.0.1', port, workers=1, threads=2, graceful_timeout=1).run()
+        finally:
+            os._exit(0)
+    streams = []
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                urllib.request.urlopen('http://127.0.0.1:%d/ping' % port, timeout=5).read()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+        ChangeFeed(path).publish([('create', {'job': {'id': '1'}})])
+
+        for _ in range(5):
+            connection = socket.create_connection(('127.0.0.1', port))
+            connection.sendall(b'GET /changes?since=0 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            head = read_until(connection, lambda data: b'event: create' in data)
+            assert b'200 OK' in head and b'text/event-stream' in head
+            streams.append(connection)
+        # Five open streams, two threads: requests are still served
+        assert urllib.request.urlopen('http://127.0.0.1:%d/ping' % port, timeout=5).read() == b'"pong"\n'
+
+        ChangeFeed(path).publish([('apply', {'job_id': '1', 'student_id': '7'})])
+        for connection in streams:
+            assert b'event: apply' in read_until(connection, lambda data: b'event: apply' in data)
+    finally:
+        for connection in streams:
+            connection.close()
+        os.kill(master, signal.SIGTERM)
+        os.waitpid(master, 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the bitmap facet index behind /api/jobs/filter
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from algorithms import parse_pay
+from facets import FACETS, FacetIndex, pay_bucket, popcount
+from geo import normalize_location
+from storage import open_stores
+
+LOCATIONS = ['Manhattan', 'Brooklyn', 'brooklyn ', 'Queens', '']
+STATUSES = ['available', 'available', 'applied', 'assigned']
+
+
+def write_tables(data_dir):
+    (data_dir / 'jobs.csv').write_text('id,title,description,location,pay,provider_id,status,assigned_student_id\n')
+    (data_dir / 'students.csv').write_text('id,name,email,password,location,bio,rating,jobs_completed\n')
+    (data_dir / 'providers.csv').write_text('id,name,email,password,company\n')
+
+def random_job(rng):
+    return {'title': 'Job', 'location': rng.choice(LOCATIONS), 'pay': rng.choice(['12', '18.5', '20', '25', '60', 'n/a']),
+            'provider_id': str(rng.randint(1, 4)), 'status': rng.choice(STATUSES)}
+
+def matches(job, filters, pay_min, pay_max, excluded=None):
+    for facet, values in filters.items():
+        if facet == excluded or not values:
+            continue
+        wanted = {normalize_location(value) for value in values} if facet == 'location' else set(values)
+        value = normalize_location(job['location']) if facet == 'location' else job[facet]
+        if value not in wanted:
+            return False
+    pay = parse_pay(job['pay'])
+    return excluded == 'pay' or ((pay_min is None or pay >= pay_min) and (pay_max is None or pay <= pay_max))
+
+def expected(jobs, filters, pay_min, pay_max):
+    # Brute force: test every job against every filter
+    ids = [job['id'] for job in jobs if matches(job, filters, pay_min, pay_max)]
+    facets = {}
+    for facet in FACETS + ('pay',):
+        counts = {}
+        for job in jobs:
+            if matches(job, filters, pay_min, pay_max, excluded=facet):
+                value = pay_bucket(parse_pay(job['pay'])) if facet == 'pay' else job[facet]
+                value = normalize_location(value) if facet == 'location' else value
+                counts[value] = counts.get(value, 0) + 1
+        facets[facet] = counts
+    return ids, facets
+
+def check(index, jobs, rng):
+    for _ in range(20):
+        filters = {facet: rng.sample(values, rng.randint(0, 2)) for facet, values in
+                   (('location', LOCATIONS), ('provider_id', ['1', '2', '3', '9']), ('status', STATUSES))}
+        pay_min, pay_max = rng.choice([None, 15, 20]), rng.choice([None, 20, 30])
+        rows, total, facets, _ = index.search(filters, pay_min, pay_max)
+        ids, counts = expected(jobs.all(), filters, pay_min, pay_max)
+        assert [row['id'] for row in rows] == ids and total == len(ids)
+        facets['location'] = {normalize_location(label): count for label, count in facets['location'].items()}
+        assert facets == counts
+
+def test_filters_and_counts_match_a_full_scan(tmp_path):
+    """Test results and facet counts against brute force while jobs are added, moved and deleted"""
+    write_tables(tmp_path)
+    jobs = open_stores(str(tmp_path))['jobs']
+    rng = random.Random(7)
+    jobs.insert_many([random_job(rng) for _ in range(60)])
+    index = FacetIndex()
+    index.attach(jobs)
+    check(index, jobs, rng)
+
+    for _ in range(40):
+        job_id = str(rng.randint(1, 70))
+        action = rng.random()
+        if action < 0.5:
+            jobs.update(job_id, {'status': rng.choice(STATUSES), 'pay': rng.choice(['9', '20', '45'])})
+        elif action < 0.7:
+            jobs.delete(job_id)
+        else:
+            jobs.insert(random_job(rng))
+    assert len(index) == jobs.count()
+    check(index, jobs, rng)
+
+def test_pages_follow_id_order(tmp_path):
+    """Test that limit and after walk the matches in id order without reading the others"""
+    write_tables(tmp_path)
+    jobs = open_stores(str(tmp_path))['jobs']
+    jobs.insert_many([{'title': str(n), 'location': 'Queens', 'pay': str(10 + n), 'provider_id': '1',
+                       'status': 'available'} for n in range(12)])
+    index = FacetIndex()
+    index.attach(jobs)
+
+    seen, after = [], None
+    while True:
+        rows, total, facets, after = index.search({'location': ['QUEENS']}, pay_min=12, after=after, limit=4)
+        seen += [row['id'] for row in rows]
+        if after is None:
+            break
+    assert seen == [str(n) for n in range(3, 13)] and total == 10
+    assert facets['location'] == {'Queens': 10} and facets['pay'] == {'10-15': 5, '15-20': 5, '20-25': 2}
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_changes_from_other_processes(tmp_path, backend):
+    """Test that jobs another handle archives or changes in the archive are followed"""
+    write_tables(tmp_path)
+    jobs = open_stores(str(tmp_path), backend=backend)['jobs']
+    jobs.insert_many([{'title': 'A', 'provider_id': '1', 'status': 'available'},
+                      {'title': 'B', 'provider_id': '1', 'status': 'applied'}])
+    index = FacetIndex()
+    index.attach(jobs)
+
+    other = open_stores(str(tmp_path), backend=backend)['jobs']
+    other.update('1', {'status': 'applied'})
+    other.update('2', {'status': 'assigned'})
+    assert index.search({'status': ['applied']})[:2] == ([jobs.get('1')], 1)
+    assert index.search()[2]['status'] == {'applied': 1, 'assigned': 1}
+    other.delete('2')
+    assert index.search()[1] == 1
+
+def test_popcount_fallback_matches():
+    """Test the bin() popcount used before Python 3.10 against int.bit_count"""
+    rng = random.Random(5)
+    for bitmap in [0, 1, 2 ** 64 - 1] + [rng.getrandbits(rng.randint(1, 300)) for _ in range(50)]:
+        assert popcount(bitmap) == bin(bitmap).count('1')
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the gazetteer and spatial job index
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from geo import Gazetteer, KDTree, SpatialJobIndex, haversine_km
+
+
+def test_gazetteer_resolution():
+    """Test normalized, alias and 'City, State' lookups"""
+    gazetteer = Gazetteer([('New York', 40.7128, -74.0060), ('NYC', 40.7128, -74.0060)])
+
+    assert gazetteer.resolve('new  york') == (40.7128, -74.0060)
+    assert gazetteer.resolve('NYC') == (40.7128, -74.0060)
+    assert gazetteer.resolve('New York, NY') == (40.7128, -74.0060)
+    assert gazetteer.resolve('Atlantis') is None
+
+def test_kdtree_matches_brute_force():
+    """Test nearest-first iteration against a full sort"""
+    rng = random.Random(7)
+    points = [(i, rng.uniform(-60, 60), rng.uniform(-180, 180)) for i in range(300)]
+    tree = KDTree(points)
+
+    for _ in range(20):
+        lat, lon = rng.uniform(-60, 60), rng.uniform(-180, 180)
+        expected = sorted(haversine_km(lat, lon, p_lat, p_lon) for _, p_lat, p_lon in points)
+        got = [distance for distance, _ in tree.iter_nearest(lat, lon)]
+        assert all(abs(a - b) < 1e-6 for a, b in zip(got, expected))
+
+        within = [distance for distance, _ in tree.iter_nearest(lat, lon, max_km=2000)]
+        assert len(within) == sum(1 for d in expected if d <= 2000)
+
+def test_spatial_job_index():
+    """Test top-k, radius and unresolved bookkeeping"""
+    gazetteer = Gazetteer([
+        ('Manhattan', 40.7831, -73.9712),
+        ('Brooklyn', 40.6782, -73.9442),
+        ('Boston', 42.3601, -71.0589)
+    ])
+    index = SpatialJobIndex(gazetteer, where=lambda job: job['status'] == 'available')
+    index.rebuild([
+        {'id': '1', 'location': 'Boston', 'status': 'available'},
+        {'id': '2', 'location': 'Brooklyn', 'status': 'available'},
+        {'id': '3', 'location': 'Manhattan', 'status': 'available'},
+        {'id': '4', 'location': 'Brooklyn', 'status': 'applied'},
+        {'id': '5', 'location': 'Springfield', 'status': 'available'}
+    ])
+
+    nearest = index.nearest(40.6782, -73.9442, k=2)
+    assert [job['id'] for _, job in nearest] == ['2', '3']
+    assert nearest[0][0] == 0
+
+    assert [job['id'] for _, job in index.nearest(40.6782, -73.9442, k=5, radius_km=50)] == ['2', '3']
+    assert [job['id'] for job in index.unresolved_jobs()] == ['5']
+
+    index.remove('2')
+    assert [job['id'] for _, job in index.nearest(40.6782, -73.9442, k=1)] == ['3']
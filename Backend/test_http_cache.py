@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for conditional GET and response compression
+"""
+
+import gzip
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+
+import http_cache
+from http_cache import conditional, gzip_response
+from store import TableStore
+
+
+def make_app(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text('id,title,pay\n' + ''.join('%d,Job %d,%d\n' % (n, n, 10 + n) for n in range(1, 101)))
+    store = TableStore(str(path), ['id', 'title', 'pay'])
+    app = Flask(__name__)
+    app.after_request(gzip_response)
+    calls = []
+
+    @app.route('/jobs')
+    @conditional(store)
+    def jobs():
+        calls.append(1)
+        return jsonify([dict(job) for job in store.all()])
+
+    @app.route('/jobs/<job_id>')
+    @conditional(store)
+    def job(job_id):
+        found = store.get(job_id)
+        return jsonify(found) if found else (jsonify({'error': 'Job not found'}), 404)
+
+    return app.test_client(), store, calls
+
+def test_if_none_match_skips_the_view(tmp_path):
+    """Test 304s for an unchanged table and a fresh body after a write"""
+    client, store, calls = make_app(tmp_path)
+
+    first = client.get('/jobs')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/jobs', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    assert len(calls) == 1
+
+    store.update('1', {'pay': '99'})
+    changed = client.get('/jobs', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert changed.json[0]['pay'] == '99'
+
+    missing = client.get('/jobs/999')
+    assert missing.status_code == 404 and 'ETag' not in missing.headers
+
+def test_large_bodies_are_gzipped(tmp_path, monkeypatch):
+    """Test the size threshold and Accept-Encoding negotiation"""
+    client, _, _ = make_app(tmp_path)
+    monkeypatch.setattr(http_cache, 'GZIP_MIN_BYTES', 1024)
+
+    plain = client.get('/jobs')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    packed = client.get('/jobs', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert len(packed.data) < len(plain.data)
+    assert gzip.decompress(packed.data) == plain.data
+
+    small = client.get('/jobs/1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
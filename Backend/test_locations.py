@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the BK-tree location vocabulary behind typo-tolerant location lookups
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from algorithms import levenshtein_distance
+from locations import BKTree, LocationIndex, typo_budget
+from store import TableStore
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+
+
+def test_bk_tree_matches_a_full_scan():
+    """Test that searches return exactly the words a pairwise comparison would"""
+    rng = random.Random(3)
+    words = sorted({''.join(rng.choice('abcde') for _ in range(rng.randint(1, 7))) for _ in range(400)})
+    tree = BKTree(words)
+    assert len(tree) == len(words) and not tree.add(words[0])
+
+    for _ in range(50):
+        query = ''.join(rng.choice('abcdef') for _ in range(rng.randint(0, 8)))
+        for max_distance in (0, 1, 2):
+            expected = sorted((levenshtein_distance(query, word), word) for word in words
+                              if levenshtein_distance(query, word) <= max_distance)
+            assert tree.search(query, max_distance) == expected
+
+def test_index_follows_the_table(tmp_path):
+    """Test that new, changed and unused locations are picked up as the table changes"""
+    (tmp_path / 'jobs.csv').write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,brooklyn,22,1,applied,7\n'
+    )
+    jobs = TableStore(str(tmp_path / 'jobs.csv'), JOB_FIELDS)
+    index = LocationIndex()
+    index.attach(jobs)
+
+    assert index.similar('Brookln') == [('brooklyn', 1, 2)]
+    assert index.expand('new  york!') == {'new york'}
+    assert index.suggest('Brooklin') == [{'location': 'Brooklyn', 'distance': 1, 'count': 2}]
+    assert index.suggest('Brooklyn') == []
+
+    jobs.insert({'title': 'Barista', 'location': 'Brooklyn Heights', 'status': 'available'})
+    jobs.update('1', {'location': 'Bronx'})
+    assert index.expand('brooklyn heigts') == {'brooklyn heights'}
+    assert index.expand('new york') == set()
+    assert [match for match, _, _ in index.similar('Brons', max_distance=3)] == ['bronx']
+
+    # A location nobody uses any more drops out, and comes back when used again
+    jobs.delete('2')
+    jobs.delete('3')
+    assert index.suggest('Brookln') == []
+    jobs.insert({'title': 'Courier', 'location': 'BROOKLYN', 'status': 'available'})
+    assert index.suggest('Brookln') == [{'location': 'BROOKLYN', 'distance': 1, 'count': 1}]
+    assert len(index) == 3
+
+def test_typo_budget_grows_with_length():
+    """Test that short names must match exactly and long ones tolerate two edits"""
+    assert [typo_budget(place) for place in ('ny', 'nyc', 'bronx', 'brooklyn', 'manhattan')] == [0, 0, 1, 2, 2]
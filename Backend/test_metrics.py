@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics and the sampling profiler
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from metrics import (ALGORITHM_ROWS, ALGORITHM_SECONDS, IO_ROWS, Callback, Counter, Gauge, Histogram, Registry,
+                     record_io, timed)
+from profiler import SamplingProfiler
+
+
+def test_render_exposition_format():
+    """Test counters, histograms and callbacks in the text exposition format"""
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests', ['route'], registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=registry)
+    Callback('rows', 'Rows', ['table'], lambda: {('jobs',): 3}, registry=registry)
+
+    requests.labels('/a "b"\n').inc()
+    requests.labels('/a "b"\n').inc(2)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert lines[:3] == ['# HELP requests_total Requests', '# TYPE requests_total counter',
+                         'requests_total{route="/a \\"b\\"\\n"} 3']
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum 3.65' in lines
+    assert 'latency_seconds_count 4' in lines
+    assert 'rows{table="jobs"} 3' in lines
+
+def test_timed_records_calls_and_rows():
+    """Test that a timed algorithm records one observation and its row count per call"""
+    @timed(rows_arg=0, name='test_algorithm')
+    def algorithm(rows):
+        return sorted(rows)
+
+    assert algorithm([3, 1, 2]) == [1, 2, 3]
+    algorithm(iter([1]))  # unsized input: timed, rows not counted
+    assert ALGORITHM_SECONDS.labels('test_algorithm').snapshot()[2] == 2
+    assert ALGORITHM_ROWS.labels('test_algorithm').value == 3
+    assert algorithm.__name__ == 'algorithm'
+
+def test_temporary_files_count_as_their_table():
+    """Test that pid-suffixed temporary copies share the series of the file they replace"""
+    before = IO_ROWS.labels('metrics_test.csv', 'write').value
+    record_io('/data/metrics_test.csv.%d.tmp' % os.getpid(), 'write', 3, 30, 0.01)
+    record_io('/data/metrics_test.csv.99999.tmp', 'write', 2, 20, 0.01)
+    assert IO_ROWS.labels('metrics_test.csv', 'write').value == before + 5
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_shared_registry_sums_every_process(tmp_path):
+    """Test that counters and histograms add up over forked workers, exited ones included"""
+    registry = Registry()
+    hits = Counter('hits_total', 'Hits', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(1,), registry=registry)
+    level = Gauge('level', 'Level', registry=registry)
+    hits.inc(2)  # recorded before forking: counted once, by this process
+    level.set(1)
+    registry.share(str(tmp_path))
+
+    workers = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:
+            registry.forked()
+            hits.inc(10)
+            latency.observe(0.5)
+            level.set(99)
+            registry.publish(force=True)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        workers.append(pid)
+    lines = registry.render().splitlines()
+    assert 'hits_total 22' in lines and 'latency_seconds_count 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines and 'level 1' in lines
+
+    for pid in workers:
+        registry.retire(pid)
+    assert sorted(os.listdir(tmp_path)) == ['%d.json' % os.getpid(), 'retired.json']
+    hits.inc()
+    assert 'hits_total 23' in registry.render().splitlines()
+
+def test_sampling_profiler_sees_busy_function():
+    """Test that the profiler attributes samples to the function keeping the thread busy"""
+    def busy_loop():
+        deadline = time.perf_counter() + 0.2
+        while time.perf_counter() < deadline:
+            pass
+
+    profiler = SamplingProfiler(threading.get_ident(), interval=0.002).start()
+    busy_loop()
+    profiler.stop()
+    assert profiler.samples
+    top_stack, _ = profiler.samples.most_common(1)[0]
+    assert 'busy_loop' in top_stack
+    assert profiler.collapsed().splitlines()[0].startswith(top_stack)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for cursor pagination and streamed JSON listings
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, row_id, select_page, stream_json_array
+
+JOBS = [
+    {'id': '1', 'pay': '25'},
+    {'id': '2', 'pay': '18'},
+    {'id': '3', 'pay': '25'},
+    {'id': '4', 'pay': '30'},
+    {'id': '5', 'pay': '18'},
+]
+
+
+def walk(entries, limit, reverse=False):
+    pages, after = [], None
+    while True:
+        rows, next_key = select_page(entries, after, limit, reverse)
+        pages.append([row['id'] for row in rows])
+        if next_key is None:
+            return pages
+        after = decode_cursor(encode_cursor(next_key))
+
+def test_pages_follow_sort_order():
+    """Test that walking the cursors visits every row once, ties in id order"""
+    ascending = [((float(job['pay']), row_id(job)), job) for job in JOBS]
+    assert walk(ascending, 2) == [['2', '5'], ['1', '3'], ['4']]
+
+    descending = [((float(job['pay']), -row_id(job)), job) for job in JOBS]
+    assert walk(descending, 2, reverse=True) == [['4', '1'], ['3', '2'], ['5']]
+    assert walk(descending, 5, reverse=True) == [['4', '1', '3', '2', '5']]
+
+def test_invalid_cursors_and_streaming():
+    """Test cursor validation and that the streamed array is the plain JSON array"""
+    for cursor in ('not a cursor', encode_cursor(['x'])[:-2] + '!!', encode_cursor([True])):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+    with pytest.raises(ValueError):
+        select_page([((1.0, 1), JOBS[0])], after=('Brooklyn', 2), limit=1)
+
+    chunks = list(stream_json_array(JOBS, chunk_rows=2))
+    assert len(chunks) == 5
+    assert json.loads(''.join(chunks)) == JOBS
+    assert ''.join(stream_json_array([])) == '[]'
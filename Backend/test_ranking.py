@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized multi-criteria ranking engine
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import math
+
+import pytest
+
+from geo import Gazetteer, haversine_km, normalize_location
+from ranking import DEFAULT_WEIGHTS, DISTANCE_SCALE_KM, RankingEngine, parse_weights
+from search import tokenize
+from store import TableStore
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+PLACES = [('Manhattan', 40.7831, -73.9712), ('Brooklyn', 40.6782, -73.9442), ('Queens', 40.7282, -73.7949),
+          ('Boston', 42.3601, -71.0589)]
+LOCATIONS = [name for name, _, _ in PLACES] + ['Atlantis', 'Remote']
+WORDS = ['math', 'tutor', 'dog', 'walking', 'delivery', 'cafe', 'event', 'python']
+
+
+def setup(tmp_path):
+    (tmp_path / 'jobs.csv').write_text(','.join(JOB_FIELDS) + '\n')
+    jobs = TableStore(str(tmp_path / 'jobs.csv'), JOB_FIELDS, indexes=('status',))
+    gazetteer = Gazetteer(PLACES)
+    ranker = RankingEngine(gazetteer, where=lambda job: job['status'] == 'available')
+    ranker.attach(jobs)
+    return jobs, gazetteer, ranker
+
+def expected(gazetteer, jobs, student, k, weights=None):
+    # Brute force: score every available job one at a time
+    weights = parse_weights(weights)
+    available = [job for job in jobs.all() if job['status'] == 'available']
+    top_pay = max([float(job['pay']) for job in available] or [0])
+    documents = {job['id']: set(tokenize(job['title'])) | set(tokenize(job['description'])) for job in available}
+    bio = [token for token in set(tokenize(student['bio'])) if any(token in doc for doc in documents.values())]
+    idf = {token: math.log(1 + len(available) / sum(token in doc for doc in documents.values())) for token in bio}
+    here = gazetteer.resolve(student['location'])
+    ranked = []
+    for job in available:
+        there = gazetteer.resolve(job['location'])
+        if here and there:
+            proximity = 1 / (1 + haversine_km(here[0], here[1], there[0], there[1]) / DISTANCE_SCALE_KM)
+        else:
+            place = normalize_location(student['location'])
+            proximity = float(bool(place) and place == normalize_location(job['location']))
+        pay = float(job['pay']) / top_pay if top_pay else 0
+        relevance = sum(idf[token] for token in bio if token in documents[job['id']]) / (sum(idf.values()) or 1)
+        score = (weights['distance'] * proximity + weights['pay'] * pay + weights['relevance'] * relevance
+                 + weights['rating'] * float(student['rating']) / 5 * pay)
+        ranked.append((-score, int(job['id'])))
+    ranked.sort()
+    return {str(job_id): -score for score, job_id in ranked}, [-score for score, _ in ranked[:k]]
+
+def check(ranker, gazetteer, jobs, student, k, weights=None):
+    got = ranker.rank(student, k, weights)
+    scores, best = expected(gazetteer, jobs, student, k, weights)
+    # Same top scores; among (rounding-level) ties any of the tied jobs may be picked
+    assert len(got) == len(best)
+    assert all(math.isclose(score, want, abs_tol=1e-9) for (score, _, _), want in zip(got, best))
+    assert all(math.isclose(score, scores[job['id']], abs_tol=1e-9) for score, _, job in got)
+
+def test_scores_match_brute_force_through_changes(tmp_path):
+    """Test the vectorized scores against a per-job computation as jobs come and go"""
+    jobs, gazetteer, ranker = setup(tmp_path)
+    rng = random.Random(3)
+    students = [{'location': location, 'bio': ' '.join(rng.sample(WORDS, 3)), 'rating': str(rng.uniform(0, 5))}
+                for location in LOCATIONS]
+
+    for step in range(120):
+        existing = [job['id'] for job in jobs.all()]
+        action = rng.random()
+        if action < 0.5 or not existing:
+            jobs.insert({'title': ' '.join(rng.sample(WORDS, 2)), 'description': rng.choice(WORDS),
+                         'location': rng.choice(LOCATIONS), 'pay': str(rng.randint(10, 40)),
+                         'status': 'available'})
+        elif action < 0.8:
+            jobs.update(rng.choice(existing), {'status': rng.choice(['available', 'assigned']),
+                                               'pay': str(rng.randint(10, 40))})
+        else:
+            jobs.delete(rng.choice(existing))
+        if step % 10 == 0:
+            for student in students:
+                check(ranker, gazetteer, jobs, student, 5)
+                check(ranker, gazetteer, jobs, student, 3, {'distance': 0, 'relevance': 2})
+
+def test_batch_matches_single_student_ranking(tmp_path):
+    """Test that rank_many gives each student the same list as rank"""
+    jobs, gazetteer, ranker = setup(tmp_path)
+    for i in range(30):
+        jobs.insert({'title': WORDS[i % len(WORDS)], 'location': LOCATIONS[i % len(LOCATIONS)],
+                     'pay': str(10 + i), 'status': 'available'})
+    students = [{'location': location, 'bio': 'math tutor', 'rating': '4'} for location in LOCATIONS]
+    assert ranker.rank_many(students, 4) == [ranker.rank(student, 4) for student in students]
+    assert ranker.rank_many([], 4) == []
+
+def test_weights_change_the_order(tmp_path):
+    """Test per-request weights: pay alone ranks by pay, distance alone by proximity"""
+    jobs, gazetteer, ranker = setup(tmp_path)
+    jobs.insert({'title': 'Near', 'location': 'Brooklyn', 'pay': '10', 'status': 'available'})
+    jobs.insert({'title': 'Far', 'location': 'Boston', 'pay': '50', 'status': 'available'})
+    student = {'location': 'Brooklyn', 'bio': '', 'rating': '0'}
+
+    by_pay = ranker.rank(student, 2, {'distance': 0, 'pay': 1})
+    assert [job['title'] for _, _, job in by_pay] == ['Far', 'Near']
+    by_distance = ranker.rank(student, 2, {'distance': 1, 'pay': 0})
+    assert [job['title'] for _, _, job in by_distance] == ['Near', 'Far']
+    assert by_distance[0][1] == 0.0
+
+def test_invalid_weights_are_rejected():
+    """Test that unknown signals and bad numbers raise ValueError"""
+    assert parse_weights() == DEFAULT_WEIGHTS
+    for weights in ({'speed': 1}, {'pay': 'lots'}, {'pay': -1}, {'pay': float('nan')}, ['pay']):
+        with pytest.raises(ValueError):
+            parse_weights(weights)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Route-level tests of the Flask app against a temporary data directory
+"""
+
+import importlib
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+
+def write_tables(data_dir):
+    (data_dir / 'jobs.csv').write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,Manhattan,22,1,available,\n'
+        '4,Barista,Coffee shop,Brooklyn,16,2,available,\n'
+        '5,Data Entry,Office work,Queens,20,1,available,\n'
+    )
+    (data_dir / 'students.csv').write_text(
+        'id,name,email,password,location,bio,rating,jobs_completed\n'
+        '1,John Doe,john@email.com,password123,Brooklyn,Math and tutoring,4.5,0\n'
+        '2,Jane Smith,jane@email.com,password123,Manhattan,Events and hospitality,4.2,0\n'
+        '3,Mike Johnson,mike@email.com,password123,Queens,Office work,4.8,0\n'
+    )
+    (data_dir / 'providers.csv').write_text(
+        'id,name,email,password,company\n'
+        '1,Alice Brown,alice@company.com,password123,Education Services\n'
+        '2,Bob Wilson,bob@company.com,password123,Delivery Co\n'
+    )
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """The app module, imported afresh over its own copy of the tables"""
+    write_tables(tmp_path)
+    monkeypatch.setenv('WORKMATE_DATA_DIR', str(tmp_path))
+    monkeypatch.delenv('WORKMATE_STORAGE', raising=False)
+    sys.modules.pop('app', None)
+    module = importlib.import_module('app')
+    yield module
+    sys.modules.pop('app', None)
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+def walk(client, path, **params):
+    """Ids of every page of a listing, following X-Next-Cursor"""
+    ids = []
+    while True:
+        response = client.get(path, query_string=params)
+        assert response.status_code == 200
+        body = response.get_json()
+        ids += [job['id'] for job in (body['jobs'] if isinstance(body, dict) else body)]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return ids
+        params = dict(params, cursor=cursor)
+
+def student(client, student_id):
+    return client.get('/api/students/%s' % student_id).get_json()
+
+
+def test_cursor_paging_and_streaming(client):
+    """Test that pages follow X-Next-Cursor in order and stream=1 sends the same array"""
+    assert walk(client, '/api/jobs', limit=2) == ['1', '2', '3', '4', '5']
+    assert walk(client, '/api/jobs/sort', by='pay', order='desc', limit=2) == ['1', '3', '5', '2', '4']
+    assert walk(client, '/api/jobs/search', q='tutoring', limit=1) == ['1']
+    assert client.get('/api/jobs', query_string={'limit': 2, 'cursor': 'not-a-cursor'}).status_code == 400
+
+    streamed = client.get('/api/jobs', query_string={'stream': 1})
+    assert streamed.is_streamed
+    assert json.loads(streamed.get_data()) == client.get('/api/jobs').get_json()
+
+def test_etag_revalidation(client):
+    """Test that an unchanged listing is answered with 304 and a changed one in full"""
+    first = client.get('/api/jobs')
+    etag = first.headers['ETag']
+    cached = client.get('/api/jobs', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.get_data() == b''
+
+    client.post('/api/jobs', json={'title': 'Courier', 'location': 'Queens', 'pay': '19', 'provider_id': '1'})
+    changed = client.get('/api/jobs', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert [job['id'] for job in changed.get_json()] == ['1', '2', '3', '4', '5', '6']
+
+def test_bulk_upload_and_apply(client):
+    """Test that bulk imports and applies report per-line errors and save the rest"""
+    upload = ('title,location,pay,provider_id\n'
+              'Courier,Queens,19,\n'
+              ',Queens,20,\n'
+              'Cook,Bronx,15,9\n')
+    created = client.post('/api/jobs/bulk', query_string={'provider_id': '1'}, data=upload,
+                          content_type='text/csv').get_json()
+    assert created['ids'] == ['6']
+    assert created['errors'] == [{'line': 3, 'error': 'Missing title'}, {'line': 4, 'error': 'Provider not found'}]
+    assert client.post('/api/jobs/bulk', data='title\n', content_type='text/plain').status_code == 400
+
+    applications = '\n'.join(json.dumps(row) for row in [
+        {'job_id': '6', 'student_id': '1'},
+        {'job_id': '1', 'student_id': '2'},
+        {'job_id': '6', 'student_id': '2'},
+        {'job_id': '99', 'student_id': '1'},
+    ])
+    applied = client.post('/api/jobs/apply', data=applications, content_type='application/x-ndjson').get_json()
+    assert applied['job_ids'] == ['6', '1']
+    assert applied['errors'] == [{'line': 3, 'error': 'Job appears earlier in this upload'},
+                                 {'line': 4, 'error': 'Job not found'}]
+    again = client.post('/api/jobs/apply', data=json.dumps([{'job_id': '1', 'student_id': '3'}]),
+                        content_type='application/json').get_json()
+    assert again['applied'] == 0 and again['errors'] == [{'line': 1, 'error': 'Job is not available'}]
+    assert [job['id'] for job in student(client, '1')['job_history']] == ['6']
+    assert student(client, '2')['jobs_completed'] == '1'
+
+def test_single_apply(client):
+    """Test that applying twice is refused and only a saved apply counts for the student"""
+    assert client.post('/api/jobs/2/apply', json={'student_id': '1'}).status_code == 200
+    taken = client.post('/api/jobs/2/apply', json={'student_id': '3'})
+    assert taken.status_code == 409 and taken.get_json() == {'error': 'Job is no longer available'}
+    assert client.post('/api/jobs/99/apply', json={'student_id': '3'}).status_code == 404
+    assert client.post('/api/jobs/3/apply', json={'student_id': '99'}).status_code == 404
+    assert student(client, '1')['jobs_completed'] == '1'
+    assert student(client, '3')['jobs_completed'] == '0'
+    assert [job['id'] for job in client.get('/api/jobs').get_json()] == ['1', '3', '4', '5']
+
+def test_filter_facets_and_suggestions(client):
+    """Test filtered listings with facet counts, cursor pages, typo-tolerant locations and archived jobs"""
+    result = client.get('/api/jobs/filter', query_string={'location': 'brooklyn'}).get_json()
+    assert [job['id'] for job in result['jobs']] == ['2', '4'] and result['total'] == 2
+    assert result['facets']['location'] == {'Brooklyn': 2, 'New York': 1, 'Manhattan': 1, 'Queens': 1}
+    assert result['facets']['provider_id'] == {'2': 2}
+    assert result['facets']['pay'] == {'15-20': 2}
+
+    assert walk(client, '/api/jobs/filter', min_pay=20, limit=2) == ['1', '3', '5']
+    assert client.get('/api/jobs/filter', query_string={'cursor': 'nope'}).status_code == 400
+
+    missed = client.get('/api/jobs/filter', query_string={'location': 'Brookln'}).get_json()
+    assert missed['total'] == 0
+    assert missed['did_you_mean'] == [{'location': 'Brooklyn', 'distance': 1, 'count': 2}]
+    fuzzy = client.get('/api/jobs/filter', query_string={'location': 'Brookln', 'fuzzy': 1}).get_json()
+    assert fuzzy['total'] == 2
+    suggested = client.get('/api/locations/suggest', query_string={'q': 'Manhatan'}).get_json()
+    assert suggested['suggestions'] == [{'location': 'Manhattan', 'distance': 1, 'count': 1}]
+
+    # Applied jobs move to the archive and are still counted
+    client.post('/api/jobs/2/apply', json={'student_id': '1'})
+    statuses = client.get('/api/jobs/filter', query_string={'location': 'Brooklyn'}).get_json()
+    assert statuses['facets']['status'] == {'available': 1, 'applied': 1}
+    assert [job['id'] for job in client.get('/api/jobs/filter', query_string={'status': 'applied'})
+            .get_json()['jobs']] == ['2']
+
+def test_batch_suggestions(client):
+    """Test ranked suggestions for several students in one request"""
+    response = client.post('/api/jobs/suggested/batch', json={'student_ids': ['1', '2', '99', '1'], 'k': 2})
+    body = response.get_json()
+    assert sorted(body['suggestions']) == ['1', '2'] and body['missing'] == ['99']
+    for jobs in body['suggestions'].values():
+        assert len(jobs) == 2 and all('score' in job and 'distance_km' in job for job in jobs)
+        assert jobs[0]['score'] >= jobs[1]['score']
+    assert client.post('/api/jobs/suggested/batch', json={'student_ids': ['1'], 'k': 'x'}).status_code == 400
+    assert client.post('/api/jobs/suggested/batch',
+                       json={'student_ids': ['1'], 'weights': {'nonsense': 1}}).status_code == 400
+
+def test_flow_assignment_keeps_every_worker(client, app_module):
+    """Test that a job needing several students records all of them"""
+    response = client.post('/api/assignments/optimal', json={
+        'mode': 'flow', 'student_ids': ['1', '2', '3'], 'job_ids': ['1', '2'], 'headcount': {'1': 2}})
+    assert response.status_code == 200
+    assignments = response.get_json()['assignments']
+    workers = sorted(a['student_id'] for a in assignments if a['job_id'] == '1')
+    assert len(assignments) == 3 and len(workers) == 2
+
+    saved = app_module.assignments_store.find('job_id', '1')
+    assert sorted(row['student_id'] for row in saved) == workers
+    assert app_module.jobs_store.get('1')['status'] == 'assigned'
+    for student_id in workers:
+        assert '1' in [job['id'] for job in student(client, student_id)['job_history']]
+
+    # Jobs that are no longer available aren't assigned again
+    again = client.post('/api/assignments/optimal', json={
+        'mode': 'flow', 'student_ids': ['1', '2', '3'], 'job_ids': ['1', '2'], 'headcount': 2}).get_json()
+    assert again['assignments'] == [] and again['total_cost'] == 0
+
+@pytest.mark.parametrize('payload', [{'headcount': 0}, {'headcount': 1.5}, {'capacity': {'1': 'x'}},
+                                     {'capacity': True}, {'mode': 'greedy'}])
+def test_flow_assignment_rejects_bad_amounts(client, payload):
+    """Test that capacities and headcounts must be whole numbers of at least 1"""
+    body = dict({'mode': 'flow', 'student_ids': ['1'], 'job_ids': ['1']}, **payload)
+    assert client.post('/api/assignments/optimal', json=body).status_code == 400
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the inverted-index job search
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from search import SearchIndex
+from store import TableStore
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+
+
+def make_index(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Web Developer,Frontend development,New York,30,1,available,\n'
+        '2,Data Entry,Remote data entry work,Brooklyn,18,2,available,\n'
+        '3,Graphic Designer,Create marketing materials for a web shop,Manhattan,22,1,available,\n'
+        '4,Backend Developer,APIs,Queens,35,3,applied,5\n'
+    )
+    store = TableStore(str(path), JOB_FIELDS, indexes=('status',))
+    index = SearchIndex(where=lambda job: job['status'] == 'available')
+    index.attach(store)
+    return store, index
+
+def test_ranked_and_prefix_matches(tmp_path):
+    """Test relevance ranking, prefix matching and AND semantics"""
+    store, index = make_index(tmp_path)
+
+    # Title hits outrank description hits
+    assert [job['id'] for job in index.search('web')] == ['1', '3']
+    # Partially typed words match by prefix
+    assert [job['id'] for job in index.search('devel')] == ['1']
+    assert [job['id'] for job in index.search('brook')] == ['2']
+    # All terms must match
+    assert [job['id'] for job in index.search('web manhattan')] == ['3']
+    assert index.search('web brooklyn') == []
+    # Non-available jobs are not indexed
+    assert index.search('apis') == []
+    # Limit and empty query
+    assert len(index.search('web', limit=1)) == 1
+    assert [job['id'] for job in index.search('')] == ['1', '2', '3']
+
+def test_follows_store_mutations(tmp_path):
+    """Test that the index is updated incrementally on writes"""
+    store, index = make_index(tmp_path)
+
+    store.insert({'title': 'Dog Walker', 'location': 'Bronx', 'status': 'available'})
+    assert [job['title'] for job in index.search('dog')] == ['Dog Walker']
+
+    store.update('2', {'title': 'Cashier', 'description': 'Till work'})
+    assert index.search('data') == []
+    assert [job['id'] for job in index.search('cash')] == ['2']
+
+    store.update('1', {'status': 'applied'})
+    store.delete('3')
+    assert index.search('web') == []
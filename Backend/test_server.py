@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-forking production server
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import urllib.request
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask, jsonify
+
+import server
+from server import PreforkServer, WorkerTable
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def get_json(port, path):
+    with urllib.request.urlopen('http://127.0.0.1:%d%s' % (port, path), timeout=5) as response:
+        return json.loads(response.read())
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            result = condition()
+            if result:
+                return result
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise AssertionError('timed out')
+
+def test_worker_table_slots():
+    """Test that slots are handed out, read back and freed"""
+    table = WorkerTable(2)
+    first = table.free_slot()
+    table.write(first, 123, 4, 1.5, 10, 2)
+    assert table.workers() == [(first, 123, 4, 1.5, 10, 2)]
+    second = table.free_slot()
+    table.write(second, 456, 4)
+    with pytest.raises(RuntimeError):
+        table.free_slot()
+    table.write(first, 0, 0)
+    assert table.free_slot() == first
+
+def test_prefork_serves_reloads_and_stops():
+    """Test workers sharing a socket, graceful reload on SIGHUP and shutdown on SIGTERM"""
+    app = Flask(__name__)
+    app.add_url_rule('/pid', 'pid', lambda: jsonify(os.getpid()))
+    app.add_url_rule('/health', 'health', lambda: jsonify(server.worker_health()))
+    port = free_port()
+
+    master = os.fork()
+    if master == 0:
+        try:
+            PreforkServer(app, '127.0.0.1', port, workers=2, threads=2, graceful_timeout=5).run()
+        finally:
+            os._exit(0)
+    try:
+        health = wait_for(lambda: len(get_json(port, '/health')) == 2 and get_json(port, '/health'))
+        assert {worker['generation'] for worker in health} == {0}
+        assert get_json(port, '/pid') in {worker['pid'] for worker in health}
+
+        os.kill(master, signal.SIGHUP)
+        health = wait_for(lambda: [w for w in get_json(port, '/health') if w['generation'] == 1]
+                          and len(get_json(port, '/health')) == 2 and get_json(port, '/health'))
+        assert {worker['generation'] for worker in health} == {1}
+    finally:
+        os.kill(master, signal.SIGTERM)
+        _, status = os.waitpid(master, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    with pytest.raises(OSError):
+        get_json(port, '/pid')
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped binary table snapshots
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+
+from records import json_default
+from snapshot import Snapshot, SnapshotRow
+from store import TableStore
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+INDEXES = ('status', 'provider_id', 'assigned_student_id')
+
+
+def write_jobs(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,"Local, fast deliveries",Brooklyn,18,2,available,\n'
+        '3,Café Staff,Weekend event,Manhattan,22,1,applied,7\n'
+    )
+    return str(path)
+
+def open_store(path, **options):
+    return TableStore(path, JOB_FIELDS, indexes=INDEXES, **options)
+
+def test_second_load_maps_the_snapshot(tmp_path):
+    """Test that the first load builds the snapshot and later ones read rows lazily from it"""
+    path = write_jobs(tmp_path)
+    parsed = open_store(path)
+    expected = [dict(row) for row in parsed.all()]
+    assert os.path.exists(path + '.snap')
+
+    store = open_store(path)
+    store.refresh()
+    assert store.load_state() == 'mapped'
+    rows = store.all()
+    assert all(isinstance(row, SnapshotRow) for row in rows)
+    assert [dict(row) for row in rows] == expected
+    assert rows[2]['title'] == 'Café Staff' and rows[1]['description'] == 'Local, fast deliveries'
+    assert [row['id'] for row in store.find('status', 'available')] == ['1', '2']
+    assert [row['id'] for row in store.find('provider_id', '1')] == ['1', '3']
+    assert store.count('assigned_student_id', '7') == 1
+    assert store.next_id() == '4'
+    assert json.loads(json.dumps(rows, default=json_default))[0]['pay'] == '25'
+
+    # Changed rows become ordinary records; the journal is replayed on top of the snapshot
+    store.update('2', {'status': 'applied'})
+    assert [row['id'] for row in open_store(path).find('status', 'applied')] == ['2', '3']
+
+def test_stale_or_damaged_snapshots_are_rebuilt(tmp_path):
+    """Test that a newer CSV, another format version or a truncated file forces a rebuild"""
+    path = write_jobs(tmp_path)
+    open_store(path).refresh()
+
+    with open(path, 'a') as f:
+        f.write('4,Barista,Coffee,Queens,16,3,available,\n')
+    store = open_store(path)
+    assert store.get('4')['location'] == 'Queens'
+    assert store.load_state() == 'mapped'
+
+    with open(path + '.snap', 'r+b') as f:
+        f.seek(8)
+        f.write(b'\xff')
+    assert Snapshot.open(path + '.snap', JOB_FIELDS, (os.stat(path).st_mtime_ns, os.stat(path).st_size)) is None
+    assert open_store(path).count() == 4
+
+    with open(path + '.snap', 'r+b') as f:
+        f.truncate(os.path.getsize(path + '.snap') - 3)
+    store = open_store(path)
+    assert store.count('status', 'available') == 3
+    assert store.load_state() == 'mapped'
+
+def test_compaction_writes_a_fresh_snapshot(tmp_path):
+    """Test that folding the journal into the CSV leaves a snapshot matching the new file"""
+    path = write_jobs(tmp_path)
+    store = open_store(path)
+    store.insert({'title': 'Barista', 'status': 'available'})
+    store.delete('1')
+    store.compact()
+
+    st = os.stat(path)
+    snapshot = Snapshot.open(path + '.snap', JOB_FIELDS, (st.st_mtime_ns, st.st_size))
+    assert snapshot is not None and snapshot.rows == 3
+    assert [row['id'] for row in open_store(path).all()] == ['2', '3', '4']
+
+def test_snapshots_can_be_turned_off(tmp_path):
+    """Test that without snapshots the CSV is parsed and nothing is written beside it"""
+    path = write_jobs(tmp_path)
+    store = open_store(path, snapshot=False)
+    assert store.count() == 3
+    assert store.load_state() == 'ready'
+    assert not os.path.exists(path + '.snap')
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the maintained sorted job views
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from algorithms import job_sort_value, sort_jobs
+from sorted_view import SortedView
+from store import TableStore
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+
+
+def make_store(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,Manhattan,25,1,available,\n'
+        '4,Barista,Coffee,Queens,,3,available,\n'
+        '5,Cashier,Store,Bronx,30,2,applied,7\n'
+    )
+    return TableStore(str(path), JOB_FIELDS)
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+def test_view_matches_sort_jobs_and_follows_changes(tmp_path):
+    """Test both directions against sort_jobs while the store changes"""
+    store = make_store(tmp_path)
+    view = SortedView(lambda job: job_sort_value(job, 'pay'), where=lambda job: job['status'] == 'available')
+    view.attach(store)
+
+    def check():
+        available = store.find('status', 'available')
+        for order in ('asc', 'desc'):
+            rows, next_key = view.page(reverse=(order == 'desc'))
+            assert ids(rows) == ids(sort_jobs(available, 'pay', order))
+            assert next_key is None
+
+    # Missing pay sorts as 0 instead of raising
+    assert ids(view.page(reverse=True)[0]) == ['1', '3', '2', '4']
+    check()
+    store.insert({'title': 'Usher', 'pay': '25', 'status': 'available'})
+    store.update('2', {'pay': 'n/a'})
+    store.update('5', {'status': 'available'})
+    store.update('1', {'status': 'applied'})
+    store.delete('3')
+    check()
+    assert len(view) == 4
+
+def test_cursor_walk_keeps_ties_in_id_order(tmp_path):
+    """Test paging through runs of equal values in both directions"""
+    view = SortedView(lambda job: job_sort_value(job, 'pay'))
+    view.rebuild({'id': str(n), 'pay': str(20 + n % 3)} for n in range(1, 11))
+
+    for reverse in (False, True):
+        walked, after = [], None
+        while True:
+            rows, after = view.page(after, limit=3, reverse=reverse)
+            walked += ids(rows)
+            if after is None:
+                break
+        assert walked == ids(view.page(reverse=reverse)[0])
+    assert ids(view.page(limit=4, reverse=True)[0]) == ['2', '5', '8', '1']
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests that the CSV and SQLite storage backends behave the same
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+import time
+
+import pytest
+
+from storage import open_stores
+from store import DuplicateKeyError
+from writer import WriteQueue
+
+
+def write_sample_data(data_dir):
+    (data_dir / 'jobs.csv').write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,Manhattan,22,1,applied,7\n'
+    )
+    (data_dir / 'students.csv').write_text(
+        'id,name,email,password,location,bio,rating,jobs_completed\n'
+        '7,Jane,jane@email.com,pw,Brooklyn,,4.2,2\n'
+    )
+    (data_dir / 'providers.csv').write_text('id,name,email,password,company\n')
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_backends_share_behaviour(tmp_path, backend):
+    """Test reads, writes and listener events on each backend"""
+    write_sample_data(tmp_path)
+    stores = open_stores(str(tmp_path), backend=backend)
+    jobs = stores['jobs']
+
+    events = []
+    jobs.refresh()
+    jobs.add_listener(lambda event, old, new: events.append(event))
+
+    assert [job['id'] for job in jobs.find('status', 'available')] == ['1', '2']
+    assert stores['students'].find('email', 'jane@email.com')[0]['id'] == '7'
+
+    new_job = jobs.insert({'title': 'Barista', 'location': 'Queens', 'pay': 16, 'status': 'available'})
+    assert new_job['id'] == '4'
+    jobs.update('1', {'status': 'applied', 'assigned_student_id': '7'})
+    jobs.update_many({'2': {'pay': '19'}, '99': {'pay': '1'}})
+    assert jobs.delete('3')
+    assert not jobs.delete('3')
+
+    assert [job['id'] for job in jobs.all()] == ['1', '2', '4']
+    assert [job['id'] for job in jobs.find('status', 'available')] == ['2', '4']
+    assert [job['id'] for job in jobs.find('assigned_student_id', '7')] == ['1']
+    assert jobs.get('2')['pay'] == '19'
+    assert jobs.count('status', 'available') == 2
+    assert events == ['insert', 'update', 'update', 'delete']
+
+    # A second handle on the same files sees the same state and version
+    reopened = open_stores(str(tmp_path), backend=backend)['jobs']
+    assert reopened.all() == jobs.all()
+    assert reopened.data_version()[0] == jobs.data_version()[0]
+
+    token = jobs.data_version()[0]
+    reopened.update('2', {'pay': '20'})
+    assert jobs.data_version()[0] != token
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_concurrent_writes_are_grouped(tmp_path, backend):
+    """Test that concurrent inserts and increments go through one writer without lost updates"""
+    write_sample_data(tmp_path)
+    students = open_stores(str(tmp_path), backend=backend)['students']
+    students.writer = writer = WriteQueue()
+
+    # Hold the writer on a first batch so every later submission queues up behind it
+    gate = threading.Event()
+    blocked = writer.submit(students, gate.wait)
+    while not blocked.running():
+        time.sleep(0.001)
+    increment = lambda student: {'jobs_completed': int(student['jobs_completed']) + 1}
+    threads = [threading.Thread(target=students.insert, args=({'email': 'user%d@email.com' % n},))
+               for n in range(20)]
+    threads += [threading.Thread(target=students.update, args=('7', increment)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    while writer._queue.qsize() < len(threads):
+        time.sleep(0.001)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    blocked.result()
+
+    assert writer.batches == 2
+    assert students.get('7')['jobs_completed'] == '22'
+    ids = [student['id'] for student in students.all()]
+    assert len(ids) == len(set(ids)) == 21
+
+    with pytest.raises(DuplicateKeyError):
+        students.insert({'email': 'user3@email.com'}, unique=('email',))
+    assert students.count() == 21
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-memory CSV table store
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import pickle
+
+from records import json_default
+from store import TableStore, read_csv
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+
+
+def make_store(tmp_path):
+    path = tmp_path / 'jobs.csv'
+    path.write_text(
+        'id,title,description,location,pay,provider_id,status,assigned_student_id\n'
+        '1,Tutor,Math tutoring,New York,25,1,available,\n'
+        '2,Delivery,Local deliveries,Brooklyn,18,2,available,\n'
+        '3,Event Staff,Weekend event,Manhattan,22,1,applied,7\n'
+    )
+    return TableStore(str(path), JOB_FIELDS, indexes=('status', 'provider_id', 'assigned_student_id'))
+
+def test_indexed_lookups(tmp_path):
+    """Test hash index lookups by id, status and provider"""
+    store = make_store(tmp_path)
+
+    assert store.get('2')['title'] == 'Delivery'
+    assert store.get('99') is None
+    assert [job['id'] for job in store.find('status', 'available')] == ['1', '2']
+    assert [job['id'] for job in store.find('provider_id', '1')] == ['1', '3']
+    assert [job['id'] for job in store.find('assigned_student_id', '7')] == ['3']
+
+def test_mutations_keep_indexes_and_file_in_step(tmp_path):
+    """Test that writes update both the indexes and the CSV file"""
+    store = make_store(tmp_path)
+
+    new_job = store.insert({'title': 'Barista', 'location': 'Queens', 'pay': 16, 'status': 'available'})
+    assert new_job['id'] == '4'
+    assert new_job['pay'] == '16'
+
+    store.update('1', {'status': 'applied', 'assigned_student_id': '7', 'unknown': 'x'})
+    store.delete('2')
+
+    assert [job['id'] for job in store.find('status', 'available')] == ['4']
+    assert [job['id'] for job in store.find('assigned_student_id', '7')] == ['1', '3']
+
+    # Writes go to the journal; a fresh store sees the merged state
+    assert read_csv(store.path)[1]['id'] == '2'
+    reopened = TableStore(store.path, JOB_FIELDS, indexes=('status',))
+    assert [job['id'] for job in reopened.all()] == ['1', '3', '4']
+    assert reopened.get('1')['status'] == 'applied'
+
+    # Compaction folds the journal back into the CSV snapshot
+    store.compact()
+    rows = read_csv(store.path)
+    assert [row['id'] for row in rows] == ['1', '3', '4']
+    assert rows[0]['status'] == 'applied'
+    assert 'unknown' not in rows[0]
+
+def test_journal_compaction_keeps_later_writes(tmp_path):
+    """Test automatic compaction and replay of records written after it"""
+    store = make_store(tmp_path)
+    store.compact_bytes = 400
+
+    for i in range(10):
+        store.update('1', {'pay': str(30 + i)})
+    store.delete('2')
+
+    # The compaction thread may still be running; wait for it via a manual pass
+    store.compact()
+    assert os.path.getsize(store.journal.path) < 400
+    store.update('3', {'status': 'assigned'})
+
+    reopened = TableStore(store.path, JOB_FIELDS, indexes=('status',))
+    assert reopened.get('1')['pay'] == '39'
+    assert reopened.get('2') is None
+    assert reopened.get('3')['status'] == 'assigned'
+    assert [job['id'] for job in reopened.find('status', 'available')] == ['1']
+
+def test_reloads_when_file_changes(tmp_path):
+    """Test that external edits to the CSV are picked up"""
+    store = make_store(tmp_path)
+    assert store.count() == 3
+
+    with open(store.path, 'a') as f:
+        f.write('4,Barista,Coffee,Queens,16,3,available,\n')
+
+    assert store.count() == 4
+    assert store.get('4')['location'] == 'Queens'
+
+    # Records appended to the journal by another process are replayed incrementally
+    other = TableStore(store.path, JOB_FIELDS)
+    other.update('4', {'pay': '17'})
+    assert store.get('4')['pay'] == '17'
+
+def test_rows_are_compact_records(tmp_path):
+    """Test that resident rows share interned values and still read like dicts"""
+    store = make_store(tmp_path)
+    first, second = store.find('status', 'available')
+
+    assert not hasattr(first, '__dict__')
+    assert first['status'] is second['status']
+    assert first.get('pay') == '25' and first.get('missing', '-') == '-'
+    assert 'location' in first and 'missing' not in first
+    assert dict(first) == store.get('1') == {
+        'id': '1', 'title': 'Tutor', 'description': 'Math tutoring', 'location': 'New York',
+        'pay': '25', 'provider_id': '1', 'status': 'available', 'assigned_student_id': ''}
+    assert json.loads(json.dumps(store.all(), default=json_default))[2]['assigned_student_id'] == '7'
+    assert pickle.loads(pickle.dumps(first)) == first
+
+    updated = store.update('2', {'status': 'applied'})
+    assert isinstance(updated, dict)
+    applied = store.find('status', 'applied')
+    assert [row['id'] for row in applied] == ['2', '3']
+    assert applied[0]['status'] is applied[1]['status']
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the materialized per-student suggestion cache
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from geo import Gazetteer, SpatialJobIndex
+from store import TableStore
+from suggestions import SuggestionCache
+
+JOB_FIELDS = ['id', 'title', 'description', 'location', 'pay', 'provider_id', 'status', 'assigned_student_id']
+STUDENT_FIELDS = ['id', 'name', 'email', 'password', 'location', 'bio', 'rating', 'jobs_completed']
+PLACES = [('Manhattan', 40.7831, -73.9712), ('Brooklyn', 40.6782, -73.9442), ('Queens', 40.7282, -73.7949),
+          ('Bronx', 40.8448, -73.8648), ('Hoboken', 40.7440, -74.0324), ('Boston', 42.3601, -71.0589)]
+LOCATIONS = [name for name, _, _ in PLACES] + ['Atlantis', 'Brooklin', 'Remote']
+
+
+def setup(tmp_path, size=4, max_students=10):
+    (tmp_path / 'jobs.csv').write_text(','.join(JOB_FIELDS) + '\n')
+    (tmp_path / 'students.csv').write_text(','.join(STUDENT_FIELDS) + '\n')
+    jobs = TableStore(str(tmp_path / 'jobs.csv'), JOB_FIELDS, indexes=('status',))
+    students = TableStore(str(tmp_path / 'students.csv'), STUDENT_FIELDS)
+    available = lambda job: job['status'] == 'available'
+    gazetteer = Gazetteer(PLACES)
+    locator = SpatialJobIndex(gazetteer, where=available)
+    locator.attach(jobs)
+    cache = SuggestionCache(gazetteer, locator, jobs, size=size, max_students=max_students, where=available)
+    cache.attach(students)
+    return jobs, students, cache
+
+def expected(cache, jobs, student, k):
+    # Brute force: rank every available job from scratch
+    probe = cache._build(student['location'])
+    ranked = sorted(cache._rank(probe, job) for job in jobs.all() if job['status'] == 'available')
+    return [str(rank_key[2]) for rank_key in ranked[:k]]
+
+def test_lists_stay_exact_through_job_changes(tmp_path):
+    """Test the cached lists against a full re-rank after every change"""
+    jobs, students, cache = setup(tmp_path)
+    rng = random.Random(7)
+    for location in LOCATIONS[:6] + ['Atlantis']:
+        students.insert({'name': location, 'location': location})
+    for _ in range(12):
+        jobs.insert({'title': 'Job', 'location': rng.choice(LOCATIONS), 'status': 'available'})
+
+    for step in range(150):
+        job_ids = [job['id'] for job in jobs.all()]
+        action = rng.random()
+        if action < 0.4:
+            jobs.insert({'title': 'Job', 'location': rng.choice(LOCATIONS), 'status': 'available'})
+        elif action < 0.6:
+            jobs.update(rng.choice(job_ids), {'status': rng.choice(['applied', 'assigned', 'available'])})
+        elif action < 0.8:
+            jobs.update(rng.choice(job_ids), {'location': rng.choice(LOCATIONS)})
+        else:
+            jobs.delete(rng.choice(job_ids))
+        for student in students.all():
+            k = rng.randint(1, 4)
+            got = [job['id'] for _, job in cache.suggestions(student, k)]
+            assert got == expected(cache, jobs, student, k), step
+    assert cache.hits > cache.misses
+
+def test_location_change_and_lru_eviction(tmp_path):
+    """Test that a move rebuilds only that student's list and that old students are evicted"""
+    jobs, students, cache = setup(tmp_path, max_students=2)
+    for location in ('Manhattan', 'Boston', 'Bronx'):
+        jobs.insert({'title': 'Job', 'location': location, 'status': 'available'})
+    alice = students.insert({'name': 'Alice', 'location': 'Brooklyn'})
+    bob = students.insert({'name': 'Bob', 'location': 'Queens'})
+
+    assert cache.suggestions(alice, 1)[0][1]['location'] == 'Manhattan'
+    cache.suggestions(bob, 1)
+    moved = students.update(alice['id'], {'location': 'Boston'})
+    assert len(cache) == 1
+    distance, job = cache.suggestions(moved, 1)[0]
+    assert job['location'] == 'Boston' and distance < 1
+
+    carol = students.insert({'name': 'Carol', 'location': 'Atlantis'})
+    distance, _ = cache.suggestions(carol, 1)[0]
+    assert distance is None
+    assert len(cache) == 2 and bob['id'] not in cache._entries
+    assert cache.suggestions(carol, 99) is None
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the email-indexed user directory and persistent id allocation
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from storage import open_stores
+from store import DuplicateKeyError
+from users import UserDirectory, normalize_email
+
+
+def write_students(data_dir):
+    (data_dir / 'jobs.csv').write_text('id,title,description,location,pay,provider_id,status,assigned_student_id\n')
+    (data_dir / 'students.csv').write_text(
+        'id,name,email,password,location,bio,rating,jobs_completed\n'
+        '1,Jane,Jane@Email.com,pw,Brooklyn,,4.2,2\n'
+        '2,Ravi,ravi@email.com,secret,Queens,,0,0\n'
+    )
+    (data_dir / 'providers.csv').write_text('id,name,email,password,company\n')
+
+def test_normalize_email():
+    """Test that emails compare without case or surrounding whitespace"""
+    assert normalize_email('  Jane@Email.COM ') == 'jane@email.com'
+    assert normalize_email(None) == ''
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_login_and_duplicate_checks(tmp_path, backend):
+    """Test lookups by normalized email, following inserts, updates and deletes"""
+    write_students(tmp_path)
+    students = open_stores(str(tmp_path), backend=backend)['students']
+    directory = UserDirectory()
+    directory.attach('student', students)
+
+    assert directory.authenticate('student', 'jane@email.com', 'pw')['id'] == '1'
+    assert directory.authenticate('student', ' JANE@email.com', 'pw')['id'] == '1'
+    assert directory.authenticate('student', 'jane@email.com', 'wrong') is None
+    assert directory.authenticate('provider', 'jane@email.com', 'pw') is None
+    assert directory.find('student', '') == []
+
+    # An account stored without a password can't be logged into without one
+    students.insert({'name': 'Nopass', 'email': 'nopass@email.com', 'password': ''})
+    assert directory.authenticate('student', 'nopass@email.com', None) is None
+    assert directory.authenticate('student', 'nopass@email.com', '') is None
+
+    check = directory.unique_email('student')
+    with pytest.raises(DuplicateKeyError):
+        students.insert({'name': 'Jane again', 'email': 'jane@email.com', 'password': 'x'}, check=check)
+    added = students.insert({'name': 'Mo', 'email': 'mo@email.com', 'password': 'pw'}, check=check)
+    assert directory.authenticate('student', 'MO@email.com', 'pw')['id'] == added['id']
+
+    students.update('2', {'email': 'ravi@work.com'})
+    assert directory.find('student', 'ravi@email.com') == []
+    assert directory.authenticate('student', 'ravi@work.com', 'secret')['id'] == '2'
+    students.delete('2')
+    assert directory.find('student', 'ravi@work.com') == []
+
+def test_directory_follows_other_processes(tmp_path):
+    """Test that writes through another handle on the same files show up after a refresh"""
+    write_students(tmp_path)
+    students = open_stores(str(tmp_path), backend='csv')['students']
+    other = open_stores(str(tmp_path), backend='csv')['students']
+    directory = UserDirectory()
+    directory.attach('student', students)
+
+    other.insert({'name': 'Ana', 'email': 'ana@email.com', 'password': 'pw'})
+    assert directory.authenticate('student', 'ana@email.com', 'pw')['name'] == 'Ana'
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_deleted_ids_are_not_reused(tmp_path, backend):
+    """Test that the id high-water mark survives deleting the newest row, compaction and reopening"""
+    write_students(tmp_path)
+    students = open_stores(str(tmp_path), backend=backend)['students']
+    students.delete('2')
+    assert students.next_id() == '3'
+    if backend == 'csv':
+        students.compact()
+        students.reload()
+        assert students.next_id() == '3'
+
+    reopened = open_stores(str(tmp_path), backend=backend)['students']
+    assert reopened.next_id() == '3'
+    assert reopened.insert({'name': 'Mo', 'email': 'mo@email.com'})['id'] == '3'
@@ -0,0 +1,97 @@
+import hmac
+import threading
+
+try:
+    from .store import DuplicateKeyError
+except ImportError:
+    from store import DuplicateKeyError
+
+
+def normalize_email(email):
+    """Canonical form of an email for lookups: surrounding whitespace dropped, lowercased"""
+    return (email or '').strip().lower()
+
+
+class UserDirectory:
+    """
+    Hash index from normalized email to user ids, one per user type
+
+    Each type follows its store's change events, so a write costs one dict
+    update and a write from another process is picked up by the store's own
+    refresh (the CSV backend replays just the new journal records). Login
+    and duplicate checks are a dict lookup plus a fetch per matching id,
+    whatever the number of users; rows saved before emails were normalized
+    still match their case-insensitive form.
+    """
+
+    def __init__(self, key='id'):
+        self.key = key
+        self._lock = threading.RLock()
+        self._stores = {}
+        self._emails = {}   # user type -> {normalized email: {user id: None}}
+
+    def attach(self, user_type, store):
+        """Index the users of ``store`` under ``user_type`` and follow its changes"""
+        self._stores[user_type] = store
+        store.refresh()
+        store.add_listener(lambda event, old_row, new_row: self._on_change(user_type, event, old_row, new_row))
+        self.rebuild(user_type)
+
+    def rebuild(self, user_type):
+        emails = {}
+        for row in self._stores[user_type].all():
+            emails.setdefault(normalize_email(row['email']), {})[row[self.key]] = None
+        with self._lock:
+            self._emails[user_type] = emails
+
+    def _on_change(self, user_type, event, old_row, new_row):
+        if event == 'reload':
+            self.rebuild(user_type)
+            return
+        with self._lock:
+            emails = self._emails[user_type]
+            if old_row is not None:
+                email = normalize_email(old_row['email'])
+                ids = emails.get(email)
+                if ids is not None:
+                    ids.pop(old_row[self.key], None)
+                    if not ids:
+                        del emails[email]
+            if new_row is not None:
+                emails.setdefault(normalize_email(new_row['email']), {})[new_row[self.key]] = None
+
+    def _ids(self, user_type, email):
+        with self._lock:
+            return list(self._emails.get(user_type, {}).get(normalize_email(email), ()))
+
+    # Queries
+    def find(self, user_type, email):
+        """Users of ``user_type`` registered under ``email``, in any letter case"""
+        store = self._stores.get(user_type)
+        if store is None or not normalize_email(email):
+            return []
+        store.refresh()
+        return [row for row in map(store.get, self._ids(user_type, email)) if row is not None]
+
+    def authenticate(self, user_type, email, password):
+        """The user with this email and password, or None"""
+        if not password or not isinstance(password, str):
+            # A missing password never matches, not even an account stored without one
+            return None
+        password = password.encode('utf-8')
+        for user in self.find(user_type, email):
+            if hmac.compare_digest(user['password'].encode('utf-8'), password):
+                return user
+        return None
+
+    def unique_email(self, user_type):
+        """
+        Check for ``store.insert(check=...)``: raises DuplicateKeyError if the
+        row's email is already taken. It runs on the writer thread with the
+        store up to date, so concurrent sign-ups can't both pass it.
+        """
+        def check(row):
+            email = normalize_email(row['email'])
+            if email and self._ids(user_type, email):
+                raise DuplicateKeyError('email', row['email'])
+        return check
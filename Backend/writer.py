@@ -0,0 +1,103 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """
+    Single writer thread with group commit
+
+    Every mutation is submitted as a callable together with the store it
+    touches and runs on one dedicated thread, so read-modify-write sequences
+    (id allocation, counters, duplicate checks) can't interleave. Whatever is
+    waiting in the queue when the writer wakes up is applied as one batch per
+    store and made durable with a single write (``store.commit_batch``) before
+    any of the submitters' futures are resolved.
+
+    The thread is started lazily and restarted in a forked child.
+    """
+
+    def __init__(self, max_batch=512):
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, store, op):
+        """Queue ``op()`` to run against ``store``; returns a Future with its result"""
+        future = Future()
+        self._ensure_running()
+        self._queue.put((store, op, future))
+        return future
+
+    def on_writer_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def _ensure_running(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Queue and thread from the parent don't survive a fork
+                self._queue = queue.SimpleQueue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='workmate-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.operations += len(batch)
+            by_store = {}
+            for store, op, future in batch:
+                by_store.setdefault(store, []).append((op, future))
+            for store, items in by_store.items():
+                self._commit(store, items)
+
+    @staticmethod
+    def _commit(store, items):
+        try:
+            store.begin_batch()
+        except BaseException as error:
+            for _, future in items:
+                future.set_exception(error)
+            return
+
+        done = []
+        for op, future in items:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                done.append((future, op(), None))
+            except Exception as error:
+                done.append((future, None, error))
+
+        try:
+            store.commit_batch()
+        except BaseException as error:
+            store.abort_batch()
+            for future, _, _ in done:
+                future.set_exception(error)
+            return
+
+        for future, result, error in done:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+# Shared by all stores of the process
+default_writer = WriteQueue()
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
-import { jobService } from '../services/api';
+import { changeService, jobService } from '../services/api';
 
 function ProviderDashboard() {
   const { user } = useAuth();
@@ -17,6 +17,24 @@ function ProviderDashboard() {
     loadProviderJobs();
   }, [user]);
 
+  useEffect(() => {
+    // Applications and edits to this provider's jobs arrive on the change stream
+    const patchJob = (jobId, changes) => setJobs((current) => current.map((job) =>
+      (job.id === jobId ? { ...job, ...changes } : job)));
+    const source = changeService.subscribe({
+      create: ({ job }) => {
+        if (job.provider_id === user.id) {
+          setJobs((current) => (current.some((existing) => existing.id === job.id) ? current : [...current, job]));
+        }
+      },
+      apply: ({ job_id, student_id }) => patchJob(job_id, { status: 'applied', assigned_student_id: student_id }),
+      update: ({ job_id, changes }) => patchJob(job_id, changes),
+      delete: ({ job_id }) => setJobs((current) => current.filter((job) => job.id !== job_id)),
+      reset: () => loadProviderJobs(),
+    });
+    return () => source.close();
+  }, [user]);
+
   const loadProviderJobs = async () => {
     try {
       const response = await jobService.getProviderJobs(user.id);
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
-import { jobService, studentService } from '../services/api';
+import { changeService, jobService, studentService } from '../services/api';
 
 function StudentDashboard() {
   const { user } = useAuth();
@@ -17,6 +17,22 @@ function StudentDashboard() {
     loadStudentProfile();
   }, [user]);
 
+  useEffect(() => {
+    // Keep the job list current from the change stream instead of refetching it
+    const withoutJob = (jobId) => setJobs((current) => current.filter((job) => job.id !== jobId));
+    const source = changeService.subscribe({
+      create: ({ job }) => setJobs((current) =>
+        (current.some((existing) => existing.id === job.id) ? current : [...current, job])),
+      apply: ({ job_id }) => withoutJob(job_id),
+      update: ({ job_id, changes }) => setJobs((current) => current
+        .map((job) => (job.id === job_id ? { ...job, ...changes } : job))
+        .filter((job) => job.status === 'available')),
+      delete: ({ job_id }) => withoutJob(job_id),
+      reset: () => loadJobs(),
+    });
+    return () => source.close();
+  }, []);
+
   const loadJobs = async () => {
     try {
       const response = await jobService.getJobs();
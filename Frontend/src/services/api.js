@@ -43,4 +43,14 @@ export const assignmentService = {
     api.post('/assignments/optimal', { student_ids: studentIds, job_ids: jobIds }),
 };
 
+export const changeService = {
+  // Server-sent job deltas; EventSource reconnects and resumes from the last event on its own
+  subscribe: (handlers) => {
+    const source = new EventSource(`${API_BASE_URL}/jobs/changes`);
+    Object.entries(handlers).forEach(([type, handler]) =>
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data))));
+    return source;
+  },
+};
+
 export default api;
\ No newline at end of file
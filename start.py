@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 """
 Startup script for Railway deployment
+
+    python start.py                  # Flask development server
+    python start.py --production     # pre-forking server (also WORKMATE_SERVER=production)
+
+Production mode loads the app and its data once, then forks --workers
+processes (WORKMATE_WORKERS, default: one per CPU) that each serve requests
+from a pool of --threads threads (WORKMATE_THREADS, default 8). Send SIGHUP
+to the master to replace the workers gracefully, SIGTERM to stop.
 """
+import argparse
 import os
 import sys
 
@@ -9,8 +18,33 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Backend'))
 
 # Import and run the Flask app
-from Backend.app import app
+from Backend.app import app, stores
+
+
+def refresh_stores():
+    # Workers forked on reload start from the current data, not the data at startup
+    for store in stores.values():
+        store.refresh()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('WORKMATE_SERVER', '').lower() == 'production')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKMATE_WORKERS', 0)) or None)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WORKMATE_THREADS', 8)))
+    args = parser.parse_args(argv)
+
+    if args.production and hasattr(os, 'fork'):
+        from Backend.server import PreforkServer
+        PreforkServer(app, args.host, args.port, workers=args.workers, threads=args.threads,
+                      on_reload=refresh_stores).run()
+    else:
+        if args.production:
+            print('Production mode needs os.fork; falling back to the development server', file=sys.stderr)
+        app.run(host=args.host, port=args.port, debug=False)
+    return 0
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    sys.exit(main())